@@ -0,0 +1,122 @@
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+import numpy as np
+import graphrag.my_graphrag.db as db
+
+WORD_LIST = ['buddha', 'dharma', 'sangha', 'mind', 'emptiness', 'form', 'wisdom', 'practice', 'sutra', 'karma', 'path', 'nature']
+
+
+def gen_chunks(num_items, num_groups, dim, seed):
+    # synthetic chunk rows with random unit vectors, nothing is embedded
+    rng = np.random.default_rng(seed)
+    random.seed(seed)
+
+    documents = []
+    metadatas = []
+    for i in range(num_items):
+        text = ' '.join(random.choice(WORD_LIST) for _ in range(200))
+        group_id = str(i % num_groups + 1)
+        documents.append(text)
+        metadatas.append({
+            'paper_id': str(i // 10 + 1),
+            'group_id': group_id,
+            'denoising_chunk': text,
+            'sub_chunks': '["%s"]' % text[:100],
+        })
+
+    embeddings = rng.standard_normal((num_items, dim)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return documents, metadatas, list(embeddings)
+
+
+def gen_queries(num_queries, dim, seed):
+    rng = np.random.default_rng(seed + 1)
+    queries = rng.standard_normal((num_queries, dim)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return list(queries)
+
+
+def percentile_ms(times, q):
+    return np.percentile(np.array(times) * 1000, q)
+
+
+def run_backend(backend, db_path, documents, metadatas, embeddings, queries, top_k, batch_size):
+    result = {}
+    db.init_db(db_path, backend)
+
+    with db.open_db(db_path):
+        # ingest, through the same write path as indexing (ids, side index)
+        start = time.perf_counter()
+        for i in range(0, len(documents), batch_size):
+            db.save_new_items(db.COLLECTION_CHUNK, documents[i:i + batch_size], metadatas[i:i + batch_size], embeddings[i:i + batch_size])
+        result['ingest (rows/s)'] = len(documents) / (time.perf_counter() - start)
+
+        # scans
+        start = time.perf_counter()
+        count = sum(1 for _ in db.iter_all_chunks())
+        result['scan metadata (rows/s)'] = count / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        count = sum(1 for _ in db.iter_all_chunks(include=('documents', 'metadatas')))
+        result['scan documents (rows/s)'] = count / (time.perf_counter() - start)
+
+        # top-k
+        collection = db.get_collection(db.COLLECTION_CHUNK)
+        for name, where in [('top-k', None), ('top-k group filter', {'group_id': '1'})]:
+            times = []
+            for query in queries:
+                start = time.perf_counter()
+                collection.query(query_embeddings=[query], n_results=top_k, where=where)
+                times.append(time.perf_counter() - start)
+            result[f'{name} p50 (ms)'] = percentile_ms(times, 50)
+            result[f'{name} p95 (ms)'] = percentile_ms(times, 95)
+
+    db.invalidate_handles(db_path)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare ingest, scan and top-k latency of the storage backends")
+    parser.add_argument('--num_items', type=int, default=10000, help='Number of chunks. Default is 10000.')
+    parser.add_argument('--num_groups', type=int, default=10, help='Number of groups the chunks are spread over. Default is 10.')
+    parser.add_argument('--dim', type=int, default=384, help='Vector dimension. Default is 384 (all-MiniLM-L6-v2).')
+    parser.add_argument('--num_queries', type=int, default=100, help='Number of top-k queries. Default is 100.')
+    parser.add_argument('--top_k', type=int, default=20, help='Results per query. Default is 20.')
+    parser.add_argument('--batch_size', type=int, default=db.ADD_BATCH_SIZE, help=f'Rows per write. Default is {db.ADD_BATCH_SIZE}.')
+    parser.add_argument(
+        '--backends',
+        nargs='+',
+        default=[db.BACKEND_CHROMA, db.BACKEND_LANCEDB],
+        choices=[db.BACKEND_CHROMA, db.BACKEND_LANCEDB],
+        help='Backends to compare. Default is both.'
+    )
+    parser.add_argument('--seed', type=int, default=224)
+    args = parser.parse_args()
+
+    documents, metadatas, embeddings = gen_chunks(args.num_items, args.num_groups, args.dim, args.seed)
+    queries = gen_queries(args.num_queries, args.dim, args.seed)
+
+    result_dict = {}
+    tmp_dir = tempfile.mkdtemp(prefix='rg_rag_benchmark_')
+    try:
+        for backend in args.backends:
+            print(f'{backend} ...')
+            result_dict[backend] = run_backend(
+                backend, os.path.join(tmp_dir, backend), documents, metadatas, embeddings, queries, args.top_k, args.batch_size
+            )
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    print(f'{args.num_items} chunks, dim {args.dim}, {args.num_queries} queries, top {args.top_k}')
+    output_format = "{:<28}" + "|{:>15}" * len(args.backends)
+    print(output_format.format('', *args.backends))
+    for metric in result_dict[args.backends[0]].keys():
+        print(output_format.format(metric, *['%.1f' % result_dict[backend][metric] for backend in args.backends]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import argparse
+import os
+import json
+import graphrag.my_graphrag.db as db
+
+
+def format_size(size):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024 or unit == 'GB':
+            return f'{size:.1f} {unit}' if unit != 'B' else f'{size} B'
+        size /= 1024
+
+
+def print_table(catalog):
+    print(f'Database: {catalog["db_path"]} ({catalog["backend"]})')
+
+    output_format = "{:<20}|{:>12}"
+    print(output_format.format('Collection', 'Count'))
+    for collection_name, count in catalog['collections'].items():
+        print(output_format.format(collection_name, count))
+
+    if 'groups' in catalog:
+        print()
+        column_list = ['group_id', 'group_name'] + db.GROUP_COLLECTION_NAME_LIST
+        output_format = "{:^10}|{:^20}" + "|{:>18}" * len(db.GROUP_COLLECTION_NAME_LIST)
+        print(output_format.format(*column_list))
+        for group in catalog['groups']:
+            print(output_format.format(*[group[column] for column in column_list]))
+
+    print()
+    output_format = "{:<36}|{:>12}"
+    print(output_format.format('Disk', 'Size'))
+    for name, size in catalog['disk'].items():
+        print(output_format.format(name, format_size(size)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print row counts per collection and group and the disk usage of a DB")
+    parser.add_argument("db_path")
+    parser.add_argument(
+        '--format',
+        type=str,
+        default='table',
+        choices=['table', 'json'],
+        help='Output format. Default is "table".'
+    )
+    parser.add_argument(
+        '--groups',
+        type=lambda x: x.lower() == 'true',
+        default=True,
+        help='If True, also count the items of every group. Default is True.'
+    )
+    args = parser.parse_args()
+    db_path = args.db_path
+
+    if not os.path.isdir(db_path):
+        print(f'Database path "{db_path}" does not exist.')
+        return None
+
+    with db.open_db(db_path):
+        catalog = db.get_catalog(args.groups)
+
+    if args.format == 'json':
+        print(json.dumps(catalog, indent=2, ensure_ascii=False))
+    else:
+        print_table(catalog)
+
+    db.invalidate_handles()
+
+
+if __name__ == "__main__":
+    main()
@@ -10,7 +10,8 @@ def main():
     model.check_model_dir()
     model.start_sgl_server_deepseek()
     prompt = args.prompt
-    response = model.get_response_from_sgl(prompt)
+    # always ask the provider, a cached reply would not prove the connection works
+    response = model.get_response_from_sgl(prompt, use_cache=False)
     print(prompt)
     print(response)
     model.stop_sgl_server()
@@ -0,0 +1,158 @@
+import argparse
+import os
+import sqlite3
+import time
+import numpy as np
+import graphrag.my_graphrag.db as db
+import graphrag.my_graphrag.meta_db as meta_db
+import graphrag.my_graphrag.embedding_cache as embedding_cache
+from datetime import datetime
+
+# collections whose query latency is compared before and after
+QUERY_COLLECTION_NAME_LIST = [
+    db.COLLECTION_CHUNK,
+    db.COLLECTION_RELATIONSHIP,
+    db.COLLECTION_COMMUNITY_REPORT,
+    db.COLLECTION_SUMMARY,
+]
+
+
+def vacuum_sqlite_file(src_file, dst_file):
+    # VACUUM INTO writes a defragmented copy without the free pages of deleted rows
+    if not os.path.isfile(src_file):
+        return
+    conn = sqlite3.connect(src_file)
+    try:
+        conn.execute('VACUUM INTO ?', (dst_file,))
+    finally:
+        conn.close()
+
+
+def get_query_embeddings(collection_name, num_queries, seed):
+    # stored vectors of random rows, read from the source DB so both DBs get the same queries
+    ids = db.get_ids_where(collection_name, None)
+    if not ids:
+        return []
+    rng = np.random.default_rng(seed)
+    sample_ids = [ids[i] for i in rng.integers(0, len(ids), num_queries)]
+    sample_id_set = set(sample_ids)
+    embedding_dict = {}
+    for item_id, _, _, embedding in db.iter_collection(collection_name, include=('embeddings',)):
+        if item_id in sample_id_set:
+            embedding_dict[item_id] = embedding
+    return [embedding_dict[item_id] for item_id in sample_ids]
+
+
+def measure_latency(db_path, query_dict, top_k):
+    # {collection_name: (p50 ms, p95 ms)} of top-k queries
+    latency_dict = {}
+    with db.open_db(db_path):
+        for collection_name, query_embeddings in query_dict.items():
+            collection = db.get_collection(collection_name)
+            times = []
+            for query_embedding in query_embeddings:
+                start = time.perf_counter()
+                collection.query(query_embeddings=[query_embedding], n_results=top_k)
+                times.append(time.perf_counter() - start)
+            latency_dict[collection_name] = (np.percentile(np.array(times) * 1000, 50), np.percentile(np.array(times) * 1000, 95))
+    return latency_dict
+
+
+def verify(src_db_path, dst_db_path):
+    # same count and same ids in every collection
+    ok = True
+    for collection_name in db.COLLECTION_NAME_LIST:
+        with db.open_db(src_db_path):
+            src_ids = set(db.get_ids_where(collection_name, None))
+        with db.open_db(dst_db_path):
+            dst_ids = set(db.get_ids_where(collection_name, None))
+            dst_count = db.get_collection_counts()[collection_name]
+
+        if src_ids != dst_ids or dst_count != len(src_ids):
+            print(f'{collection_name}: {len(src_ids)} ids in the source, {len(dst_ids)} ids / {dst_count} rows in the copy, '
+                  f'{len(src_ids - dst_ids)} missing, {len(dst_ids - src_ids)} unexpected')
+            ok = False
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy a DB into a fresh directory without the dead rows of deleted groups, rebuilding the vector indexes")
+    parser.add_argument("src_db_path")
+    parser.add_argument("dst_db_path")
+    parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=db.ADD_BATCH_SIZE,
+        help=f'Rows per write. Default is {db.ADD_BATCH_SIZE}.'
+    )
+    parser.add_argument('--num_queries', type=int, default=50, help='Queries per collection for the latency numbers. Default is 50.')
+    parser.add_argument('--top_k', type=int, default=20, help='Results per query. Default is 20.')
+    parser.add_argument('--seed', type=int, default=224)
+    args = parser.parse_args()
+    src_db_path = args.src_db_path
+    dst_db_path = args.dst_db_path
+
+    if not os.path.isdir(src_db_path):
+        print(f'Database path "{src_db_path}" does not exist.')
+        return None
+
+    if os.path.isdir(dst_db_path) and len(os.listdir(dst_db_path)) > 0:
+        print(f'Database path "{dst_db_path}" is not empty.')
+        return None
+
+    backend = db.get_backend(src_db_path)
+    print(f'Compacting "{src_db_path}" ({backend}) into "{dst_db_path}" ...')
+    start = datetime.now()
+
+    with db.open_db(src_db_path):
+        # a staging log means an index run is writing to the DB
+        if os.path.isdir(db.get_staging_dir()) and os.listdir(db.get_staging_dir()):
+            print(f'"{db.get_staging_dir()}" is not empty, finish or discard the running index first.')
+            return None
+        query_dict = {}
+        for collection_name in QUERY_COLLECTION_NAME_LIST:
+            query_embeddings = get_query_embeddings(collection_name, args.num_queries, args.seed)
+            if query_embeddings:
+                query_dict[collection_name] = query_embeddings
+    src_latency_dict = measure_latency(src_db_path, query_dict, args.top_k)
+    src_size = db.get_disk_usage(src_db_path).get('total', 0)
+
+    db.init_db(dst_db_path, backend)
+
+    # id sequences, side index and embedding cache without free pages
+    vacuum_sqlite_file(meta_db.get_meta_db_file(src_db_path), meta_db.get_meta_db_file(dst_db_path))
+    vacuum_sqlite_file(embedding_cache.get_cache_file(src_db_path), embedding_cache.get_cache_file(dst_db_path))
+
+    # fresh collections, the vector indexes are built from the live rows only
+    for collection_name in db.COLLECTION_NAME_LIST:
+        count = db.copy_collection(src_db_path, dst_db_path, collection_name, args.batch_size)
+        print(f'{collection_name}: {count} rows copied')
+    if backend == db.BACKEND_LANCEDB:
+        with db.open_db(dst_db_path):
+            for collection_name in db.COLLECTION_NAME_LIST:
+                db.compact_collection(collection_name)
+
+    if not verify(src_db_path, dst_db_path):
+        print(f'Verification failed, "{dst_db_path}" is not a complete copy.')
+        db.invalidate_handles()
+        return None
+
+    dst_latency_dict = measure_latency(dst_db_path, query_dict, args.top_k)
+    dst_size = db.get_disk_usage(dst_db_path).get('total', 0)
+    db.invalidate_handles()
+
+    print(f'Verified counts and ids of all collections, compacted in {datetime.now() - start}')
+    output_format = "{:<32}|{:>15}|{:>15}"
+    print(output_format.format('', 'before', 'after'))
+    print(output_format.format('size (MB)', '%.1f' % (src_size / 1024 ** 2), '%.1f' % (dst_size / 1024 ** 2)))
+    for collection_name in query_dict.keys():
+        for i, name in enumerate(['p50', 'p95']):
+            print(output_format.format(
+                f'{collection_name} top-{args.top_k} {name} (ms)',
+                '%.2f' % src_latency_dict[collection_name][i],
+                '%.2f' % dst_latency_dict[collection_name][i]
+            ))
+
+
+if __name__ == "__main__":
+    main()
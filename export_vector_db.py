@@ -1,12 +1,50 @@
 import argparse
 import os
 import graphrag.my_graphrag.db as db
+import graphrag.my_graphrag.archive as archive
+import graphrag.my_graphrag.embedding as embedding
 from datetime import datetime
 
+COLLECTION_NAME_LIST = [
+    db.COLLECTION_GROUP,
+    db.COLLECTION_PAPER,
+    db.COLLECTION_CHUNK,
+    db.COLLECTION_RELATIONSHIP,
+    db.COLLECTION_COMMUNITY_REPORT,
+    db.COLLECTION_SUMMARY,
+]
+
+
+def export_archive(output_path):
+    # all rows with their embeddings in one streamed file, see archive.py and import_vector_db.py
+    count_dict = {}
+    with archive.open_archive(output_path, 'w') as f:
+        archive.write_header(f, embedding_model=embedding.EMBEDDING_MODEL_NAME, backend=db.get_backend())
+        for collection_name in COLLECTION_NAME_LIST:
+            count = 0
+            for item_id, document, metadata, vector in db.iter_collection(collection_name, include=('documents', 'metadatas', 'embeddings')):
+                archive.write_row(f, collection_name, item_id, document, metadata, vector)
+                count += 1
+            count_dict[collection_name] = count
+    return count_dict
+
 
 def main():
     parser = argparse.ArgumentParser(description="Export DB path")
     parser.add_argument("db_path")
+    parser.add_argument(
+        '--format',
+        type=str,
+        default='txt',
+        choices=['txt', 'archive'],
+        help='"txt": one text file per item. "archive": one JSONL file with all rows and embeddings, to restore with import_vector_db.py. Default is "txt".'
+    )
+    parser.add_argument(
+        '--output',
+        type=str,
+        default='',
+        help='Archive file, ending with .jsonl.gz, .jsonl.zst (needs zstandard) or .jsonl. Default is export_<time>.jsonl.gz in the DB path.'
+    )
     args = parser.parse_args()
     db_path = args.db_path
 
@@ -16,64 +54,65 @@ def main():
 
     db.update_db_path(db_path)
 
+    if args.format == 'archive':
+        output_path = args.output or os.path.join(db_path, f'export_{datetime.now().strftime("%Y%m%d-%H%M%S")}.jsonl.gz')
+        start = datetime.now()
+        count_dict = export_archive(output_path)
+        db.reset_db_path()
+        print(f'Exported {count_dict} to "{output_path}" in {datetime.now() - start}')
+        return None
+
     output_dir = os.path.join(db_path, f'export_{datetime.now().strftime("%Y%m%d-%H%M%S")}')
     os.mkdir(output_dir)
 
     # group
     group_dir = os.path.join(output_dir, 'group')
     os.mkdir(group_dir)
-    for group in db.get_all_groups():
+    for group in db.iter_all_groups():
         with open(os.path.join(group_dir, f'{group["group_id"]}.txt'), 'w') as f:
             f.write(group["group_name"])
-            f.flush()
 
     # paper
     paper_dir = os.path.join(output_dir, 'document')
     os.mkdir(paper_dir)
-    for paper in db.get_all_papers():
+    for paper in db.iter_all_papers(include=('documents', 'metadatas')):
         with open(os.path.join(paper_dir, f'{paper["paper_id"]}.txt'), 'w') as f:
             f.write(paper["paper_content"])
-            f.flush()
 
     # chunk
     chunk_dir = os.path.join(output_dir, 'chunk')
     os.mkdir(chunk_dir)
-    for chunk in db.get_all_chunks():
+    for chunk in db.iter_all_chunks():
         with open(os.path.join(chunk_dir, f'{chunk["chunk_id"]}.txt'), 'w') as f:
             f.write(chunk["denoising_chunk"])
-            f.flush()
 
     # relationship
     relationship_dir = os.path.join(output_dir, 'relationship')
     os.mkdir(relationship_dir)
-    for relationship in db.get_all_relationships():
+    for relationship in db.iter_all_relationships():
         with open(os.path.join(relationship_dir, f'{relationship["relationship_id"]}.txt'), 'w') as f:
             f.write(relationship["relationship_description"])
-            f.flush()
 
     # community report
     community_report_dir = os.path.join(output_dir, 'graphrag_community_report')
     os.mkdir(community_report_dir)
-    for community_report in db.get_all_community_reports():
+    for community_report in db.iter_all_community_reports(include=('documents', 'metadatas')):
         with open(os.path.join(community_report_dir, f'{community_report["report_id"]}.txt'), 'w') as f:
             f.write(community_report["report_content"])
-            f.flush()
 
     # summary
     summary_dir = os.path.join(output_dir, 'raptor_summary')
     os.mkdir(summary_dir)
-    for summary in db.get_all_summary_chunks():
-        with open(os.path.join(summary_dir, f'{summary["summary_id"]}.txt'), 'w') as f:
-            f.write(summary["summary_content"])
-            f.flush()
-
-        chunk_id_list = summary["chunk_id_list"]
-        chunk_id_list.sort(key=lambda x: int(x), reverse=False)
-        with open(os.path.join(summary_dir, 'hierarchy.txt'), 'a') as f:
-            f.write(f'{summary["summary_id"]}: {"chunk" if summary["from_base_chunk"] else "summary"} {", ".join(map(str, chunk_id_list))}\n')
-            f.flush()
-
-    db.rm_db_tmp_file()
+    with open(os.path.join(summary_dir, 'hierarchy.txt'), 'a') as hierarchy_f:
+        for summary in db.iter_all_summary_chunks(include=('documents', 'metadatas')):
+            with open(os.path.join(summary_dir, f'{summary["summary_id"]}.txt'), 'w') as f:
+                f.write(summary["summary_content"])
+
+            chunk_id_list = summary["chunk_id_list"]
+            chunk_id_list.sort(key=lambda x: int(x), reverse=False)
+            hierarchy_f.write(f'{summary["summary_id"]}: {"chunk" if summary["from_base_chunk"] else "summary"} {", ".join(map(str, chunk_id_list))}\n')
+
+    db.reset_db_path()
     print(f'Exported to "{output_dir}"')
 
 
@@ -15,6 +15,7 @@ from graphrag.llm import CompletionLLM
 from .prompts import COMMUNITY_REPORT_PROMPT
 from graphrag.my_graphrag.db import save_new_community_report
 import graphrag.my_graphrag.cloud as model
+import graphrag.my_graphrag.llm_telemetry as llm_telemetry
 
 import re
 import csv
@@ -92,7 +93,7 @@ class CommunityReportsExtractor:
             desc_input = '\n\n'.join(desc_list)
 
             community_prompt = COMMUNITY_REPORT_PROMPT.format(input_text=desc_input)
-            output = model.get_response_from_sgl(community_prompt)
+            output = await model.aget_response(community_prompt, stage=llm_telemetry.STAGE_COMMUNITY_REPORT)
 
             await self._export_prompt(
                 prompt_input=community_prompt,
@@ -100,10 +101,7 @@ class CommunityReportsExtractor:
                 prompt_type_name='community_report',
             )
 
-            save_new_community_report(
-                converted_input,
-                output,
-            )
+            save_new_community_report(converted_input, output)
 
         except Exception as e:
             log.exception("error generating community report")
@@ -27,8 +27,9 @@ from .prompts import GRAPH_EXTRACTION_PROMPT, GLEANING_PROMPT, ENTITIES_IDENTIFI
 
 import xml.etree.ElementTree as ET
 
-from graphrag.my_graphrag.db import save_new_relationship
+from graphrag.my_graphrag.db import save_new_relationships
 import graphrag.my_graphrag.cloud as model
+import graphrag.my_graphrag.llm_telemetry as llm_telemetry
 
 import asyncio
 
@@ -182,7 +183,7 @@ class GraphExtractor:
         idx = 1
 
         extraction_prompt = self._extraction_prompt.format(input_text=text)
-        results = model.get_response_from_sgl(extraction_prompt)
+        results = await model.aget_response(extraction_prompt, stage=llm_telemetry.STAGE_EXTRACT)
 
         await self._export_prompt(
             prompt_input=extraction_prompt,
@@ -195,7 +196,7 @@ class GraphExtractor:
         for i in range(self._max_gleanings):
             tmp_conv_output = _clean_entities_text(results) + '\n' + _clean_relationships_text(results)
             gleaning_prompt = GLEANING_PROMPT.format(input_text=text, previous_output=tmp_conv_output)
-            output = model.get_response_from_sgl(gleaning_prompt)
+            output = await model.aget_response(gleaning_prompt, stage=llm_telemetry.STAGE_GLEAN)
 
             await self._export_prompt(
                 prompt_input=gleaning_prompt,
@@ -214,7 +215,7 @@ class GraphExtractor:
                 break
 
         entities_identification_prompt = ENTITIES_IDENTIFICATION_PROMPT.format(input_text=text, entities=_clean_entities_text(results))
-        output = model.get_response_from_sgl(entities_identification_prompt)
+        output = await model.aget_response(entities_identification_prompt, stage=llm_telemetry.STAGE_ENTITY_IDENTIFY)
         filtered_entities_results = results
         if output:
             _clean_output = _clean_entities_text(output)
@@ -407,8 +408,10 @@ class GraphExtractor:
 
         for (source, target, desc, strength) in relationship_list:
             original_format.append(f'("relationship"{tuple_delimiter}{source}{tuple_delimiter}{target}{tuple_delimiter}{desc}{tuple_delimiter}{strength})')
-            # 240904 save relationship to chromadb
-            save_new_relationship(input_chunk, source, target, desc, strength)
+
+        # 240904 save relationship to chromadb
+        # all relationships of the chunk are written in one batch
+        save_new_relationships(input_chunk, relationship_list)
 
         original_str = ('\n' + record_delimiter + '\n').join(original_format) + '\n' + completion_delimiter
         return original_str
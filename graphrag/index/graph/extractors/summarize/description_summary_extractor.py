@@ -19,6 +19,7 @@ from .prompts import SUMMARIZE_PROMPT
 import asyncio
 
 import graphrag.my_graphrag.cloud as model
+import graphrag.my_graphrag.llm_telemetry as llm_telemetry
 
 # Max token size for input prompts
 DEFAULT_MAX_INPUT_TOKENS = 4_000
@@ -151,7 +152,7 @@ class SummarizeExtractor:
     ):
         """Summarize descriptions using the LLM."""
         summarization_prompt = self._summarization_prompt.format(entity_name=json.dumps(items), description_list=json.dumps(sorted(descriptions)))
-        output = model.get_response_from_sgl(summarization_prompt)
+        output = await model.aget_response(summarization_prompt, stage=llm_telemetry.STAGE_SUMMARIZE)
 
         await self._export_prompt(
             prompt_input=summarization_prompt,
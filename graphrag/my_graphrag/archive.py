@@ -0,0 +1,74 @@
+import gzip
+import json
+import base64
+import numpy as np
+
+# single-file DB archive of export_vector_db.py / import_vector_db.py: one JSON line per row,
+# with its stored embedding, so a DB is restored without re-embedding.
+# the first line is a header, e.g. {"format": "rg-rag-archive", "version": 1, "embedding_model": ...},
+# then {"collection": ..., "id": ..., "document": ..., "metadata": {...}, "embedding": base64 float32}
+# *.jsonl.gz is gzip, *.jsonl.zst is zstd (needs the zstandard package), anything else is plain text
+ARCHIVE_FORMAT = 'rg-rag-archive'
+ARCHIVE_VERSION = 1
+EMBEDDING_DTYPE = np.dtype('<f4')
+
+
+def open_archive(path, mode):
+    # mode: 'r' or 'w', text streams either way
+    if path.endswith('.zst'):
+        import io
+        import zstandard
+
+        if mode == 'w':
+            stream = zstandard.ZstdCompressor(level=3).stream_writer(open(path, 'wb'))
+        else:
+            stream = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'))
+        return io.TextIOWrapper(stream, encoding='utf-8')
+
+    if path.endswith('.gz'):
+        # level 6 is much faster than the default 9 for about the same size
+        return gzip.open(path, mode + 't', encoding='utf-8', compresslevel=6)
+
+    return open(path, mode, encoding='utf-8')
+
+
+def encode_embedding(embedding):
+    return base64.b64encode(np.asarray(embedding, dtype=EMBEDDING_DTYPE).tobytes()).decode('ascii')
+
+
+def decode_embedding(text):
+    return np.frombuffer(base64.b64decode(text), dtype=EMBEDDING_DTYPE)
+
+
+def write_header(f, **kwargs):
+    header = {'format': ARCHIVE_FORMAT, 'version': ARCHIVE_VERSION}
+    header.update(kwargs)
+    f.write(json.dumps(header) + '\n')
+
+
+def write_row(f, collection_name, item_id, document, metadata, embedding):
+    f.write(json.dumps({
+        'collection': collection_name,
+        'id': item_id,
+        'document': document,
+        'metadata': metadata,
+        'embedding': encode_embedding(embedding),
+    }, ensure_ascii=False) + '\n')
+
+
+def read_archive(f):
+    # (header, row iterator), rows are (collection_name, id, document, metadata, embedding)
+    header = json.loads(f.readline() or '{}')
+    if header.get('format') != ARCHIVE_FORMAT:
+        raise ValueError('Not an rg-rag archive.')
+    if header.get('version', 0) > ARCHIVE_VERSION:
+        raise ValueError(f'Archive version {header["version"]} is newer than {ARCHIVE_VERSION}.')
+
+    def iter_rows():
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            yield row['collection'], row['id'], row['document'], row['metadata'], decode_embedding(row['embedding'])
+
+    return header, iter_rows()
@@ -1,11 +1,54 @@
 import os
-from openai import OpenAI
+import time
+import yaml
+import asyncio
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from openai import AsyncOpenAI
 from pathlib import Path
+from tenacity import (
+    AsyncRetrying,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_exponential_jitter,
+)
+
+import graphrag.my_graphrag.llm_cache as llm_cache
+import graphrag.my_graphrag.llm_telemetry as llm_telemetry
+from aiolimiter import AsyncLimiter
+from graphrag.llm.limiting import TpmRpmLLMLimiter
+from graphrag.llm.openai import OpenAIConfiguration
+from graphrag.llm.openai.utils import RETRYABLE_ERRORS, get_sleep_time_from_error, get_token_counter
 
 PRJ_DIR = os.path.join(Path(os.path.dirname(os.path.realpath(__file__))).parent.parent.absolute())
 MODEL_TMP_FILE_PATH = os.path.join(PRJ_DIR, './my_graphrag/model_tmp_file.txt')
+# rate limits, retries and timeout are read from the llm section of this settings.yaml
+LLM_SETTINGS_FILE = os.environ.get('RG_RAG_LLM_SETTINGS', os.path.join(PRJ_DIR, './my_graphrag/config_example/settings.yaml'))
+# used when settings.yaml does not set them
+REQUEST_TIMEOUT = 300
+MAX_RETRIES = 10
+MAX_RETRY_WAIT = 10.0
+# same defaults as graphrag's create_tpm_rpm_limiters()
+TOKENS_PER_MINUTE = 50_000
+REQUESTS_PER_MINUTE = 10_000
+# max LLM requests in flight in the whole process
+LLM_CONCURRENCY = int(os.environ.get('RG_RAG_LLM_CONCURRENCY', 16))
+THINK_START = '<think>'
+THINK_END = '</think>'
+# overrides reasoning_model of the llm section of settings.yaml, 1 or 0
+LLM_REASONING = os.environ.get('RG_RAG_LLM_REASONING', '')
 
 client = None
+_LLM_CONFIG = None
+# every LLM request of the process runs in one event loop thread of its own (see request()), whether it comes
+# from an extractor in any of graphrag's loops or threads or from a blocking caller. they share the AsyncOpenAI
+# client, the TPM/RPM limiter and the LLM_CONCURRENCY slots, which are all bound to that loop
+_LLM_LOOP = None
+_LLM_SLOTS = None
+_LIMITER = None
+_TOKEN_LIMITER = None
+_LLM_LOOP_LOCK = threading.Lock()
 
 def check_model_dir():
     api_token = os.environ.get("DEEPSEEK_API_TOKEN")
@@ -30,9 +73,11 @@ def start_sgl_server():
     print(f'start_sgl_server({os.environ.get("DEEPSEEK_API_MODEL")})')
 
     global client
-    client = OpenAI(
+    client = AsyncOpenAI(
         base_url=os.environ.get("DEEPSEEK_API_URL"),
         api_key=os.environ.get("DEEPSEEK_API_TOKEN"),
+        # retries are done in request() with the settings.yaml policy
+        max_retries=0,
     )
 
 
@@ -48,25 +93,341 @@ def stop_sgl_server():
     print(f'stop_sgl_server()')
 
 
-def get_response_from_sgl(prompt, remove_think=True):
+def get_messages(prompt):
+    return [{
+        "role": "user",
+        "content": prompt,
+    }]
+
+
+def clean_response(output, remove_think=True):
+    output = output or ''
+    if remove_think:
+        output = output.split('</think>')[-1].strip()
+    return output
+
+
+def get_llm_config():
+    # llm section of settings.yaml, e.g.
+    # tokens_per_minute / requests_per_minute: token bucket limits, 0 for no limit
+    # max_retries, max_retry_wait: retries (0 for none) with exponential backoff and jitter on 429, 5xx, timeouts and dropped connections
+    # sleep_on_rate_limit_recommendation: wait at least as long as the Retry-After header asks
+    # request_timeout: seconds per attempt
+    global _LLM_CONFIG
+    if _LLM_CONFIG is None:
+        settings = {}
+        try:
+            with open(LLM_SETTINGS_FILE, 'r') as f:
+                settings = yaml.safe_load(f) or {}
+        except Exception as e:
+            print(f'Failed to read LLM settings from {LLM_SETTINGS_FILE}: {e}')
+        _LLM_CONFIG = OpenAIConfiguration({
+            **(settings.get('llm') or {}),
+            'encoding_model': settings.get('encoding_model'),
+        })
+    return _LLM_CONFIG
+
+
+def get_sampling_params(sampling_params=None):
+    # temperature, top_p and max_tokens of a request: the llm section of settings.yaml, overridden by the caller.
+    # part of the response cache key, unset params are the API defaults
+    config = get_llm_config()
+    params = {
+        'temperature': config.temperature,
+        'top_p': config.top_p,
+        'max_tokens': config.max_tokens,
+    }
+    params.update(sampling_params or {})
+    return {key: value for key, value in params.items() if value is not None}
+
+
+def get_tokens_per_minute():
+    tpm = get_llm_config().tokens_per_minute
+    return TOKENS_PER_MINUTE if tpm is None else tpm
+
+
+def get_requests_per_minute():
+    rpm = get_llm_config().requests_per_minute
+    return REQUESTS_PER_MINUTE if rpm is None else rpm
+
+
+def get_llm_loop():
+    global _LLM_LOOP, _LLM_SLOTS, _LIMITER, _TOKEN_LIMITER
+    with _LLM_LOOP_LOCK:
+        if _LLM_LOOP is None:
+            tpm_limiter = AsyncLimiter(get_tokens_per_minute()) if get_tokens_per_minute() else None
+            rpm_limiter = AsyncLimiter(get_requests_per_minute()) if get_requests_per_minute() else None
+            _LIMITER = TpmRpmLLMLimiter(tpm_limiter, rpm_limiter)
+            # the limiter for the completion tokens, it shares the token bucket but takes no request
+            _TOKEN_LIMITER = TpmRpmLLMLimiter(tpm_limiter, None)
+            _LLM_SLOTS = asyncio.Semaphore(LLM_CONCURRENCY)
+            _LLM_LOOP = asyncio.new_event_loop()
+            threading.Thread(target=_LLM_LOOP.run_forever, name='llm', daemon=True).start()
+        return _LLM_LOOP
+
+
+def run_in_llm_loop(coro):
+    # concurrent.futures.Future of coro, run in the LLM loop
+    return asyncio.run_coroutine_threadsafe(coro, get_llm_loop())
+
+
+def count_tokens(text):
+    # tokens for the TPM limiter, 0 if it is disabled
+    if not get_tokens_per_minute() or not text:
+        return 0
+    # aiolimiter cannot acquire more than its max rate at once
+    return min(get_token_counter(get_llm_config())(text), get_tokens_per_minute())
+
+
+async def acquire_rate(num_tokens, output=False):
+    # in the LLM loop. a request takes its input tokens and one request, its response only the output tokens
+    if output and num_tokens == 0:
+        return
+    if get_tokens_per_minute() or get_requests_per_minute():
+        await (_TOKEN_LIMITER if output else _LIMITER).acquire(num_tokens)
+
+
+def get_output_tokens(usage, output):
+    if not get_tokens_per_minute():
+        return 0
+    if usage is not None and usage.completion_tokens:
+        return min(usage.completion_tokens, get_tokens_per_minute())
+    return count_tokens(output)
+
+
+def get_usage(usage):
+    # (prompt tokens, completion tokens) of the response, None if the server does not send them
+    if usage is None:
+        return None, None
+    return usage.prompt_tokens, usage.completion_tokens
+
+
+def get_retry_after(e):
+    # seconds the provider asks to wait: Retry-After(-ms) header of a 429 / 503, or the azure error message
+    headers = getattr(getattr(e, 'response', None), 'headers', None) or {}
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        retry_after = headers.get('retry-after')
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                # HTTP date
+                return max((parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds(), 0)
+    except:
+        pass
+    return get_sleep_time_from_error(e)
+
+
+def get_retry_kwargs():
+    config = get_llm_config()
+    # max_retries counts the retries after the first attempt, like graphrag's setting of the same name
+    max_retries = MAX_RETRIES if config.max_retries is None else config.max_retries
+    backoff = wait_exponential_jitter(max=MAX_RETRY_WAIT if config.max_retry_wait is None else config.max_retry_wait)
+
+    def get_wait(retry_state):
+        wait = backoff(retry_state)
+        if config.sleep_on_rate_limit_recommendation is not False:
+            wait = max(wait, get_retry_after(retry_state.outcome.exception()))
+        return wait
+
+    def print_retry(retry_state):
+        e = retry_state.outcome.exception()
+        print(f'LLM request failed ({e.__class__.__name__}: {e}), retry {retry_state.attempt_number}/{max_retries}, '
+              f'retrying in {retry_state.next_action.sleep:.1f}s')
+
+    return {
+        'stop': stop_after_attempt(max_retries + 1),
+        'wait': get_wait,
+        'retry': retry_if_exception_type(tuple(RETRYABLE_ERRORS)),
+        'before_sleep': print_retry,
+        'reraise': True,
+    }
+
+
+def get_request_timeout():
+    return get_llm_config().request_timeout or REQUEST_TIMEOUT
+
+
+async def request(prompt, remove_think=True, use_cache=True, stage='', sampling_params=None, on_text=None):
+    # the one request path of aget_response(), get_response_from_sgl() and stream_response(), run in the LLM loop:
+    # response cache, TPM/RPM limiter, concurrency slot, retries and telemetry.
+    # on_text: stream the answer to on_text(text), see stream_response(). returns (answer, stats)
+    model_name = os.environ.get("DEEPSEEK_API_MODEL")
+    params = get_sampling_params(sampling_params)
+    cache_key = llm_cache.get_key(model_name, prompt, params)
+    output = llm_cache.get(cache_key) if use_cache else None
+    if output is not None:
+        llm_telemetry.record(stage, 0, cached=True)
+        answer = clean_response(output, remove_think)
+        if on_text is not None:
+            on_text(answer)
+        return answer, {}
+
     if client is None:
         start_sgl_server()
 
-    output = ''
-    completion = client.chat.completions.create(
-        model=os.environ.get("DEEPSEEK_API_MODEL"),
-        messages=[{
-            "role": "user",
-            "content": prompt,
-        }],
-        timeout=300,
-    )
-    output = completion.choices[0].message.content
+    start = time.perf_counter()
+    attempts = 0
+    input_tokens = count_tokens(prompt)
+    stream_kwargs = {'stream': True, 'stream_options': {'include_usage': True}} if on_text is not None else {}
+    try:
+        # only opening a stream is retried, a retry after the first text would pass the answer on twice
+        async for attempt in AsyncRetrying(**get_retry_kwargs()):
+            with attempt:
+                attempts += 1
+                await acquire_rate(input_tokens)
+                await _LLM_SLOTS.acquire()
+                try:
+                    response = await client.chat.completions.create(
+                        model=model_name,
+                        messages=get_messages(prompt),
+                        timeout=get_request_timeout(),
+                        **params,
+                        **stream_kwargs,
+                    )
+                except:
+                    _LLM_SLOTS.release()
+                    raise
+
+        try:
+            if on_text is None:
+                output, usage, stats = response.choices[0].message.content, response.usage, {}
+            else:
+                output, usage, stats = await read_stream(response, on_text, remove_think, start)
+        finally:
+            _LLM_SLOTS.release()
+    except Exception as e:
+        llm_telemetry.record(stage, time.perf_counter() - start, retries=attempts - 1, error=e)
+        raise
+    llm_telemetry.record(stage, time.perf_counter() - start, *get_usage(usage), retries=attempts - 1)
+
+    await acquire_rate(get_output_tokens(usage, output), output=True)
+    if use_cache:
+        llm_cache.put(cache_key, model_name, output)
+    return clean_response(output, remove_think), stats
+
+
+async def aget_response(prompt, remove_think=True, use_cache=True, stage='', sampling_params=None):
+    # non-blocking version of get_response_from_sgl() for the async graphrag extractors, from any event loop
+    answer, _ = await asyncio.wrap_future(run_in_llm_loop(request(prompt, remove_think, use_cache, stage, sampling_params)))
+    return answer
 
+
+def get_response_from_sgl(prompt, remove_think=True, use_cache=True, stage='', sampling_params=None):
+    # blocking call for the sync callers (denoising, raptor, query), from any thread.
+    # use_cache: look the prompt up in the response cache first, see llm_cache.py
+    # stage: call site for the telemetry, one of the llm_telemetry.STAGE_* names
+    # sampling_params: e.g. {'temperature': 0}, over the settings.yaml values, see get_sampling_params()
+    answer, _ = run_in_llm_loop(request(prompt, remove_think, use_cache, stage, sampling_params)).result()
+    return answer
+
+
+def is_reasoning_model():
+    # the model starts its output inside a think block without writing <think>, as DeepSeek-R1 models do
+    # when the chat template opens it. stream_response() then holds the text back until </think>
+    if LLM_REASONING:
+        return LLM_REASONING != '0'
+    return bool(get_llm_config().lookup('reasoning_model', False))
+
+
+async def iter_stream_content(stream, pieces, stream_state, start):
+    # content pieces of a chat completion stream, also collected in pieces.
+    # reasoning_content of reasoning APIs is skipped, it is never part of the answer
+    async for chunk in stream:
+        if getattr(chunk, 'usage', None) is not None:
+            stream_state['usage'] = chunk.usage
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        content = delta.content
+        if not content and not getattr(delta, 'reasoning_content', None):
+            continue
+        if stream_state['time_to_first_token'] is None:
+            stream_state['time_to_first_token'] = time.perf_counter() - start
+        stream_state['chunks'] += 1
+        if content:
+            pieces.append(content)
+            yield content
+
+
+async def iter_answer(pieces, in_think=False):
+    # pieces of the answer of a stream, without the think block. the same text as clean_response(),
+    # unless the answer writes </think> again. in_think: the output starts inside the think block
+    head = ''
+    tail = ''
+    think_pieces = []
+    async for piece in pieces:
+        think_pieces.append(piece)
+        if not in_think:
+            head += piece
+            if THINK_START.startswith(head.lstrip()):
+                # could still become <think>
+                continue
+            if not head.lstrip().startswith(THINK_START):
+                buffer = head
+                break
+            in_think = True
+            piece = head
+        # only the new piece and the last len(THINK_END) - 1 chars before it can hold a new </think>
+        text = tail + piece
+        if THINK_END in text:
+            buffer = text.split(THINK_END)[-1]
+            break
+        tail = text[-(len(THINK_END) - 1):]
+    else:
+        # no </think>, clean_response() keeps the whole output too
+        output = ''.join(think_pieces).strip()
+        if output:
+            yield output
+        return
+
+    # leading whitespace of the answer is dropped, it can span several pieces
+    buffer = buffer.lstrip()
+    if buffer:
+        yield buffer
+    async for piece in pieces:
+        if not buffer:
+            piece = piece.lstrip()
+            buffer = piece
+        if piece:
+            yield piece
+
+
+async def read_stream(stream, on_text, remove_think, start):
+    # (output, usage, stats) of a chat completion stream, the answer is passed to on_text(text) while it is generated
+    pieces = []
+    stream_state = {'usage': None, 'chunks': 0, 'time_to_first_token': None}
+    time_to_first_answer_token = None
+    answer_pieces = iter_stream_content(stream, pieces, stream_state, start)
     if remove_think:
-        output = output.split('</think>')[-1].strip()
+        answer_pieces = iter_answer(answer_pieces, is_reasoning_model())
+    async for text in answer_pieces:
+        if time_to_first_answer_token is None:
+            time_to_first_answer_token = time.perf_counter() - start
+        on_text(text)
+    latency = time.perf_counter() - start
 
-    return output
+    # without usage in the stream, a chunk is about one token
+    num_tokens = get_usage(stream_state['usage'])[1] or stream_state['chunks']
+    time_to_first_token = stream_state['time_to_first_token']
+    generation_time = latency - time_to_first_token if time_to_first_token is not None else 0
+    stats = {
+        'time_to_first_token': time_to_first_token,
+        'time_to_first_answer_token': time_to_first_answer_token,
+        'completion_tokens': num_tokens,
+        'tokens_per_second': num_tokens / generation_time if generation_time > 0 else 0,
+    }
+    return ''.join(pieces), stream_state['usage'], stats
+
+
+def stream_response(prompt, on_text, remove_think=True, use_cache=True, stage='', sampling_params=None):
+    # get_response_from_sgl() that passes the answer to on_text(text) while it is generated, on_text is called in the LLM loop thread.
+    # the think block of reasoning models is dropped on the fly, so the first text comes with the first answer token.
+    # returns (answer, stats), stats: time to the first token and the first answer token in seconds,
+    # completion tokens and tokens per second after the first token, {} for a cached answer
+    return run_in_llm_loop(request(prompt, remove_think, use_cache, stage, sampling_params, on_text)).result()
 
 
 def update_model_tmp_file(cur_model_path):
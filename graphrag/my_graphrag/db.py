@@ -1,62 +1,325 @@
 import os
 import re
 import json
+import html
 import traceback
 import chromadb
 import hashlib
+import contextvars
+import threading
+import numpy as np
+from collections import OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
 
+import graphrag.my_graphrag.meta_db as meta_db
+import graphrag.my_graphrag.archive as archive
+import graphrag.my_graphrag.embedding as embedding
+
 import nltk
 nltk.download('punkt')
 from nltk.tokenize import word_tokenize
 
 FILE_DIR = Path(os.path.dirname(os.path.realpath(__file__))).parent.parent.absolute()
 DATABASE_PATH = os.path.join(FILE_DIR, './my_graphrag/vector_database')
-DB_TMP_FILE_PATH = os.path.join(FILE_DIR, './my_graphrag/db_tmp_file.txt')
-GROUP_ID_TMP_FILE_PATH = os.path.join(FILE_DIR, './my_graphrag/group_id_tmp_file.txt')
+# the active DB and group are passed to the graphrag subprocess through these env variables, see get_context_env()
+DB_PATH_ENV = 'RG_RAG_DB_PATH'
+GROUP_ID_ENV = 'RG_RAG_GROUP_ID'
+STAGING_FILE_ENV = 'RG_RAG_STAGING_FILE'
 COLLECTION_GROUP = 'group'
 COLLECTION_PAPER = 'paper'
 COLLECTION_CHUNK = 'chunk'
 COLLECTION_RELATIONSHIP = 'relationship'
 COLLECTION_COMMUNITY_REPORT = 'community_report'
 COLLECTION_SUMMARY = 'summary'
+COLLECTION_NAME_LIST = [
+    COLLECTION_GROUP,
+    COLLECTION_PAPER,
+    COLLECTION_CHUNK,
+    COLLECTION_RELATIONSHIP,
+    COLLECTION_COMMUNITY_REPORT,
+    COLLECTION_SUMMARY,
+]
+# collections of get_ref_ids_for_group(), in its order
+GROUP_COLLECTION_NAME_LIST = COLLECTION_NAME_LIST[1:]
+UUID_PATTERN = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
+# stay below chroma's max batch size for a single add
+ADD_BATCH_SIZE = 1000
+# rows per page when streaming a collection, see iter_collection()
+SCAN_BATCH_SIZE = 500
+# ids per delete call and per where={'...': {'$in': ...}} filter
+DELETE_BATCH_SIZE = 500
+# temporary collection names of compact_collection()
+COMPACT_SUFFIX = '__compact'
+OLD_SUFFIX = '__old'
+# per-collection HNSW settings of new chroma collections, {collection_name: {space, M, construction_ef, search_ef}}.
+# collections that already exist keep the settings they were built with until rebuild_vector_index.py rebuilds them.
+# space must stay "l2" for DBs that are queried together with brute-force distances (e.g. staged relationships).
+# relationship is the largest collection and gets one query per description while the reports are built,
+# so it has a denser graph (M 32) and a wider search to keep recall up as it grows.
+# summary and community_report are small and queried at every user query, a small M keeps them cheap
+# and a wide search_ef over so few rows is close to an exact search for little cost.
+# chunk sits in between. measure a real DB with rebuild_vector_index.py --report_only True before changing them.
+# the LanceDB backend searches without an ANN index and ignores these settings
+HNSW_CONFIG_FILE = os.environ.get('RG_RAG_HNSW_CONFIG', os.path.join(os.path.dirname(os.path.realpath(__file__)), 'hnsw_config.json'))
+HNSW_PARAMS = ['space', 'M', 'construction_ef', 'search_ef']
+_HNSW_CONFIG = None
+
+# active DB path and group id, see get_db_path() and get_current_group_id().
+# open_db() / use_group() set them for the current thread or asyncio task,
+# update_db_path() / update_current_group_id() set the process default
+_DB_PATH_VAR = contextvars.ContextVar('rg_rag_db_path', default=None)
+_GROUP_ID_VAR = contextvars.ContextVar('rg_rag_group_id', default=None)
+_DB_PATH = None
+_GROUP_ID = None
+
+# group-scoped staging log, see begin_group_staging().
+# while a log is active, writes of these collections are appended to it and committed in one batch at the end
+STAGING_DIR_NAME = 'staging'
+STAGED_COLLECTIONS = [
+    'relationship',
+    'community_report',
+    'summary',
+]
+# active log of the current thread or asyncio task, subprocesses get it through RG_RAG_STAGING_FILE
+_STAGING_FILE_VAR = contextvars.ContextVar('rg_rag_staging_file', default=None)
+_STAGING_LOCK = threading.Lock()
+# rows read back from staging logs, {path: {'offset': file offset, 'rows': {collection_name: (ids, documents, metadatas, vectors)},
+# 'edges': {(source key, target key): [chunk_id]} and 'embeddings': [vector] of the staged relationships}}
+_STAGED_ROWS = {}
+
+# storage backend of new DBs, 'chroma' or 'lancedb'. existing DBs keep the backend they were created with, see get_backend()
+STORAGE_BACKEND_ENV = 'RG_RAG_STORAGE_BACKEND'
+BACKEND_CHROMA = 'chroma'
+BACKEND_LANCEDB = 'lancedb'
+CHROMA_DB_FILE_NAME = 'chroma.sqlite3'
+# see lance_db.LANCE_DIR_NAME, kept here so lancedb is only imported for lancedb DBs
+LANCE_DIR_NAME = 'lancedb'
+
+# process-level handle registry, see get_client() and get_collection()
+_CLIENTS = {}
+_COLLECTIONS = {}
+_HANDLE_LOCK = threading.RLock()
+
+# LRU cache of get_ref_ids_of_chunks(), keyed by (db path, db version, chunk id)
+REF_ID_CACHE_SIZE = 10000
+_REF_ID_CACHE = OrderedDict()
+_REF_ID_CACHE_LOCK = threading.Lock()
+
+# texts indexed by whitespace-normalised hash for exact lookups in get_id()
+# collection name: metadata fields passed as get_id(metadatas=...), '' for the document
+TEXT_HASH_FIELDS = {
+    COLLECTION_PAPER: [''],
+    COLLECTION_CHUNK: ['', 'denoising_chunk'],
+}
+
+# group / paper / chunk membership of these collections is kept in the side index
+SIDE_INDEX_COLLECTIONS = [
+    COLLECTION_PAPER,
+    COLLECTION_CHUNK,
+    COLLECTION_RELATIONSHIP,
+    COLLECTION_COMMUNITY_REPORT,
+    COLLECTION_SUMMARY,
+]
 
 
 def save_new_item(collection_name: str, documents: str, metadatas: dict):
-    client = chromadb.PersistentClient(path=get_db_path())
-    collection = client.get_or_create_collection(name=collection_name)
+    return save_new_items(collection_name, [documents], [metadatas])[0]
+
+
+def save_new_items(collection_name: str, documents: list, metadatas: list, embeddings=None):
+    # ids are allocated as one block, documents are embedded in batches by the shared
+    # embedding model and each add is committed once, instead of one embedding call and commit per row.
+    # embeddings: vectors of the documents if the caller already has them (e.g. raptor)
+    if not documents:
+        return []
+
+    if collection_name in STAGED_COLLECTIONS and get_staging_file():
+        return stage_items(collection_name, documents, metadatas, embeddings)
+
+    collection = get_collection(collection_name, create=True)
+    if embeddings is None:
+        embeddings = embed_texts(documents)
+
+    new_ids = allocate_ids(collection, len(documents))
+    for start in range(0, len(new_ids), ADD_BATCH_SIZE):
+        end = start + ADD_BATCH_SIZE
+        collection.add(
+            documents=documents[start:end],
+            embeddings=embeddings[start:end],
+            metadatas=metadatas[start:end],
+            ids=new_ids[start:end]
+        )
+
+    update_side_index(collection, new_ids, documents, metadatas)
+
+    return new_ids
+
+
+def embed_texts(texts):
+    # shared embedding model, cached per DB
+    return embedding.embed(texts, cache_path=get_db_path())
+
+
+def get_embedding_cache_stats():
+    return embedding.get_cache_stats(get_db_path())
+
 
-    all_data = collection.get()
+def get_max_id(collection):
+    # ids only, no documents or metadatas
+    all_data = collection.get(include=[])
 
     last_ids = 0
     for ids in all_data['ids']:
         last_ids = max(last_ids, int(ids))
 
-    new_ids = last_ids + 1
-    new_ids = str(new_ids)
-    collection.add(
-        documents=[
-            documents
-        ],
-        metadatas=[
-            metadatas
-        ],
-        ids=[
-            new_ids
-        ]
-    )
+    return last_ids
+
+
+def allocate_ids(collection, count):
+    return meta_db.allocate_ids(get_db_path(), collection.name, count, lambda: get_max_id(collection))
+
+
+def get_text_hash(text):
+    text_clean = re.sub(r'\s+', '', text)
+    return hashlib.sha256(text_clean.encode()).hexdigest() if text_clean else ''
+
+
+def get_entity_key(entity_name):
+    # graphrag upper-cases and unescapes entity names (see clean_str()), the community context
+    # is built from those names while the relationship collection keeps the raw LLM output
+    entity_name = html.unescape(entity_name or '').strip().strip('"')
+    return re.sub(r'\s+', ' ', entity_name).upper()
 
-    return new_ids
+
+def get_side_index_rows(collection_name, ids, documents, metadatas):
+    rows = {
+        'text_hash': [],
+        'member': [],
+        'report_chunk': [],
+        'edge': [],
+    }
+
+    for field in TEXT_HASH_FIELDS.get(collection_name, []):
+        for i in range(len(ids)):
+            metadata = metadatas[i] or {}
+            group_id = metadata.get('group_id', '')
+
+            # same text that get_id() compares against
+            text_list = [documents[i]]
+            if field:
+                m_text = metadata.get(field, '')
+                if m_text != '':
+                    text_list = [m_text]
+                    if field == 'denoising_chunk':
+                        # graphrag extracts from sub chunks, which are parts of the denoising chunk
+                        text_list += json.loads(metadata.get('sub_chunks', '[]'))
+
+            for text in text_list:
+                hash_value = get_text_hash(text or '')
+                if hash_value:
+                    rows['text_hash'].append((collection_name, field, hash_value, ids[i], group_id))
+
+    if collection_name in SIDE_INDEX_COLLECTIONS:
+        for i in range(len(ids)):
+            metadata = metadatas[i] or {}
+            rows['member'].append((
+                collection_name,
+                ids[i],
+                metadata.get('group_id', ''),
+                metadata.get('paper_id', ''),
+                metadata.get('chunk_id', ''),
+            ))
+
+            if collection_name == COLLECTION_COMMUNITY_REPORT:
+                for chunk_id in json.loads(metadata.get('chunk_id_list', '[]')):
+                    rows['report_chunk'].append((ids[i], chunk_id))
+
+            if collection_name == COLLECTION_RELATIONSHIP:
+                rows['edge'].append((
+                    ids[i],
+                    get_entity_key(metadata.get('source_entity_name', '')),
+                    get_entity_key(metadata.get('target_entity_name', '')),
+                    metadata.get('chunk_id', ''),
+                ))
+
+    return rows
+
+
+def iter_side_index_rows(collection_name):
+    # side index rows of a whole collection, one page of items at a time
+    include = ['documents', 'metadatas'] if collection_name in TEXT_HASH_FIELDS else ['metadatas']
+    ids, documents, metadatas = [], [], []
+    for item_id, document, metadata in iter_collection(collection_name, include):
+        ids.append(item_id)
+        documents.append(document or '')
+        metadatas.append(metadata)
+        if len(ids) >= SCAN_BATCH_SIZE:
+            yield get_side_index_rows(collection_name, ids, documents, metadatas)
+            ids, documents, metadatas = [], [], []
+    if ids:
+        yield get_side_index_rows(collection_name, ids, documents, metadatas)
+
+
+def ensure_side_index(collection):
+    # DBs created before the side index existed are indexed page by page on first use
+    db_path = get_db_path()
+    if collection.name not in SIDE_INDEX_COLLECTIONS or meta_db.is_collection_indexed(db_path, collection.name):
+        return True
+
+    meta_db.index_collection(db_path, collection.name, iter_side_index_rows(collection.name))
+
+    return False
+
+
+def ensure_side_indexes():
+    for collection_name in SIDE_INDEX_COLLECTIONS:
+        try:
+            ensure_side_index(get_collection(collection_name))
+        except:
+            # collection does not exist yet
+            pass
+
+
+def update_side_index(collection, ids, documents, metadatas):
+    if ensure_side_index(collection):
+        meta_db.add_items(get_db_path(), get_side_index_rows(collection.name, ids, documents, metadatas))
+
+
+def rebuild_side_indexes():
+    meta_db.reset_index(get_db_path())
+    ensure_side_indexes()
+
+
+def find_id_by_text_hash(collection, query_content, field='', group_id=''):
+    if collection.name not in TEXT_HASH_FIELDS:
+        return None
+
+    hash_value = get_text_hash(query_content)
+    if not hash_value:
+        return None
+
+    ensure_side_index(collection)
+    return meta_db.find_id_by_text_hash(get_db_path(), collection.name, field, hash_value, group_id)
 
 
 def get_id(collection_name: str, query_content: str, metadatas=''):
-    group_id = get_group_id_by_tmp_file()
+    group_id = get_current_group_id()
     group_id_validity = check_group_id(group_id)
 
     ids = '0'
     try:
-        client = chromadb.PersistentClient(path=get_db_path())
-        collection = client.get_collection(name=collection_name)
+        collection = get_collection(collection_name)
+
+        # exact match first, the scans below only run on a miss or when the side index is not available
+        try:
+            hash_ids = find_id_by_text_hash(collection, query_content, metadatas, group_id if group_id_validity else '')
+        except Exception as e:
+            print(f'Text hash lookup failed, scanning {collection_name}: {e}')
+            hash_ids = None
+        if hash_ids is not None:
+            return hash_ids
+
         all_data = collection.get()
 
         if ids == '0':
@@ -83,7 +346,7 @@ def get_id(collection_name: str, query_content: str, metadatas=''):
         if ids == '0':
             try:
                 results = collection.query(
-                    query_texts=[query_content],
+                    query_embeddings=embed_texts([query_content]),
                     n_results=1,
                     where=None if not group_id_validity else {'group_id': group_id}
                 )
@@ -140,69 +403,197 @@ def save_new_group(group_name):
 
 
 def save_new_paper(paper_content, paper_name, group_id):
+    return save_new_papers([paper_content], [paper_name], group_id)[0]
+
+
+def save_new_papers(paper_content_list, paper_name_list, group_id):
     # paper
     # ids: paper id
     # documents: paper_name
     # metadatas: paper_name, group_id
 
-    hash_value = hashlib.sha256(paper_content.encode()).hexdigest()
+    metadatas = []
+    for paper_content, paper_name in zip(paper_content_list, paper_name_list):
+        hash_value = hashlib.sha256(paper_content.encode()).hexdigest()
+        metadatas.append(
+            {
+                'paper_name': paper_name,
+                'group_id': group_id,
+                'hash': hash_value,
+            }
+        )
 
-    paper_id = save_new_item(
+    paper_id_list = save_new_items(
         COLLECTION_PAPER,
-        paper_content,
-        {
-            'paper_name': paper_name,
-            'group_id': group_id,
-            'hash': hash_value,
-        }
+        paper_content_list,
+        metadatas
     )
 
-    return paper_id
+    return paper_id_list
+
+
+def find_paper_id_by_content(paper_content, group_id=''):
+    # id of the first paper with the same content (whitespace ignored) in group_id, or in any group.
+    # one lookup in the text hash side index
+    try:
+        return find_id_by_text_hash(get_collection(COLLECTION_PAPER), paper_content, '', group_id)
+    except:
+        # no paper yet
+        return None
+
+
+def get_denoising_chunk_of_paper(paper_id):
+    for chunk in iter_all_chunks(where={'paper_id': str(paper_id)}):
+        if chunk['denoising_chunk']:
+            return chunk['denoising_chunk']
+    return None
 
 
 def save_new_chunk(chunk, paper_id, group_id, denoising_chunk=''):
+    return save_new_chunks([chunk], [paper_id], group_id, denoising_chunk_list=[denoising_chunk])[0]
+
+
+def save_new_chunks(chunk_list, paper_id_list, group_id, denoising_chunk_list=None):
     # chunk
     # ids: chunk id
     # documents: chunk_content
     # metadatas: paper_id
 
-    sub_chunks = split_text_into_sub_chunks(denoising_chunk) if denoising_chunk else []
+    if denoising_chunk_list is None:
+        denoising_chunk_list = [''] * len(chunk_list)
+
+    metadatas = []
+    for paper_id, denoising_chunk in zip(paper_id_list, denoising_chunk_list):
+        sub_chunks = split_text_into_sub_chunks(denoising_chunk) if denoising_chunk else []
+        metadatas.append(
+            {
+                'paper_id': paper_id,
+                'group_id': group_id,
+                'denoising_chunk': denoising_chunk,
+                'sub_chunks': json.dumps(sub_chunks),
+            }
+        )
 
-    chunk_id = save_new_item(
+    chunk_id_list = save_new_items(
         COLLECTION_CHUNK,
-        chunk,
-        {
-            'paper_id': paper_id,
-            'group_id': group_id,
-            'denoising_chunk': denoising_chunk,
-            'sub_chunks': json.dumps(sub_chunks),
-        }
+        chunk_list,
+        metadatas
     )
 
-    return chunk_id
+    return chunk_id_list
 
 
 def save_new_relationship(chunk, source_entity_name, target_entity_name, relationship_description, relationship_strength):
+    return save_new_relationships(chunk, [(source_entity_name, target_entity_name, relationship_description, relationship_strength)])[0]
+
+
+def save_new_relationships(chunk, relationship_list):
     # relationship
     # ids: relationship id
     # documents: relationship_description
     # metadatas: source entity name, target entity name, relationship description, relationship strength, chunk id
+    # relationship_list: [(source_entity_name, target_entity_name, relationship_description, relationship_strength)]
+
+    if not relationship_list:
+        return []
 
+    # all relationships extracted from one chunk share the chunk id
     chunk_id = get_id(COLLECTION_CHUNK, chunk, metadatas='denoising_chunk')
 
-    relationship_id = save_new_item(
+    documents = []
+    metadatas = []
+    for source_entity_name, target_entity_name, relationship_description, relationship_strength in relationship_list:
+        documents.append(relationship_description)
+        metadatas.append(
+            {
+                'source_entity_name': source_entity_name,
+                'target_entity_name': target_entity_name,
+                'relationship_description': relationship_description,
+                'relationship_strength': relationship_strength,
+                'chunk_id': chunk_id,
+            }
+        )
+
+    relationship_id_list = save_new_items(
         COLLECTION_RELATIONSHIP,
-        relationship_description,
-        {
-            'source_entity_name': source_entity_name,
-            'target_entity_name': target_entity_name,
-            'relationship_description': relationship_description,
-            'relationship_strength': relationship_strength,
-            'chunk_id': chunk_id,
-        }
+        documents,
+        metadatas
     )
 
-    return relationship_id
+    return relationship_id_list
+
+
+def get_chunk_ids_of_relationships(relationship_list):
+    # relationship_list: [(source_entity_name, target_entity_name, relationship_description)] of a community context
+    # chunks are found by the entity names first, relationships that are not in the side index
+    # (e.g. renamed by graphrag) fall back to the closest description, all in one batched query.
+    # relationships of the running index are still in the staging log and are searched there as well
+    try:
+        collection = get_collection(COLLECTION_RELATIONSHIP)
+        ensure_side_index(collection)
+    except:
+        # all relationships are staged
+        collection = None
+
+    edge_list = [(get_entity_key(source), get_entity_key(target)) for source, target, _ in relationship_list]
+    chunk_id_dict = meta_db.find_chunk_ids_by_edge(get_db_path(), edge_list) if collection is not None else {}
+
+    for edge, staged_chunk_id_list in get_staged_chunk_ids_by_edge(edge_list).items():
+        chunk_id_dict[edge] = chunk_id_dict.get(edge, []) + staged_chunk_id_list
+
+    chunk_id_list = []
+    missing_description_list = []
+    for edge, (_, _, description) in zip(edge_list, relationship_list):
+        if edge in chunk_id_dict:
+            chunk_id_list += chunk_id_dict[edge]
+        elif description:
+            missing_description_list.append(description)
+
+    if missing_description_list:
+        query_embeddings = embed_texts(missing_description_list)
+
+        # (distance, chunk_id) of the closest relationship per description
+        closest_list = [(float('inf'), '')] * len(missing_description_list)
+        if collection is not None:
+            results = collection.query(
+                query_embeddings=query_embeddings,
+                n_results=1,
+                include=['metadatas', 'distances']
+            )
+            for i, (metadata_list, distance_list) in enumerate(zip(results['metadatas'], results['distances'])):
+                if metadata_list:
+                    closest_list[i] = (distance_list[0], metadata_list[0]['chunk_id'])
+
+        staged_embeddings, staged_chunk_id_list = get_staged_relationship_embeddings()
+        if staged_chunk_id_list:
+            # squared L2 like chroma's default space
+            for i, query_embedding in enumerate(query_embeddings):
+                distances = ((staged_embeddings - query_embedding) ** 2).sum(axis=1)
+                j = int(distances.argmin())
+                if distances[j] < closest_list[i][0]:
+                    closest_list[i] = (float(distances[j]), staged_chunk_id_list[j])
+
+        chunk_id_list += [chunk_id for _, chunk_id in closest_list]
+
+    return [chunk_id for chunk_id in set(chunk_id_list) if chunk_id]
+
+
+def get_relationships_from_context(index_prompt3_input_text):
+    # one <id>...</id><source>...</source><target>...</target><description>...</description> record per relationship,
+    # see CommunityReportsExtractor._convert_input(). an empty description is written as <description />
+    relationship_list = []
+    for record in index_prompt3_input_text.split('\n\n'):
+        source = re.search(r'<source>(.*?)</source>', record, re.DOTALL)
+        target = re.search(r'<target>(.*?)</target>', record, re.DOTALL)
+        if source is None or target is None:
+            continue
+        description = re.search(r'<description>(.*?)</description>', record, re.DOTALL)
+        relationship_list.append((
+            html.unescape(source.group(1)),
+            html.unescape(target.group(1)),
+            html.unescape(description.group(1)) if description else '',
+        ))
+    return relationship_list
 
 
 def save_new_community_report(index_prompt3_input_text, community_report_text):
@@ -210,30 +601,20 @@ def save_new_community_report(index_prompt3_input_text, community_report_text):
     # ids: community report id
     # documents: community report text
     # metadatas: relationship ids, title, summary, rating, rating explanation, findings (<insight> <insight_summary> ... </insight_summary> <insight_explanation> ... </insight_explanation> </insight>)
+    # the chunks of the report are found through the relationships of the community in index_prompt3_input_text
 
-    group_id = get_group_id_by_tmp_file()
-    _, group_chunk_id_list, _, _, _ = get_ref_ids_for_group(group_id)
-
-    descriptions = re.findall(r'</target><description>(.*?)</description>', index_prompt3_input_text, re.DOTALL)
-    chunk_id_list = []
-
-    if descriptions:
-        client = chromadb.PersistentClient(path=get_db_path())
-        collection = client.get_collection(name=COLLECTION_RELATIONSHIP)
-
-        for des in descriptions:
-            results = collection.query(
-                query_texts=[des],
-                n_results=1
-            )
+    group_id = get_current_group_id()
+    if not check_group_id(group_id) or not community_report_text:
+        return None
 
-            chunk_id = results['metadatas'][0][0]['chunk_id']
-            if chunk_id in group_chunk_id_list:
-                chunk_id_list.append(chunk_id)
+    relationship_list = get_relationships_from_context(index_prompt3_input_text)
 
-        chunk_id_list = list(set(chunk_id_list))
+    chunk_id_list = []
+    if relationship_list:
+        chunk_id_list = get_chunk_ids_of_relationships(relationship_list)
+        chunk_id_list = filter_group_chunk_ids(group_id, chunk_id_list)
 
-    if check_group_id(group_id) and chunk_id_list and community_report_text:
+    if chunk_id_list:
         report_id = save_new_item(
             COLLECTION_COMMUNITY_REPORT,
             community_report_text,
@@ -249,42 +630,173 @@ def save_new_community_report(index_prompt3_input_text, community_report_text):
 
 
 def save_new_summary(summary_text, chunk_id_list, from_base_chunk, root_summary, group_id):
+    return save_new_summaries([(summary_text, chunk_id_list)], from_base_chunk, root_summary, group_id)[0]
+
+
+def save_new_summaries(summary_list, from_base_chunk, root_summary, group_id, embeddings=None):
     # summary chunk
     # ids: summary chunk id
     # documents: summary text
-    # metadatas: chunk_id_list
-    summary_id = save_new_item(
-        COLLECTION_SUMMARY,
-        summary_text,
-        {
+    # metadatas: chunk_id_list, base_chunk_id_list, paper_id_list
+    # summary_list: [(summary_text, chunk_id_list)] or [(summary_text, chunk_id_list, base_chunk_id_list, paper_id_list)],
+    # all summaries of one raptor level. base_chunk_id_list and paper_id_list are the base chunks and papers
+    # below the summary in the tree, stored so queries do not have to walk the tree
+    # embeddings: vectors of the summary texts, computed here if not given
+
+    documents = []
+    metadatas = []
+    for summary in summary_list:
+        summary_text, chunk_id_list = summary[:2]
+        metadata = {
             'chunk_id_list': json.dumps(chunk_id_list),
             'from_base_chunk': from_base_chunk,
             'root_summary': root_summary,
             'group_id': group_id,
         }
+        if len(summary) == 4:
+            metadata['base_chunk_id_list'] = json.dumps(summary[2])
+            metadata['paper_id_list'] = json.dumps(summary[3])
+
+        documents.append(summary_text)
+        metadatas.append(metadata)
+
+    summary_id_list = save_new_items(
+        COLLECTION_SUMMARY,
+        documents,
+        metadatas,
+        embeddings
     )
 
-    return summary_id
+    return summary_id_list
 
 
-def get_all_community_reports():
-    report_list = []
+def iter_collection(collection_name, include=('metadatas',), where=None, limit=None, offset=0, batch_size=SCAN_BATCH_SIZE):
+    # yield (id, document, metadata) in int id order, holding one page of rows in memory at a time.
+    # include: any of 'documents', 'metadatas', 'embeddings'; document / metadata is None if not included.
+    # with embeddings, (id, document, metadata, embedding) is yielded
     try:
-        client = chromadb.PersistentClient(path=get_db_path())
-        collection = client.get_collection(name=COLLECTION_COMMUNITY_REPORT)
+        collection = get_collection(collection_name)
+    except:
+        # collection does not exist yet
+        return
 
-        all_data = collection.get()
-        for i in range(len(all_data['ids'])):
-            report_list.append(
-                {
-                    'report_id': all_data['ids'][i],
-                    'report_content': all_data['documents'][i],
-                    'chunk_id_list': json.loads(all_data['metadatas'][i]['chunk_id_list']),
-                    'group_id': all_data['metadatas'][i]['group_id'],
-                }
-            )
+    if hasattr(collection, 'scan'):
+        # lancedb streams its Arrow record batches
+        yield from collection.scan(include, where, limit, offset, batch_size)
+        return
+
+    # ids only, then page through the rows in id order
+    ids = collection.get(where=where, include=[])['ids']
+    ids.sort(key=int)
+    ids = ids[offset:] if limit is None else ids[offset:offset + limit]
+
+    include = list(include)
+    for start in range(0, len(ids), batch_size):
+        page = ids[start:start + batch_size]
+        data = collection.get(ids=page, include=include)
+
+        # get(ids=...) does not keep the order of the ids
+        position = {item_id: i for i, item_id in enumerate(data['ids'])}
+        for item_id in page:
+            if item_id not in position:
+                continue
+            i = position[item_id]
+            document = data['documents'][i] if 'documents' in include else None
+            metadata = data['metadatas'][i] if 'metadatas' in include else None
+            if 'embeddings' in include:
+                yield item_id, document, metadata, data['embeddings'][i]
+            else:
+                yield item_id, document, metadata
+
+
+def get_row_include(include):
+    # the iter_all_* rows are built from the metadata, so it is always fetched.
+    # documents (the *_content keys) are only read if asked for
+    return ['documents', 'metadatas'] if 'documents' in include else ['metadatas']
 
-        report_list.sort(key=lambda x: int(x['report_id']), reverse=False)
+
+def iter_all_community_reports(include=('metadatas',), where=None, limit=None, offset=0):
+    include = get_row_include(include)
+    for report_id, document, metadata in iter_collection(COLLECTION_COMMUNITY_REPORT, include, where, limit, offset):
+        report = {
+            'report_id': report_id,
+            'chunk_id_list': json.loads(metadata['chunk_id_list']),
+            'group_id': metadata['group_id'],
+        }
+        if 'documents' in include:
+            report['report_content'] = document
+        yield report
+
+
+def iter_all_chunks(include=('metadatas',), where=None, limit=None, offset=0):
+    include = get_row_include(include)
+    for chunk_id, document, metadata in iter_collection(COLLECTION_CHUNK, include, where, limit, offset):
+        chunk = {
+            'chunk_id': chunk_id,
+            'paper_id': metadata['paper_id'],
+            'group_id': metadata['group_id'],
+            'denoising_chunk': metadata['denoising_chunk'],
+            'sub_chunks': json.loads(metadata['sub_chunks']),
+        }
+        if 'documents' in include:
+            chunk['chunk_content'] = document
+        yield chunk
+
+
+def iter_all_summary_chunks(include=('metadatas',), where=None, limit=None, offset=0):
+    include = get_row_include(include)
+    for summary_id, document, metadata in iter_collection(COLLECTION_SUMMARY, include, where, limit, offset):
+        summary = {
+            'summary_id': summary_id,
+            'chunk_id_list': json.loads(metadata['chunk_id_list']),
+            'from_base_chunk': metadata['from_base_chunk'],
+            'root_summary': metadata['root_summary'],
+            'group_id': metadata['group_id'],
+        }
+        if 'documents' in include:
+            summary['summary_content'] = document
+        yield summary
+
+
+def iter_all_papers(include=('metadatas',), where=None, limit=None, offset=0):
+    include = get_row_include(include)
+    for paper_id, document, metadata in iter_collection(COLLECTION_PAPER, include, where, limit, offset):
+        paper = {
+            'paper_id': paper_id,
+            'paper_name': metadata['paper_name'],
+            'group_id': metadata['group_id'],
+            'hash': metadata['hash'],
+        }
+        if 'documents' in include:
+            paper['paper_content'] = document
+        yield paper
+
+
+def iter_all_groups(where=None, limit=None, offset=0):
+    for group_id, _, metadata in iter_collection(COLLECTION_GROUP, ['metadatas'], where, limit, offset):
+        yield {
+            'group_id': group_id,
+            'group_name': metadata['group_name'],
+        }
+
+
+def iter_all_relationships(where=None, limit=None, offset=0):
+    for relationship_id, _, metadata in iter_collection(COLLECTION_RELATIONSHIP, ['metadatas'], where, limit, offset):
+        yield {
+            'relationship_id': relationship_id,
+            'source_entity_name': metadata['source_entity_name'],
+            'target_entity_name': metadata['target_entity_name'],
+            'relationship_description': metadata['relationship_description'],
+            'relationship_strength': metadata['relationship_strength'],
+            'chunk_id': metadata['chunk_id'],
+        }
+
+
+def get_all_community_reports():
+    report_list = []
+    try:
+        for report in iter_all_community_reports(include=('documents', 'metadatas')):
+            report_list.append(report)
     except Exception as e:
         # print(e)
         # traceback.print_exc()
@@ -296,23 +808,8 @@ def get_all_community_reports():
 def get_all_chunks():
     chunk_list = []
     try:
-        client = chromadb.PersistentClient(path=get_db_path())
-        collection = client.get_collection(name=COLLECTION_CHUNK)
-
-        all_data = collection.get()
-        for i in range(len(all_data['ids'])):
-            chunk_list.append(
-                {
-                    'chunk_id': all_data['ids'][i],
-                    'chunk_content': all_data['documents'][i],
-                    'paper_id': all_data['metadatas'][i]['paper_id'],
-                    'group_id': all_data['metadatas'][i]['group_id'],
-                    'denoising_chunk': all_data['metadatas'][i]['denoising_chunk'],
-                    'sub_chunks': json.loads(all_data['metadatas'][i]['sub_chunks']),
-                }
-            )
-
-        chunk_list.sort(key=lambda x: int(x['chunk_id']), reverse=False)
+        for chunk in iter_all_chunks(include=('documents', 'metadatas')):
+            chunk_list.append(chunk)
     except Exception as e:
         # print(e)
         # traceback.print_exc()
@@ -324,23 +821,8 @@ def get_all_chunks():
 def get_all_summary_chunks():
     summary_list = []
     try:
-        client = chromadb.PersistentClient(path=get_db_path())
-        collection = client.get_collection(name=COLLECTION_SUMMARY)
-
-        all_data = collection.get()
-        for i in range(len(all_data['ids'])):
-            summary_list.append(
-                {
-                    'summary_id': all_data['ids'][i],
-                    'summary_content': all_data['documents'][i],
-                    'chunk_id_list': json.loads(all_data['metadatas'][i]['chunk_id_list']),
-                    'from_base_chunk': all_data['metadatas'][i]['from_base_chunk'],
-                    'root_summary': all_data['metadatas'][i]['root_summary'],
-                    'group_id': all_data['metadatas'][i]['group_id'],
-                }
-            )
-
-        summary_list.sort(key=lambda x: int(x['summary_id']), reverse=False)
+        for summary in iter_all_summary_chunks(include=('documents', 'metadatas')):
+            summary_list.append(summary)
     except Exception as e:
         # print(e)
         # traceback.print_exc()
@@ -352,22 +834,8 @@ def get_all_summary_chunks():
 def get_all_papers():
     paper_list = []
     try:
-        client = chromadb.PersistentClient(path=get_db_path())
-        collection = client.get_collection(name=COLLECTION_PAPER)
-
-        all_data = collection.get()
-        for i in range(len(all_data['ids'])):
-            paper_list.append(
-                {
-                    'paper_id': all_data['ids'][i],
-                    'paper_content': all_data['documents'][i],
-                    'paper_name': all_data['metadatas'][i]['paper_name'],
-                    'group_id': all_data['metadatas'][i]['group_id'],
-                    'hash': all_data['metadatas'][i]['hash'],
-                }
-            )
-
-        paper_list.sort(key=lambda x: int(x['paper_id']), reverse=False)
+        for paper in iter_all_papers(include=('documents', 'metadatas')):
+            paper_list.append(paper)
     except Exception as e:
         # print(e)
         # traceback.print_exc()
@@ -379,20 +847,8 @@ def get_all_papers():
 def get_all_groups():
     group_list = []
     try:
-        client = chromadb.PersistentClient(path=get_db_path())
-        collection = client.get_collection(name=COLLECTION_GROUP)
-
-        all_data = collection.get()
-        for i in range(len(all_data['ids'])):
-            group_list.append(
-                {
-                    'group_id': all_data['ids'][i],
-                    'group_name': all_data['metadatas'][i]['group_name'],
-                }
-            )
-
-        group_list.sort(key=lambda x: int(x['group_id']), reverse=False)
-
+        for group in iter_all_groups():
+            group_list.append(group)
     except Exception as e:
         # print(e)
         # traceback.print_exc()
@@ -404,24 +860,8 @@ def get_all_groups():
 def get_all_relationships():
     relationship_list = []
     try:
-        client = chromadb.PersistentClient(path=get_db_path())
-        collection = client.get_collection(name=COLLECTION_RELATIONSHIP)
-
-        all_data = collection.get()
-        for i in range(len(all_data['ids'])):
-            relationship_list.append(
-                {
-                    'relationship_id': all_data['ids'][i],
-                    'source_entity_name': all_data['metadatas'][i]['source_entity_name'],
-                    'target_entity_name': all_data['metadatas'][i]['target_entity_name'],
-                    'relationship_description': all_data['metadatas'][i]['relationship_description'],
-                    'relationship_strength': all_data['metadatas'][i]['relationship_strength'],
-                    'chunk_id': all_data['metadatas'][i]['chunk_id'],
-                }
-            )
-
-        relationship_list.sort(key=lambda x: int(x['relationship_id']), reverse=False)
-
+        for relationship in iter_all_relationships():
+            relationship_list.append(relationship)
     except Exception as e:
         # print(e)
         # traceback.print_exc()
@@ -431,116 +871,182 @@ def get_all_relationships():
 
 
 def get_ref_id_of_chunk(chunk_id):
-    paper_id = None
-    group_id = None
-    try:
-        client = chromadb.PersistentClient(path=get_db_path())
-        collection = client.get_collection(name=COLLECTION_CHUNK)
+    return get_ref_ids_of_chunks([chunk_id])[str(chunk_id)]
 
-        results = collection.get(
-            ids=[str(chunk_id)]
-        )
 
-        paper_id = results['metadatas'][0]['paper_id']
-        group_id = results['metadatas'][0]['group_id']
-    except Exception as e:
-        # print(e)
-        # traceback.print_exc()
-        pass
+def get_ref_ids_of_chunks(chunk_id_list):
+    # {chunk_id: (paper_id, group_id)} for a set of chunks, (None, None) if the chunk is not found.
+    # chunks missing from the LRU cache are fetched with one get(ids=[...])
+    db_path = get_db_path()
+    chunk_id_list = [str(chunk_id) for chunk_id in chunk_id_list]
+    ref_ids = {}
 
-    return paper_id, group_id
+    try:
+        db_version = meta_db.get_db_version(db_path)
+    except:
+        # no cache without a version
+        db_version = None
 
+    missing_chunk_id_list = []
+    with _REF_ID_CACHE_LOCK:
+        for chunk_id in chunk_id_list:
+            key = (db_path, db_version, chunk_id)
+            if db_version is not None and key in _REF_ID_CACHE:
+                _REF_ID_CACHE.move_to_end(key)
+                ref_ids[chunk_id] = _REF_ID_CACHE[key]
+            elif chunk_id not in missing_chunk_id_list:
+                missing_chunk_id_list.append(chunk_id)
+
+    if missing_chunk_id_list:
+        try:
+            collection = get_collection(COLLECTION_CHUNK)
+
+            results = collection.get(
+                ids=missing_chunk_id_list,
+                include=['metadatas']
+            )
 
-def count_all_collection():
-    client = chromadb.PersistentClient(path=get_db_path())
+            for chunk_id, metadata in zip(results['ids'], results['metadatas']):
+                ref_ids[chunk_id] = (metadata['paper_id'], metadata['group_id'])
+        except Exception as e:
+            # print(e)
+            # traceback.print_exc()
+            pass
+
+        with _REF_ID_CACHE_LOCK:
+            for chunk_id in missing_chunk_id_list:
+                if db_version is not None and chunk_id in ref_ids:
+                    _REF_ID_CACHE[(db_path, db_version, chunk_id)] = ref_ids[chunk_id]
+            while len(_REF_ID_CACHE) > REF_ID_CACHE_SIZE:
+                _REF_ID_CACHE.popitem(last=False)
+
+    for chunk_id in chunk_id_list:
+        if chunk_id not in ref_ids:
+            ref_ids[chunk_id] = (None, None)
+
+    return ref_ids
+
+
+def get_collection_counts():
+    # {collection_name: row count}, from collection.count(), no rows are read
+    count_dict = OrderedDict()
+    for collection_name in COLLECTION_NAME_LIST:
+        try:
+            count_dict[collection_name] = get_collection(collection_name).count()
+        except:
+            # collection does not exist yet
+            count_dict[collection_name] = 0
+    return count_dict
+
+
+def get_group_counts(group_id):
+    # {collection_name: number of items of the group}, counted in the side index
+    ensure_side_indexes()
+    counts = meta_db.count_ref_ids_for_group(get_db_path(), str(group_id))
+    return OrderedDict(zip(GROUP_COLLECTION_NAME_LIST, counts))
+
+
+def is_side_index_complete():
+    # read only: True if every existing collection of SIDE_INDEX_COLLECTIONS is indexed
+    indexed = meta_db.get_indexed_collections(get_db_path())
+    for collection_name in SIDE_INDEX_COLLECTIONS:
+        if collection_name in indexed:
+            continue
+        try:
+            get_collection(collection_name)
+        except:
+            # collection does not exist yet
+            continue
+        return False
+    return True
+
+
+def count_group_items_where(group_id):
+    # get_group_counts() of a DB without a complete side index, with id-only where filters and without building it.
+    # the same membership as meta_db.get_ref_ids_for_group(): papers, chunks, reports and summaries by group_id,
+    # chunks of the group's papers, and relationships through their chunk_id
+    group_id = str(group_id)
+    paper_id_list = get_ids_where(COLLECTION_PAPER, {'group_id': group_id})
+    chunk_id_list = set(get_ids_where(COLLECTION_CHUNK, {'group_id': group_id}))
+    chunk_id_list.update(get_ids_where_in(COLLECTION_CHUNK, 'paper_id', paper_id_list))
+    counts = (
+        len(paper_id_list),
+        len(chunk_id_list),
+        len(get_ids_where_in(COLLECTION_RELATIONSHIP, 'chunk_id', chunk_id_list)),
+        len(get_ids_where(COLLECTION_COMMUNITY_REPORT, {'group_id': group_id})),
+        len(get_ids_where(COLLECTION_SUMMARY, {'group_id': group_id})),
+    )
+    return OrderedDict(zip(GROUP_COLLECTION_NAME_LIST, counts))
 
-    # group
-    group_count = 0
-    try:
-        collection = client.get_collection(name=COLLECTION_GROUP)
-        all_data = collection.get()
-        group_count = len(all_data['ids'])
-    except Exception as e:
-        # print(e)
-        # traceback.print_exc()
-        pass
-    print('count of group:', group_count)
 
-    # paper
-    paper_count = 0
-    try:
-        collection = client.get_collection(name=COLLECTION_PAPER)
-        all_data = collection.get()
-        paper_count = len(all_data['ids'])
-    except Exception as e:
-        # print(e)
-        # traceback.print_exc()
-        pass
-    print('count of paper:', paper_count)
+def get_disk_usage(db_path=None):
+    # {part: bytes} of the DB directory and 'total'
+    db_path = db_path or get_db_path()
+    usage_dict = OrderedDict()
+    if not os.path.isdir(db_path):
+        return usage_dict
 
-    # chunk
-    chunk_count = 0
-    try:
-        collection = client.get_collection(name=COLLECTION_CHUNK)
-        all_data = collection.get()
-        chunk_count = len(all_data['ids'])
-    except Exception as e:
-        # print(e)
-        # traceback.print_exc()
-        pass
-    print('count of chunk:', chunk_count)
+    for entry in os.scandir(db_path):
+        if entry.is_dir(follow_symlinks=False):
+            size = 0
+            for root, _, file_name_list in os.walk(entry.path):
+                for file_name in file_name_list:
+                    try:
+                        size += os.path.getsize(os.path.join(root, file_name))
+                    except OSError:
+                        pass
+            # chroma keeps the HNSW index of each segment in a directory named by the segment uuid
+            name = 'hnsw index' if UUID_PATTERN.fullmatch(entry.name) else entry.name + '/'
+        else:
+            size = entry.stat(follow_symlinks=False).st_size
+            name = entry.name
+        usage_dict[name] = usage_dict.get(name, 0) + size
+
+    usage_dict['total'] = sum(usage_dict.values())
+    return usage_dict
+
+
+def get_catalog(with_groups=True):
+    # counts and sizes of the active DB, see catalog_vector_db.py. nothing is written to the DB,
+    # groups are counted in the side index if it is complete, otherwise with id-only where filters
+    catalog = OrderedDict()
+    catalog['db_path'] = get_db_path()
+    catalog['backend'] = get_backend()
+    catalog['collections'] = get_collection_counts()
+    if with_groups:
+        catalog['groups'] = []
+        count_group = get_group_counts if is_side_index_complete() else count_group_items_where
+        for group in iter_all_groups():
+            group_counts = OrderedDict([('group_id', group['group_id']), ('group_name', group['group_name'])])
+            group_counts.update(count_group(group['group_id']))
+            catalog['groups'].append(group_counts)
+    catalog['disk'] = get_disk_usage()
+    return catalog
 
-    # relationship
-    relationship_count = 0
-    try:
-        collection = client.get_collection(name=COLLECTION_RELATIONSHIP)
-        all_data = collection.get()
-        relationship_count = len(all_data['ids'])
-    except Exception as e:
-        # print(e)
-        # traceback.print_exc()
-        pass
-    print('count of relationship:', relationship_count)
 
-    # community report
-    report_count = 0
-    try:
-        collection = client.get_collection(name=COLLECTION_COMMUNITY_REPORT)
-        all_data = collection.get()
-        report_count = len(all_data['ids'])
-    except Exception as e:
-        # print(e)
-        # traceback.print_exc()
-        pass
-    print('count of community report:', report_count)
+def count_all_collection():
+    for collection_name, count in get_collection_counts().items():
+        print(f'count of {collection_name.replace("_", " ")}:', count)
 
-    # summary
-    summary_count = 0
-    try:
-        collection = client.get_collection(name=COLLECTION_SUMMARY)
-        all_data = collection.get()
-        summary_count = len(all_data['ids'])
-    except Exception as e:
-        # print(e)
-        # traceback.print_exc()
-        pass
-    print('count of summary:', summary_count)
 
+def query_base_chunk(query_text, top_k=20, query_group_id=-1, query_embedding=None):
+    collection = get_collection(COLLECTION_CHUNK)
 
-def query_base_chunk(query_text, top_k=20, query_group_id=-1):
-    client = chromadb.PersistentClient(path=get_db_path())
-    collection = client.get_collection(name=COLLECTION_CHUNK)
+    if query_embedding is None:
+        query_embedding = embed_texts([query_text])[0]
 
     results = collection.query(
-        query_texts=[query_text],
+        query_embeddings=[query_embedding],
         n_results=top_k,
         where=None if query_group_id == -1 else {'group_id': str(query_group_id)}
     )
 
+    ref_ids = get_ref_ids_of_chunks(results['ids'][0])
+
     result_list = []
     for i in range(len(results['ids'][0])):
         chunk_id = results['ids'][0][i]
-        paper_id, group_id = get_ref_id_of_chunk(chunk_id)
+        paper_id, group_id = ref_ids[chunk_id]
         result_list.append({
             'id': chunk_id,
             'text': results['documents'][0][i],
@@ -554,40 +1060,50 @@ def query_base_chunk(query_text, top_k=20, query_group_id=-1):
     return result_list
 
 
-def query_summary_chunk(query_text, top_k=20, query_group_id=-1):
-    client = chromadb.PersistentClient(path=get_db_path())
-    collection = client.get_collection(name=COLLECTION_SUMMARY)
+def query_summary_chunk(query_text, top_k=20, query_group_id=-1, query_embedding=None):
+    collection = get_collection(COLLECTION_SUMMARY)
+
+    if query_embedding is None:
+        query_embedding = embed_texts([query_text])[0]
 
     results = collection.query(
-        query_texts=[query_text],
+        query_embeddings=[query_embedding],
         n_results=top_k,
         where=None if query_group_id == -1 else {'group_id': str(query_group_id)}
     )
 
-    summary_list = get_all_summary_chunks()
+    summary_tree = None
+    base_chunk_id_list_list = []
+    for metadata in results['metadatas'][0]:
+        if 'base_chunk_id_list' in metadata:
+            base_chunk_id_list_list.append(json.loads(metadata['base_chunk_id_list']))
+        else:
+            # summaries written before the closure was stored
+            if summary_tree is None:
+                summary_tree = get_summary_tree()
+            base_chunk_id_list_list.append(get_summary_base_chunk_ids(summary_tree, metadata))
+
+    # provenance of the base chunks of hits without a stored paper list in one lookup
+    ref_ids = get_ref_ids_of_chunks([
+        chunk_id
+        for metadata, chunk_id_list in zip(results['metadatas'][0], base_chunk_id_list_list)
+        if 'paper_id_list' not in metadata
+        for chunk_id in chunk_id_list
+    ])
 
     result_list = []
     for i in range(len(results['ids'][0])):
         summary_id = results['ids'][0][i]
         group_id = results['metadatas'][0][i]['group_id']
 
-        from_base_chunk = results['metadatas'][0][i]['from_base_chunk']
-        cur_chunk_id_list = json.loads(results['metadatas'][0][i]['chunk_id_list'])
-        while not from_base_chunk:
-            tmp_chunk_id_list = []
-            for tmp_summary_id in cur_chunk_id_list:
-                for summary in summary_list:
-                    if summary['summary_id'] == tmp_summary_id:
-                        tmp_chunk_id_list += summary['chunk_id_list']
-                        from_base_chunk = summary['from_base_chunk']
-                        break
-            cur_chunk_id_list = list(set(tmp_chunk_id_list))
-
-        paper_id_list = []
-        for chunk_id in cur_chunk_id_list:
-            tmp_paper_id, tmp_group_id = get_ref_id_of_chunk(chunk_id)
-            if tmp_group_id == group_id:
-                paper_id_list.append(tmp_paper_id)
+        if 'paper_id_list' in results['metadatas'][0][i]:
+            paper_id_list = json.loads(results['metadatas'][0][i]['paper_id_list'])
+        else:
+            paper_id_list = []
+            for chunk_id in base_chunk_id_list_list[i]:
+                tmp_paper_id, tmp_group_id = ref_ids[str(chunk_id)]
+                if tmp_group_id == group_id:
+                    paper_id_list.append(tmp_paper_id)
 
         paper_id_list = list(set(paper_id_list))
 
@@ -604,26 +1120,81 @@ def query_summary_chunk(query_text, top_k=20, query_group_id=-1):
     return result_list
 
 
-def query_report_chunk(query_text, top_k=20, query_group_id=-1):
-    client = chromadb.PersistentClient(path=get_db_path())
-    collection = client.get_collection(name=COLLECTION_COMMUNITY_REPORT)
+def get_summary_tree():
+    # {summary_id: {'chunk_id_list': , 'from_base_chunk': , 'base_chunk_id_list': }}, metadata only
+    summary_tree = {}
+    try:
+        collection = get_collection(COLLECTION_SUMMARY)
+        all_data = collection.get(include=['metadatas'])
+        for summary_id, metadata in zip(all_data['ids'], all_data['metadatas']):
+            summary_tree[summary_id] = {
+                'chunk_id_list': json.loads(metadata['chunk_id_list']),
+                'from_base_chunk': metadata['from_base_chunk'],
+                'base_chunk_id_list': json.loads(metadata['base_chunk_id_list']) if 'base_chunk_id_list' in metadata else None,
+            }
+    except Exception as e:
+        # print(e)
+        # traceback.print_exc()
+        pass
+
+    return summary_tree
+
+
+def get_summary_base_chunk_ids(summary_tree, metadata):
+    # base chunk ids below a summary, closures of visited summaries are memoised in the tree
+    if metadata['from_base_chunk']:
+        return list(set(json.loads(metadata['chunk_id_list'])))
+
+    def closure(summary_id, visiting):
+        node = summary_tree.get(summary_id)
+        if node is None or summary_id in visiting:
+            return set()
+        if node['base_chunk_id_list'] is None:
+            if node['from_base_chunk']:
+                node['base_chunk_id_list'] = list(set(node['chunk_id_list']))
+            else:
+                visiting.add(summary_id)
+                base_chunk_ids = set()
+                for child_id in node['chunk_id_list']:
+                    base_chunk_ids.update(closure(child_id, visiting))
+                visiting.discard(summary_id)
+                node['base_chunk_id_list'] = list(base_chunk_ids)
+        return set(node['base_chunk_id_list'])
+
+    base_chunk_ids = set()
+    for child_id in json.loads(metadata['chunk_id_list']):
+        base_chunk_ids.update(closure(child_id, set()))
+
+    return list(base_chunk_ids)
+
+
+def query_report_chunk(query_text, top_k=20, query_group_id=-1, query_embedding=None):
+    collection = get_collection(COLLECTION_COMMUNITY_REPORT)
+
+    if query_embedding is None:
+        query_embedding = embed_texts([query_text])[0]
 
     results = collection.query(
-        query_texts=[query_text],
+        query_embeddings=[query_embedding],
         n_results=top_k,
         where=None if query_group_id == -1 else {'group_id': str(query_group_id)}
     )
 
+    chunk_id_list_list = [json.loads(metadata['chunk_id_list']) for metadata in results['metadatas'][0]]
+
+    # provenance of the chunks cited by all reports in one lookup
+    ref_ids = get_ref_ids_of_chunks([chunk_id for chunk_id_list in chunk_id_list_list for chunk_id in chunk_id_list])
+
     result_list = []
     for i in range(len(results['ids'][0])):
         report_id = results['ids'][0][i]
 
-        chunk_id_list = json.loads(results['metadatas'][0][i]['chunk_id_list'])
+        chunk_id_list = chunk_id_list_list[i]
         group_id = results['metadatas'][0][i]['group_id']
 
         paper_id_list = []
         for chunk_id in chunk_id_list:
-            tmp_paper_id, tmp_group_id = get_ref_id_of_chunk(chunk_id)
+            tmp_paper_id, tmp_group_id = ref_ids[str(chunk_id)]
             if tmp_group_id == group_id:
                 paper_id_list.append(tmp_paper_id)
 
@@ -666,9 +1237,11 @@ def get_query_chunks(query_option, query_text, top_k=20, query_group_id=-1):
         need_summary_chunk = False
         need_report_chunk = False
 
-    base_chunk_list = query_base_chunk(query_text, top_k, query_group_id) if need_base_chunk else []
-    summary_chunk_list = query_summary_chunk(query_text, top_k, query_group_id) if need_summary_chunk else []
-    report_chunk_list = query_report_chunk(query_text, top_k, query_group_id) if need_report_chunk else []
+    # the question is embedded once for all collections
+    query_embedding = embed_texts([query_text])[0]
+    base_chunk_list = query_base_chunk(query_text, top_k, query_group_id, query_embedding) if need_base_chunk else []
+    summary_chunk_list = query_summary_chunk(query_text, top_k, query_group_id, query_embedding) if need_summary_chunk else []
+    report_chunk_list = query_report_chunk(query_text, top_k, query_group_id, query_embedding) if need_report_chunk else []
 
     chunk_list = base_chunk_list + summary_chunk_list + report_chunk_list
     chunk_list.sort(key=lambda x: x['distance'], reverse=False)
@@ -677,55 +1250,411 @@ def get_query_chunks(query_option, query_text, top_k=20, query_group_id=-1):
 
 
 def get_db_path():
-    try:
-        with open(DB_TMP_FILE_PATH, 'r') as f:
-            db_path = f.read()
-        db_path = db_path.strip()
-        if not db_path:
-            db_path = DATABASE_PATH
-    except:
-        db_path = DATABASE_PATH
-    return db_path
+    db_path = _DB_PATH_VAR.get() or _DB_PATH or os.environ.get(DB_PATH_ENV, '').strip()
+    return db_path or DATABASE_PATH
 
 
 def update_db_path(new_db_path):
-    with open(DB_TMP_FILE_PATH, 'w') as f:
-        f.write(new_db_path)
-        f.flush()
+    global _DB_PATH
+
+    invalidate_handles()
+    _DB_PATH = new_db_path
+
+
+def reset_db_path():
+    global _DB_PATH
+
+    invalidate_handles()
+    _DB_PATH = None
+
+
+def get_backend(db_path=None):
+    db_path = db_path or get_db_path()
+    if os.path.isfile(os.path.join(db_path, CHROMA_DB_FILE_NAME)):
+        return BACKEND_CHROMA
+    if os.path.isdir(os.path.join(db_path, LANCE_DIR_NAME)):
+        return BACKEND_LANCEDB
+    return os.environ.get(STORAGE_BACKEND_ENV, BACKEND_CHROMA)
 
 
-def rm_db_tmp_file():
-    if os.path.isfile(DB_TMP_FILE_PATH):
-        os.remove(DB_TMP_FILE_PATH)
+def init_db(db_path, backend):
+    # create an empty DB with the given backend, e.g. the target of migrate_vector_db.py
+    has_db = os.path.isfile(os.path.join(db_path, CHROMA_DB_FILE_NAME)) or os.path.isdir(os.path.join(db_path, LANCE_DIR_NAME))
+    if has_db and get_backend(db_path) != backend:
+        raise ValueError(f'"{db_path}" already holds a {get_backend(db_path)} DB.')
 
+    invalidate_handles(db_path)
+    if backend == BACKEND_LANCEDB:
+        os.makedirs(os.path.join(db_path, LANCE_DIR_NAME), exist_ok=True)
+    else:
+        # creates chroma.sqlite3
+        chromadb.PersistentClient(path=db_path)
+
+    return get_client(db_path)
+
+
+def get_client(db_path=None):
+    # one client per DB path for the whole process, a chroma client or a
+    # lance_db.LanceClient with the same API
+    db_path = db_path or get_db_path()
+    with _HANDLE_LOCK:
+        client = _CLIENTS.get(db_path)
+        if client is None:
+            if get_backend(db_path) == BACKEND_LANCEDB:
+                import graphrag.my_graphrag.lance_db as lance_db
+                client = lance_db.LanceClient(db_path)
+            else:
+                client = chromadb.PersistentClient(path=db_path)
+            _CLIENTS[db_path] = client
+        return client
+
+
+def get_collection(collection_name, create=False, db_path=None):
+    # collection handles are opened lazily and kept until invalidate_handles().
+    # like client.get_collection(), raise if the collection does not exist and create is False
+    db_path = db_path or get_db_path()
+    key = (db_path, collection_name)
+    with _HANDLE_LOCK:
+        collection = _COLLECTIONS.get(key)
+        if collection is None:
+            client = get_client(db_path)
+            if create:
+                collection = client.get_or_create_collection(name=collection_name, metadata=get_hnsw_metadata(collection_name))
+            else:
+                collection = client.get_collection(name=collection_name)
+            _COLLECTIONS[key] = collection
+        return collection
+
+
+def load_hnsw_config():
+    global _HNSW_CONFIG
+    if _HNSW_CONFIG is None:
+        try:
+            with open(HNSW_CONFIG_FILE, 'r') as f:
+                _HNSW_CONFIG = json.load(f)
+        except Exception as e:
+            print(f'Cannot read HNSW config {HNSW_CONFIG_FILE}, using chroma defaults: {e}')
+            _HNSW_CONFIG = {}
+    return _HNSW_CONFIG
+
+
+def get_hnsw_metadata(collection_name, metadata=None):
+    # chroma collection metadata with the configured hnsw:* keys, other keys of metadata are kept
+    new_metadata = {key: value for key, value in (metadata or {}).items() if not key.startswith('hnsw:')}
+    config = load_hnsw_config().get(collection_name, {})
+    for param in HNSW_PARAMS:
+        if param in config:
+            new_metadata[f'hnsw:{param}'] = config[param]
+    return new_metadata or None
+
+
+def get_hnsw_settings(collection):
+    # settings an existing chroma collection was built with, {space, M, construction_ef, search_ef}
+    hnsw = (getattr(collection, 'configuration_json', None) or {}).get('hnsw') or {}
+    if hnsw:
+        return {
+            'space': hnsw.get('space'),
+            'M': hnsw.get('max_neighbors'),
+            'construction_ef': hnsw.get('ef_construction'),
+            'search_ef': hnsw.get('ef_search'),
+        }
+    # older chroma versions only keep them in the metadata
+    metadata = collection.metadata or {}
+    return {param: metadata.get(f'hnsw:{param}') for param in HNSW_PARAMS}
+
+
+def invalidate_handles(db_path=None):
+    # drop cached client and collection handles of one DB path, or of all paths
+    with _HANDLE_LOCK:
+        for key in list(_COLLECTIONS.keys()):
+            if db_path is None or key[0] == db_path:
+                del _COLLECTIONS[key]
+        for path in list(_CLIENTS.keys()):
+            if db_path is None or path == db_path:
+                del _CLIENTS[path]
+
+    meta_db.close_connections(db_path)
+    embedding.close_cache(db_path)
+
+
+@contextmanager
+def open_db(db_path, group_id=None):
+    # switch the active DB (and group) for the duration of the block, only for the current thread or asyncio task, e.g.
+    # with db.open_db(path):
+    #     db.get_all_groups()
+    db_path_token = _DB_PATH_VAR.set(db_path)
+    group_id_token = _GROUP_ID_VAR.set(str(group_id)) if group_id is not None else None
+    try:
+        yield get_client(db_path)
+    finally:
+        if group_id_token is not None:
+            _GROUP_ID_VAR.reset(group_id_token)
+        _DB_PATH_VAR.reset(db_path_token)
 
-def get_group_id_by_tmp_file():
+
+@contextmanager
+def use_group(group_id):
+    # like open_db(), for the current group only
+    token = _GROUP_ID_VAR.set(str(group_id))
     try:
-        with open(GROUP_ID_TMP_FILE_PATH, 'r') as f:
-            group_id = f.read()
-        group_id = group_id.strip()
-    except:
-        group_id = ''
-    return group_id
+        yield
+    finally:
+        _GROUP_ID_VAR.reset(token)
+
+
+def get_current_group_id():
+    group_id = _GROUP_ID_VAR.get()
+    if group_id is None:
+        group_id = _GROUP_ID
+    if group_id is None:
+        group_id = os.environ.get(GROUP_ID_ENV, '')
+    return group_id.strip()
+
+
+def update_current_group_id(group_id):
+    global _GROUP_ID
+    _GROUP_ID = str(group_id)
+
+
+def reset_current_group_id():
+    global _GROUP_ID
+    _GROUP_ID = None
+
+
+def get_context_env(env=None):
+    # environment for a subprocess (python -m graphrag.index) that works on the active DB and group
+    env = dict(os.environ if env is None else env)
+    env[DB_PATH_ENV] = get_db_path()
+    group_id = get_current_group_id()
+    if group_id:
+        env[GROUP_ID_ENV] = group_id
+    else:
+        env.pop(GROUP_ID_ENV, None)
+    staging_file = get_staging_file()
+    if staging_file:
+        env[STAGING_FILE_ENV] = staging_file
+    else:
+        env.pop(STAGING_FILE_ENV, None)
+    return env
+
+
+def get_staging_dir(db_path=None):
+    return os.path.join(db_path or get_db_path(), STAGING_DIR_NAME)
+
+
+def get_staging_file():
+    return _STAGING_FILE_VAR.get() or os.environ.get(STAGING_FILE_ENV, '').strip() or None
+
+
+def reset_staging_file(staging_file):
+    # the current thread or task stops staging into staging_file
+    if _STAGING_FILE_VAR.get() == staging_file:
+        _STAGING_FILE_VAR.set(None)
+
+
+def begin_group_staging(group_id, stage):
+    # start an append-only log for the relationships / reports / summaries of one group and index stage.
+    # stage: e.g. 'graphrag' or 'raptor'. ids are allocated when rows are staged, so rows can refer
+    # to each other (e.g. summaries to their children) before they are committed.
+    # only the current thread or asyncio task stages into the log, so groups can be indexed concurrently
+    staging_dir = get_staging_dir()
+    os.makedirs(staging_dir, exist_ok=True)
+    staging_file = os.path.join(staging_dir, f'group_{group_id}_{stage}.jsonl')
+    if os.path.isfile(staging_file):
+        # left over from a run that never reached commit_group_staging()
+        discard_group_staging(staging_file)
+
+    _STAGING_FILE_VAR.set(staging_file)
+    return staging_file
+
+
+def stage_items(collection_name, documents, metadatas, embeddings=None):
+    # embeddings: vectors the caller already has (e.g. raptor), kept in the log so the commit does not embed them again
+    staging_file = get_staging_file()
+    new_ids = allocate_ids(get_collection(collection_name, create=True), len(documents))
+    item = {
+        'collection_name': collection_name,
+        'ids': new_ids,
+        'documents': documents,
+        'metadatas': metadatas,
+    }
+    if embeddings is not None:
+        item['embeddings'] = [archive.encode_embedding(vector) for vector in embeddings]
+    line = json.dumps(item)
+    with _STAGING_LOCK:
+        with open(staging_file, 'a') as f:
+            f.write(line + '\n')
+            f.flush()
+
+    return new_ids
+
+
+def read_staging_file(staging_file):
+    # ({collection_name: (ids, documents, metadatas, vectors)}, complete), new lines are read incrementally.
+    # complete is True if the log is marked complete (see commit_group_staging())
+    with _STAGING_LOCK:
+        state = read_new_staged_rows(staging_file)
+        return state['rows'], state['complete']
+
+
+def read_new_staged_rows(staging_file):
+    # call with _STAGING_LOCK held. the edge index of the staged relationships grows with the new lines
+    state = _STAGED_ROWS.setdefault(staging_file, {'offset': 0, 'rows': {}, 'edges': {}, 'embeddings': [], 'complete': False})
+    if not os.path.isfile(staging_file):
+        return state
+
+    with open(staging_file, 'r') as f:
+        f.seek(state['offset'])
+        while True:
+            line = f.readline()
+            if not line.endswith('\n'):
+                # nothing new, or a line that is still being written
+                break
+            state['offset'] += len(line.encode())
+            item = json.loads(line)
+            if item.get('complete'):
+                state['complete'] = True
+                continue
+            ids, documents, metadatas, vectors = state['rows'].setdefault(item['collection_name'], ([], [], [], []))
+            ids += item['ids']
+            documents += item['documents']
+            metadatas += item['metadatas']
+            if 'embeddings' in item:
+                vectors += [archive.decode_embedding(text) for text in item['embeddings']]
+            else:
+                vectors += [None] * len(item['ids'])
+            if item['collection_name'] == COLLECTION_RELATIONSHIP:
+                for metadata in item['metadatas']:
+                    source = get_entity_key(metadata.get('source_entity_name', ''))
+                    target = get_entity_key(metadata.get('target_entity_name', ''))
+                    for edge in {(source, target), (target, source)}:
+                        state['edges'].setdefault(edge, []).append(metadata.get('chunk_id', ''))
+    return state
+
+
+def get_staged_items(collection_name):
+    # (ids, documents, metadatas) staged in the active log
+    staging_file = get_staging_file()
+    if not staging_file:
+        return [], [], []
+    rows, _ = read_staging_file(staging_file)
+    ids, documents, metadatas, _ = rows.get(collection_name, ([], [], [], []))
+    # copies, the log may grow while the caller reads
+    return list(ids), list(documents), list(metadatas)
+
+
+def get_staged_chunk_ids_by_edge(edge_list):
+    # {edge: [chunk_id]} of the relationships in the active log, like meta_db.find_chunk_ids_by_edge()
+    staging_file = get_staging_file()
+    if not staging_file:
+        return {}
+    with _STAGING_LOCK:
+        edges = read_new_staged_rows(staging_file)['edges']
+        return {edge: list(edges[edge]) for edge in edge_list if edge in edges}
+
+
+def get_staged_relationship_embeddings():
+    # (embeddings, chunk ids) of the relationships in the active log, only the rows staged since the last call are embedded
+    staging_file = get_staging_file()
+    if not staging_file:
+        return np.zeros((0, 0)), []
+    with _STAGING_LOCK:
+        state = read_new_staged_rows(staging_file)
+        _, documents, metadatas, _ = state['rows'].get(COLLECTION_RELATIONSHIP, ([], [], [], []))
+        documents = list(documents)
+        chunk_id_list = [metadata.get('chunk_id', '') for metadata in metadatas]
+        num_embedded = len(state['embeddings'])
+    # embedded without the lock, other threads keep staging
+    new_embeddings = embed_texts(documents[num_embedded:]) if len(documents) > num_embedded else []
+    with _STAGING_LOCK:
+        embeddings = state['embeddings']
+        if len(embeddings) == num_embedded:
+            embeddings.extend(new_embeddings)
+        return np.array(embeddings[:len(chunk_id_list)]), chunk_id_list[:len(embeddings)]
+
+
+def commit_group_staging(staging_file=None):
+    # write all staged rows in batches and drop the log. the log is marked complete first and rows
+    # are upserted under their staged ids, so a commit that is interrupted is finished by recover_staging()
+    staging_file = staging_file or get_staging_file()
+    reset_staging_file(staging_file)
+    if not staging_file or not os.path.isfile(staging_file):
+        return {}
+
+    rows, complete = read_staging_file(staging_file)
+    if not complete:
+        with _STAGING_LOCK:
+            with open(staging_file, 'a') as f:
+                f.write(json.dumps({'complete': True}) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+    count_dict = {}
+    for collection_name, (ids, documents, metadatas, vectors) in rows.items():
+        collection = get_collection(collection_name, create=True)
+        # only the rows staged without their vectors are embedded
+        embeddings = list(vectors)
+        missing = [i for i, vector in enumerate(embeddings) if vector is None]
+        for i, vector in zip(missing, embed_texts([documents[i] for i in missing]) if missing else []):
+            embeddings[i] = vector
+        for start in range(0, len(ids), ADD_BATCH_SIZE):
+            end = start + ADD_BATCH_SIZE
+            collection.upsert(
+                documents=documents[start:end],
+                embeddings=embeddings[start:end],
+                metadatas=metadatas[start:end],
+                ids=ids[start:end]
+            )
+        update_side_index(collection, ids, documents, metadatas)
+        count_dict[collection_name] = len(ids)
+
+    remove_staging_file(staging_file)
+    return count_dict
 
 
-def update_group_id_tmp_file(group_id):
-    with open(GROUP_ID_TMP_FILE_PATH, 'w') as f:
-        f.write(group_id)
-        f.flush()
+def discard_group_staging(staging_file=None):
+    # drop staged rows, nothing was written to the collections. their ids are not reused
+    staging_file = staging_file or get_staging_file()
+    reset_staging_file(staging_file)
+    if staging_file:
+        remove_staging_file(staging_file)
 
 
-def rm_group_id_tmp_file():
-    if os.path.isfile(GROUP_ID_TMP_FILE_PATH):
-        os.remove(GROUP_ID_TMP_FILE_PATH)
+def remove_staging_file(staging_file):
+    with _STAGING_LOCK:
+        _STAGED_ROWS.pop(staging_file, None)
+        if os.path.isfile(staging_file):
+            os.remove(staging_file)
+
+
+def recover_staging():
+    # logs left over by a crashed run: finish commits that had started, discard the rest
+    staging_dir = get_staging_dir()
+    if not os.path.isdir(staging_dir):
+        return
+
+    for file_name in sorted(os.listdir(staging_dir)):
+        staging_file = os.path.join(staging_dir, file_name)
+        try:
+            _, complete = read_staging_file(staging_file)
+        except Exception as e:
+            print(f'Cannot read staging log {staging_file}: {e}')
+            complete = False
+
+        if complete:
+            print(f'Resuming commit of {file_name}:', commit_group_staging(staging_file))
+        else:
+            print(f'Discarding {file_name} of an unfinished index run.')
+            discard_group_staging(staging_file)
 
 
 def check_group_id(group_id):
     group_exist = False
-    for group in get_all_groups():
-        if group['group_id'] == str(group_id):
-            group_exist = True
-            break
+    try:
+        collection = get_collection(COLLECTION_GROUP)
+        group_exist = len(collection.get(ids=[str(group_id)], include=[])['ids']) > 0
+    except:
+        pass
     return group_exist
 
 
@@ -795,111 +1724,202 @@ def split_text_into_sub_chunks(denoised_text, min_num_tokens=300):
 def get_chunks_for_graphrag(text):
     paper_id = get_id(COLLECTION_PAPER, text)
     chunks = []
-    for chunk in get_all_chunks():
-        if chunk['paper_id'] == paper_id:
-            if len(chunk['sub_chunks']) > 0:
-                chunks += chunk['sub_chunks']
-            else:
-                chunks.append(chunk['chunk_content'])
+    for chunk in iter_all_chunks(include=('documents', 'metadatas'), where={'paper_id': paper_id}):
+        if len(chunk['sub_chunks']) > 0:
+            chunks += chunk['sub_chunks']
+        else:
+            chunks.append(chunk['chunk_content'])
     return chunks
 
 
 def get_ref_ids_for_group(group_id):
     group_id = str(group_id)
 
-    paper_id_list = []
-    for paper in get_all_papers():
-        if paper['group_id'] == group_id:
-            paper_id_list.append(paper['paper_id'])
-    paper_id_list = list(set(paper_id_list))
-
-    chunk_id_list = []
-    for chunk in get_all_chunks():
-        if chunk['paper_id'] in paper_id_list or chunk['group_id'] == group_id:
-            chunk_id_list.append(chunk['chunk_id'])
-    chunk_id_list = list(set(chunk_id_list))
-
-    report_id_list = []
-    for report in get_all_community_reports():
-        for chunk_id in report['chunk_id_list']:
-            if chunk_id in chunk_id_list:
-                report_id_list.append(report['report_id'])
-                break
-    report_id_list = list(set(report_id_list))
+    ensure_side_indexes()
 
-    summary_id_list = []
-    for summary in get_all_summary_chunks():
-        if summary['group_id'] == group_id:
-            summary_id_list.append(summary['summary_id'])
-    summary_id_list = list(set(summary_id_list))
+    return meta_db.get_ref_ids_for_group(get_db_path(), group_id)
 
-    relationship_id_list = []
-    for relationship in get_all_relationships():
-        if relationship['chunk_id'] in chunk_id_list:
-            relationship_id_list.append(relationship['relationship_id'])
-    relationship_id_list = list(set(relationship_id_list))
 
-    return paper_id_list, chunk_id_list, relationship_id_list, report_id_list, summary_id_list
+def filter_group_chunk_ids(group_id, chunk_id_list):
+    ensure_side_indexes()
+    return meta_db.filter_group_chunk_ids(get_db_path(), str(group_id), chunk_id_list)
 
 
-def count_ref_ids_for_group(group_id):
-    paper_id_list, chunk_id_list, relationship_id_list, report_id_list, summary_id_list = get_ref_ids_for_group(group_id)
+def count_ref_ids_for_group(group_id, ref_ids=None):
+    # ref_ids: result of get_ref_ids_for_group() if the caller already has it
+    # without ref_ids, only the counts are read from the side index
+    if ref_ids is None:
+        paper_count, chunk_count, relationship_count, report_count, summary_count = get_group_counts(group_id).values()
+    else:
+        paper_count, chunk_count, relationship_count, report_count, summary_count = [len(id_list) for id_list in ref_ids]
 
     group_name = get_group_name(group_id)
 
     print(f'Group ID: {group_id}, Group Name: {group_name}')
-    print('Number of paper:', len(paper_id_list))
-    print('Number of chunk:', len(chunk_id_list))
+    print('Number of paper:', paper_count)
+    print('Number of chunk:', chunk_count)
     print('GraphRAG:')
-    print('Number of relationship:', len(relationship_id_list))
-    print('Number of community report:', len(report_id_list))
+    print('Number of relationship:', relationship_count)
+    print('Number of community report:', report_count)
     print('Raptor:')
-    print('Number of summary:', len(summary_id_list))
+    print('Number of summary:', summary_count)
+
+
+def get_ids_where(collection_name, where):
+    # ids only, no documents / metadatas / embeddings are read
+    try:
+        collection = get_collection(collection_name)
+        ids = collection.get(where=where, include=[])['ids']
+    except:
+        ids = []
+    ids.sort(key=int)
+    return ids
+
+
+def get_ids_where_in(collection_name, field, values):
+    # where={field: {'$in': values}} in batches, to keep the filter small
+    ids = []
+    values = list(values)
+    for start in range(0, len(values), DELETE_BATCH_SIZE):
+        ids += get_ids_where(collection_name, {field: {'$in': values[start:start + DELETE_BATCH_SIZE]}})
+    ids = list(set(ids))
+    ids.sort(key=int)
+    return ids
 
 
 def delete_items(collection_name: str, ids: list):
     try:
-        client = chromadb.PersistentClient(path=get_db_path())
-        collection = client.get_collection(name=collection_name)
-        collection.delete(ids=ids)
+        collection = get_collection(collection_name)
+        for start in range(0, len(ids), DELETE_BATCH_SIZE):
+            batch = ids[start:start + DELETE_BATCH_SIZE]
+            collection.delete(ids=batch)
+            meta_db.delete_items(get_db_path(), collection_name, batch)
     except:
         pass
 
 
-def delete_group(group_id, del_graphrag=True, del_raptor=True):
-    group_id = str(group_id)
-    group_exist = False
-    for group in get_all_groups():
-        if group['group_id'] == group_id:
-            group_exist = True
-            break
+def copy_collection(src_db_path, dst_db_path, collection_name, batch_size=ADD_BATCH_SIZE):
+    # rows are copied with their stored embeddings, nothing is re-embedded
+    dst_collection = get_collection(collection_name, create=True, db_path=dst_db_path)
+
+    count = 0
+    ids, documents, metadatas, embeddings = [], [], [], []
+    with open_db(src_db_path):
+        for item_id, document, metadata, vector in iter_collection(collection_name, include=('documents', 'metadatas', 'embeddings')):
+            ids.append(item_id)
+            documents.append(document)
+            metadatas.append(metadata)
+            embeddings.append(vector)
+            if len(ids) >= batch_size:
+                dst_collection.add(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+                count += len(ids)
+                ids, documents, metadatas, embeddings = [], [], [], []
+
+    if ids:
+        dst_collection.add(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+        count += len(ids)
+
+    return count
+
+
+def compact_collection(collection_name):
+    # chroma only marks deleted vectors in the HNSW index, the index keeps its size and search
+    # still walks them. the collection is rebuilt by copying the remaining rows with their stored
+    # embeddings (nothing is re-embedded) into a new collection that takes over the name:
+    # 1. copy into <name>__compact  2. rename <name> to <name>__old  3. rename <name>__compact to <name>  4. drop <name>__old
+    # running it again after an interruption restores the original collection first
+    client = get_client()
+    if get_backend() == BACKEND_LANCEDB:
+        try:
+            get_collection(collection_name).compact()
+            return True
+        except:
+            return False
+
+    compact_name = collection_name + COMPACT_SUFFIX
+    old_name = collection_name + OLD_SUFFIX
+    invalidate_handles(get_db_path())
+
+    collection_name_list = [c if isinstance(c, str) else c.name for c in client.list_collections()]
+    if old_name in collection_name_list:
+        if collection_name in collection_name_list:
+            client.delete_collection(old_name)
+        else:
+            client.get_collection(old_name).modify(name=collection_name)
+    if compact_name in collection_name_list:
+        client.delete_collection(compact_name)
 
-    if not group_exist:
+    try:
+        collection = client.get_collection(collection_name)
+    except:
+        # collection does not exist
+        return False
+
+    # the new collection is built with the current HNSW settings
+    new_collection = client.create_collection(name=compact_name, metadata=get_hnsw_metadata(collection_name, collection.metadata))
+    ids, documents, metadatas, embeddings = [], [], [], []
+    for item_id, document, metadata, vector in iter_collection(collection_name, include=('documents', 'metadatas', 'embeddings')):
+        ids.append(item_id)
+        documents.append(document)
+        metadatas.append(metadata)
+        embeddings.append(vector)
+        if len(ids) >= ADD_BATCH_SIZE:
+            new_collection.add(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+            ids, documents, metadatas, embeddings = [], [], [], []
+    if ids:
+        new_collection.add(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+
+    collection.modify(name=old_name)
+    new_collection.modify(name=collection_name)
+    client.delete_collection(old_name)
+    invalidate_handles(get_db_path())
+
+    return True
+
+
+def delete_group(group_id, del_graphrag=True, del_raptor=True, dry_run=False, compact=True):
+    # the items of the group come from the side index, like every other group lookup.
+    # compact: rebuild the collections the rows were deleted from, which copies every remaining row.
+    # False leaves it to compact_vector_db.py, e.g. to compact a whole DB once after several deletes
+    group_id = str(group_id)
+    if not check_group_id(group_id):
         print(f'Group ID {group_id} does not exist.')
         return
 
     print(f'Group ID: {group_id}, Delete GraphRAG: {del_graphrag}, Delete Raptor: {del_raptor}')
     print('Before:')
-    count_ref_ids_for_group(group_id)
+    ref_ids = get_ref_ids_for_group(group_id)
+    count_ref_ids_for_group(group_id, ref_ids)
 
-    paper_id_list, chunk_id_list, relationship_id_list, report_id_list, summary_id_list = get_ref_ids_for_group(group_id)
+    if dry_run:
+        print('Dry run, nothing is deleted.')
+        return
+
+    paper_id_list, chunk_id_list, relationship_id_list, report_id_list, summary_id_list = ref_ids
 
+    delete_id_dict = {}
     if del_graphrag:
-        if relationship_id_list:
-            delete_items(COLLECTION_RELATIONSHIP, relationship_id_list)
-        if report_id_list:
-            delete_items(COLLECTION_COMMUNITY_REPORT, report_id_list)
+        delete_id_dict[COLLECTION_RELATIONSHIP] = relationship_id_list
+        delete_id_dict[COLLECTION_COMMUNITY_REPORT] = report_id_list
 
     if del_raptor:
-        if summary_id_list:
-            delete_items(COLLECTION_SUMMARY, summary_id_list)
+        delete_id_dict[COLLECTION_SUMMARY] = summary_id_list
 
     if del_graphrag and del_raptor:
-        delete_items(COLLECTION_GROUP, [group_id])
-        if paper_id_list:
-            delete_items(COLLECTION_PAPER, paper_id_list)
-        if chunk_id_list:
-            delete_items(COLLECTION_CHUNK, chunk_id_list)
+        delete_id_dict[COLLECTION_GROUP] = [group_id]
+        delete_id_dict[COLLECTION_PAPER] = paper_id_list
+        delete_id_dict[COLLECTION_CHUNK] = chunk_id_list
+
+    for collection_name, id_list in delete_id_dict.items():
+        if id_list:
+            delete_items(collection_name, id_list)
+
+    if compact:
+        for collection_name, id_list in delete_id_dict.items():
+            # the one group row is not worth a copy of the collection
+            if id_list and collection_name != COLLECTION_GROUP:
+                print(f'Compacting {collection_name} ...')
+                compact_collection(collection_name)
 
     print('After:')
     count_ref_ids_for_group(group_id)
@@ -916,7 +1936,7 @@ def get_group_name(group_id):
 
 def get_paper_name(paper_id, with_suffix=False):
     paper_name = ''
-    for paper in get_all_papers():
+    for paper in iter_all_papers():
         if paper['paper_id'] == str(paper_id):
             paper_name = paper['paper_name']
             break
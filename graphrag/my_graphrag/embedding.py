@@ -0,0 +1,115 @@
+import os
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+import graphrag.my_graphrag.embedding_cache as embedding_cache
+
+# one embedding model for the chroma collections (db.py) and the raptor clustering (raptor.py).
+# the default is chroma's own default model, so vectors stay comparable with existing DBs.
+# any sentence-transformers model name can be set instead, e.g.
+# RG_RAG_EMBEDDING_MODEL=sentence-transformers/multi-qa-mpnet-base-cos-v1
+# a DB must be queried with the model it was indexed with
+DEFAULT_EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+EMBEDDING_MODEL_NAME = os.environ.get('RG_RAG_EMBEDDING_MODEL', DEFAULT_EMBEDDING_MODEL_NAME)
+# texts per model call
+EMBEDDING_BATCH_SIZE = int(os.environ.get('RG_RAG_EMBEDDING_BATCH_SIZE', 64))
+# batches are encoded in parallel on a CPU thread pool
+EMBEDDING_THREADS = int(os.environ.get('RG_RAG_EMBEDDING_THREADS', min(4, os.cpu_count() or 1)))
+# set RG_RAG_EMBEDDING_CACHE=0 to always encode, see embedding_cache.py
+EMBEDDING_CACHE_ENABLED = os.environ.get('RG_RAG_EMBEDDING_CACHE', '1') != '0'
+
+_MODEL = None
+_EXECUTOR = None
+_LOCK = threading.Lock()
+
+
+def load_model(model_name):
+    from chromadb.utils import embedding_functions
+
+    if model_name == DEFAULT_EMBEDDING_MODEL_NAME:
+        return embedding_functions.DefaultEmbeddingFunction()
+    return embedding_functions.SentenceTransformerEmbeddingFunction(model_name=model_name)
+
+
+def get_model():
+    # loaded on first use, shared by all threads
+    global _MODEL
+    with _LOCK:
+        if _MODEL is None:
+            _MODEL = load_model(EMBEDDING_MODEL_NAME)
+        return _MODEL
+
+
+def get_executor():
+    global _EXECUTOR
+    with _LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(max_workers=EMBEDDING_THREADS, thread_name_prefix='embedding')
+        return _EXECUTOR
+
+
+def encode_batch(texts):
+    return [np.asarray(vector, dtype=np.float32) for vector in get_model()(list(texts))]
+
+
+def encode(texts):
+    texts = list(texts)
+    if not texts:
+        return []
+
+    batches = [texts[start:start + EMBEDDING_BATCH_SIZE] for start in range(0, len(texts), EMBEDDING_BATCH_SIZE)]
+    if len(batches) == 1 or EMBEDDING_THREADS <= 1:
+        return [vector for batch in batches for vector in encode_batch(batch)]
+
+    return [vector for vectors in get_executor().map(encode_batch, batches) for vector in vectors]
+
+
+def embed(texts, cache_path=None):
+    # [text] -> [np.ndarray], in input order.
+    # cache_path: DB directory of the embedding cache, only texts that are not cached are encoded
+    texts = list(texts)
+    if not texts:
+        return []
+
+    if not cache_path or not EMBEDDING_CACHE_ENABLED:
+        return encode(texts)
+
+    try:
+        hash_list = [embedding_cache.get_text_hash(text) for text in texts]
+        vector_dict = embedding_cache.get_vectors(cache_path, EMBEDDING_MODEL_NAME, hash_list)
+    except Exception as e:
+        print(f'Embedding cache is not available: {e}')
+        return encode(texts)
+
+    missing_text_dict = {}
+    for hash_value, text in zip(hash_list, texts):
+        if hash_value not in vector_dict:
+            missing_text_dict[hash_value] = text
+
+    new_vector_dict = {}
+    missing_hash_list = list(missing_text_dict.keys())
+    for hash_value, vector in zip(missing_hash_list, encode(missing_text_dict.values())):
+        # stored vectors are float16, new vectors are rounded the same way so hits and misses give the same results
+        new_vector_dict[hash_value] = embedding_cache.to_cache_vector(vector)
+    vector_dict.update(new_vector_dict)
+
+    try:
+        misses = len(missing_hash_list)
+        embedding_cache.put_vectors(cache_path, EMBEDDING_MODEL_NAME, new_vector_dict, len(texts) - misses, misses)
+    except Exception as e:
+        print(f'Embedding cache is not available: {e}')
+
+    return [vector_dict[hash_value] for hash_value in hash_list]
+
+
+def get_cache_stats(cache_path):
+    # (hits, misses) of the embedding cache in cache_path
+    try:
+        return embedding_cache.get_stats(cache_path, EMBEDDING_MODEL_NAME)
+    except:
+        return 0, 0
+
+
+def close_cache(cache_path=None):
+    embedding_cache.close_connections(cache_path)
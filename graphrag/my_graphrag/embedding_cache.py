@@ -0,0 +1,106 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+# content-addressed embedding cache kept next to chroma.sqlite3 in every DB directory,
+# separate from the side index so it can be deleted at any time
+CACHE_DB_FILE_NAME = 'rg_rag_embedding_cache.sqlite3'
+SQLITE_TIMEOUT = 60
+# stay below SQLite's max number of host parameters in one statement
+SQLITE_MAX_PARAMS = 900
+# vectors are stored as float16, half the size of float32 and precise enough for the vector search
+CACHE_DTYPE = np.float16
+
+# sqlite connections cannot be shared between threads, keep one per thread and DB path
+_LOCAL = threading.local()
+
+
+def get_cache_file(db_path):
+    return os.path.join(db_path, CACHE_DB_FILE_NAME)
+
+
+def get_connection(db_path):
+    connections = getattr(_LOCAL, 'connections', None)
+    if connections is None:
+        connections = {}
+        _LOCAL.connections = connections
+
+    conn = connections.get(db_path)
+    if conn is None:
+        os.makedirs(db_path, exist_ok=True)
+        conn = sqlite3.connect(get_cache_file(db_path), timeout=SQLITE_TIMEOUT, isolation_level=None)
+        init_tables(conn)
+        connections[db_path] = conn
+
+    return conn
+
+
+def close_connections(db_path=None):
+    # only the connections of the calling thread are closed
+    connections = getattr(_LOCAL, 'connections', {})
+    for path in list(connections.keys()):
+        if db_path is None or path == db_path:
+            connections.pop(path).close()
+
+
+def init_tables(conn):
+    # embedding
+    # hash: sha256 of the exact text, the vector depends on whitespace too
+    # vector: CACHE_DTYPE bytes
+    conn.execute('CREATE TABLE IF NOT EXISTS embedding (model_name TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, PRIMARY KEY (model_name, hash)) WITHOUT ROWID')
+
+    # stats
+    # cache hits and misses of all processes that used the DB, see get_stats()
+    conn.execute('CREATE TABLE IF NOT EXISTS stats (model_name TEXT PRIMARY KEY, hits INTEGER NOT NULL, misses INTEGER NOT NULL)')
+
+
+def get_text_hash(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def to_cache_vector(vector):
+    return np.asarray(vector, dtype=CACHE_DTYPE).astype(np.float32)
+
+
+def get_vectors(db_path, model_name, hash_list):
+    # {hash: vector} of the cached hashes
+    conn = get_connection(db_path)
+    vector_dict = {}
+    hash_list = list(set(hash_list))
+    for start in range(0, len(hash_list), SQLITE_MAX_PARAMS):
+        batch = hash_list[start:start + SQLITE_MAX_PARAMS]
+        placeholders = ','.join('?' * len(batch))
+        rows = conn.execute(
+            f'SELECT hash, vector FROM embedding WHERE model_name = ? AND hash IN ({placeholders})',
+            [model_name] + batch
+        ).fetchall()
+        for hash_value, vector in rows:
+            vector_dict[hash_value] = np.frombuffer(vector, dtype=CACHE_DTYPE).astype(np.float32)
+
+    return vector_dict
+
+
+def put_vectors(db_path, model_name, vector_dict, hits, misses):
+    # vector_dict: {hash: vector} of the new vectors, written together with the hit / miss counters
+    conn = get_connection(db_path)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.executemany(
+            'INSERT OR REPLACE INTO embedding (model_name, hash, vector) VALUES (?, ?, ?)',
+            [(model_name, hash_value, np.asarray(vector, dtype=CACHE_DTYPE).tobytes()) for hash_value, vector in vector_dict.items()]
+        )
+        conn.execute('INSERT OR IGNORE INTO stats (model_name, hits, misses) VALUES (?, 0, 0)', (model_name,))
+        conn.execute('UPDATE stats SET hits = hits + ?, misses = misses + ? WHERE model_name = ?', (hits, misses, model_name))
+    except:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+
+def get_stats(db_path, model_name):
+    # (hits, misses)
+    conn = get_connection(db_path)
+    row = conn.execute('SELECT hits, misses FROM stats WHERE model_name = ?', (model_name,)).fetchone()
+    return (row[0], row[1]) if row is not None else (0, 0)
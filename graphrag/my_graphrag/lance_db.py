@@ -0,0 +1,347 @@
+import os
+import json
+import lancedb
+import numpy as np
+import pyarrow as pa
+
+# LanceDB backend of db.py. LanceClient / LanceCollection implement the part of the chroma
+# client / collection API that db.py uses, so the rest of db.py does not depend on the backend.
+# metadata fields are typed Arrow columns, the JSON list fields of the chroma metadata are
+# native list<string> columns and converted back to JSON strings at the API boundary.
+
+# tables of one DB live in <db_path>/<LANCE_DIR_NAME>
+LANCE_DIR_NAME = 'lancedb'
+# metadata columns per collection, fields not listed here are kept in EXTRA_COLUMN as JSON
+LIST_FIELDS = ['sub_chunks', 'chunk_id_list', 'base_chunk_id_list', 'paper_id_list']
+COLLECTION_FIELDS = {
+    'group': [('group_name', pa.string())],
+    'paper': [('paper_name', pa.string()), ('group_id', pa.string()), ('hash', pa.string())],
+    'chunk': [('paper_id', pa.string()), ('group_id', pa.string()), ('denoising_chunk', pa.string()), ('sub_chunks', pa.list_(pa.string()))],
+    'relationship': [
+        ('source_entity_name', pa.string()),
+        ('target_entity_name', pa.string()),
+        ('relationship_description', pa.string()),
+        ('relationship_strength', pa.string()),
+        ('chunk_id', pa.string()),
+    ],
+    'community_report': [('chunk_id_list', pa.list_(pa.string())), ('group_id', pa.string())],
+    'summary': [
+        ('chunk_id_list', pa.list_(pa.string())),
+        ('from_base_chunk', pa.bool_()),
+        ('root_summary', pa.bool_()),
+        ('group_id', pa.string()),
+        ('base_chunk_id_list', pa.list_(pa.string())),
+        ('paper_id_list', pa.list_(pa.string())),
+    ],
+}
+ID_COLUMN = 'id'
+DOCUMENT_COLUMN = 'document'
+VECTOR_COLUMN = 'vector'
+EXTRA_COLUMN = 'extra_metadata'
+# same distance as chroma's default space, squared L2
+DISTANCE_TYPE = 'l2'
+# stay below the size of one IN (...) filter
+MAX_IDS_PER_FILTER = 500
+
+
+def get_lance_dir(db_path):
+    return os.path.join(db_path, LANCE_DIR_NAME)
+
+
+def get_schema(collection_name, dimension):
+    fields = [
+        pa.field(ID_COLUMN, pa.string()),
+        pa.field(DOCUMENT_COLUMN, pa.string()),
+        pa.field(VECTOR_COLUMN, pa.list_(pa.float32(), dimension)),
+    ]
+    for field_name, field_type in COLLECTION_FIELDS.get(collection_name, []):
+        fields.append(pa.field(field_name, field_type))
+    fields.append(pa.field(EXTRA_COLUMN, pa.string()))
+    return pa.schema(fields)
+
+
+def to_sql_value(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def to_sql_filter(collection_name, where):
+    # chroma where dict -> SQL filter, e.g. {'group_id': '1'}, {'paper_id': {'$in': [...]}}, {'$and': [...]}
+    operators = {'$eq': '=', '$ne': '!=', '$gt': '>', '$gte': '>=', '$lt': '<', '$lte': '<='}
+    column_names = [field_name for field_name, _ in COLLECTION_FIELDS.get(collection_name, [])]
+
+    clauses = []
+    for key, value in where.items():
+        if key in ('$and', '$or'):
+            joiner = ' AND ' if key == '$and' else ' OR '
+            clauses.append('(' + joiner.join(to_sql_filter(collection_name, w) for w in value) + ')')
+            continue
+
+        if key not in column_names:
+            raise ValueError(f'Cannot filter {collection_name} by "{key}"')
+        column = f'`{key}`'
+
+        if not isinstance(value, dict):
+            value = {'$eq': value}
+        for operator, operand in value.items():
+            if operator in ('$in', '$nin'):
+                if not operand:
+                    clauses.append('false' if operator == '$in' else 'true')
+                    continue
+                values = ', '.join(to_sql_value(v) for v in operand)
+                clauses.append(f'{column} {"IN" if operator == "$in" else "NOT IN"} ({values})')
+            elif operator in operators:
+                clauses.append(f'{column} {operators[operator]} {to_sql_value(operand)}')
+            else:
+                raise ValueError(f'Unsupported where operator "{operator}"')
+
+    return ' AND '.join(clauses) if clauses else 'true'
+
+
+def to_sql_id_filter(ids):
+    return f'{ID_COLUMN} IN ({", ".join(to_sql_value(i) for i in ids)})'
+
+
+class LanceCollection(object):
+    def __init__(self, client, name):
+        self._client = client
+        self.name = name
+        self.metadata = None
+
+    def _open_table(self):
+        # None until the first add, like an empty chroma collection
+        try:
+            return self._client.connection.open_table(self.name)
+        except Exception:
+            return None
+
+    def _to_rows(self, ids, documents, metadatas, embeddings):
+        column_names = [field_name for field_name, _ in COLLECTION_FIELDS.get(self.name, [])]
+        rows = []
+        for i in range(len(ids)):
+            metadata = dict(metadatas[i] or {}) if metadatas is not None else {}
+            row = {
+                ID_COLUMN: ids[i],
+                DOCUMENT_COLUMN: documents[i] if documents is not None else None,
+                VECTOR_COLUMN: np.asarray(embeddings[i], dtype=np.float32),
+            }
+            for field_name in column_names:
+                value = metadata.pop(field_name, None)
+                if field_name in LIST_FIELDS and isinstance(value, str):
+                    value = json.loads(value)
+                row[field_name] = value
+            row[EXTRA_COLUMN] = json.dumps(metadata) if metadata else None
+            rows.append(row)
+        return rows
+
+    def _to_metadata(self, row):
+        # None columns are left out, like keys that were never set in chroma
+        metadata = {}
+        for field_name, _ in COLLECTION_FIELDS.get(self.name, []):
+            value = row.get(field_name)
+            if value is None:
+                continue
+            metadata[field_name] = json.dumps(value) if field_name in LIST_FIELDS else value
+        if row.get(EXTRA_COLUMN):
+            metadata.update(json.loads(row[EXTRA_COLUMN]))
+        return metadata
+
+    def _get_columns(self, include):
+        columns = [ID_COLUMN]
+        if 'documents' in include:
+            columns.append(DOCUMENT_COLUMN)
+        if 'metadatas' in include:
+            columns += [field_name for field_name, _ in COLLECTION_FIELDS.get(self.name, [])] + [EXTRA_COLUMN]
+        if 'embeddings' in include:
+            columns.append(VECTOR_COLUMN)
+        return columns
+
+    def _to_result(self, rows, include):
+        result = {
+            'ids': [row[ID_COLUMN] for row in rows],
+            'documents': [row[DOCUMENT_COLUMN] for row in rows] if 'documents' in include else None,
+            'metadatas': [self._to_metadata(row) for row in rows] if 'metadatas' in include else None,
+            'embeddings': [np.asarray(row[VECTOR_COLUMN], dtype=np.float32) for row in rows] if 'embeddings' in include else None,
+        }
+        return result
+
+    def _search(self, table, where=None, ids=None, columns=None):
+        filters = []
+        if where:
+            filters.append(to_sql_filter(self.name, where))
+        if ids is not None:
+            filters.append(to_sql_id_filter(ids))
+        query = table.search()
+        if filters:
+            query = query.where(' AND '.join(filters))
+        if columns is not None:
+            query = query.select(columns)
+        return query.limit(None)
+
+    def count(self):
+        table = self._open_table()
+        return table.count_rows() if table is not None else 0
+
+    def add(self, ids, embeddings, documents=None, metadatas=None):
+        if embeddings is None:
+            raise ValueError('LanceCollection.add needs embeddings')
+        if not ids:
+            return
+
+        table = self._open_table()
+        if table is None:
+            table = self._client.connection.create_table(self.name, schema=get_schema(self.name, len(embeddings[0])))
+        table.add(pa.Table.from_pylist(self._to_rows(ids, documents, metadatas, embeddings), schema=table.schema))
+
+    def upsert(self, ids, embeddings, documents=None, metadatas=None):
+        # whole rows are replaced, unlike chroma no field is kept from the old row
+        self.delete(ids=ids)
+        self.add(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def get(self, ids=None, where=None, include=('documents', 'metadatas'), limit=None, offset=None):
+        table = self._open_table()
+        if table is None or (ids is not None and len(ids) == 0):
+            return self._to_result([], include)
+
+        rows = []
+        if ids is None:
+            rows = self._search(table, where, None, self._get_columns(include)).to_arrow().to_pylist()
+        else:
+            for start in range(0, len(ids), MAX_IDS_PER_FILTER):
+                batch = ids[start:start + MAX_IDS_PER_FILTER]
+                rows += self._search(table, where, batch, self._get_columns(include)).to_arrow().to_pylist()
+
+        start = offset or 0
+        rows = rows[start:] if limit is None else rows[start:start + limit]
+        return self._to_result(rows, include)
+
+    def scan(self, include=('metadatas',), where=None, limit=None, offset=0, batch_size=500):
+        # yield (id, document, metadata[, embedding]) in int id order, like db.iter_collection().
+        # rows are appended in id order, so the Arrow record batches are streamed as they are stored;
+        # only if the stored order differs (e.g. concurrent writers) the rows are read in id pages
+        table = self._open_table()
+        if table is None:
+            return
+
+        ids = self._search(table, where, None, [ID_COLUMN]).to_arrow()[ID_COLUMN].to_pylist()
+        int_ids = [int(i) for i in ids]
+        stored_in_id_order = all(int_ids[i] < int_ids[i + 1] for i in range(len(int_ids) - 1))
+
+        selected_ids = sorted(ids, key=int)
+        selected_ids = selected_ids[offset:] if limit is None else selected_ids[offset:offset + limit]
+        if not selected_ids:
+            return
+
+        if stored_in_id_order:
+            first_id, last_id = int(selected_ids[0]), int(selected_ids[-1])
+            reader = self._search(table, where, None, self._get_columns(include)).to_batches(batch_size)
+            for record_batch in reader:
+                rows = record_batch.to_pylist()
+                result = self._to_result(rows, include)
+                for i, item_id in enumerate(result['ids']):
+                    if int(item_id) < first_id:
+                        continue
+                    if int(item_id) > last_id:
+                        return
+                    yield self._to_item(result, i, include)
+            return
+
+        for start in range(0, len(selected_ids), batch_size):
+            page = selected_ids[start:start + batch_size]
+            result = self.get(ids=page, include=include)
+            position = {item_id: i for i, item_id in enumerate(result['ids'])}
+            for item_id in page:
+                if item_id in position:
+                    yield self._to_item(result, position[item_id], include)
+
+    def _to_item(self, result, i, include):
+        document = result['documents'][i] if 'documents' in include else None
+        metadata = result['metadatas'][i] if 'metadatas' in include else None
+        if 'embeddings' in include:
+            return result['ids'][i], document, metadata, result['embeddings'][i]
+        return result['ids'][i], document, metadata
+
+    def query(self, query_embeddings=None, n_results=10, where=None, include=('documents', 'metadatas', 'distances'), query_texts=None):
+        if query_embeddings is None:
+            raise ValueError('LanceCollection.query needs query_embeddings')
+
+        results = {'ids': [], 'documents': [], 'metadatas': [], 'embeddings': [], 'distances': []}
+        table = self._open_table()
+        for query_embedding in query_embeddings:
+            rows = []
+            if table is not None:
+                query = table.search(np.asarray(query_embedding, dtype=np.float32), vector_column_name=VECTOR_COLUMN).distance_type(DISTANCE_TYPE)
+                if where:
+                    query = query.where(to_sql_filter(self.name, where), prefilter=True)
+                rows = query.limit(n_results).to_arrow().to_pylist()
+
+            result = self._to_result(rows, include)
+            for key in ('ids', 'documents', 'metadatas', 'embeddings'):
+                results[key].append(result[key])
+            results['distances'].append([row['_distance'] for row in rows])
+
+        for key in ('documents', 'metadatas', 'embeddings', 'distances'):
+            if key not in include and key != 'ids':
+                results[key] = None
+        return results
+
+    def delete(self, ids=None, where=None):
+        table = self._open_table()
+        if table is None:
+            return
+        if ids is not None:
+            for start in range(0, len(ids), MAX_IDS_PER_FILTER):
+                table.delete(to_sql_id_filter(ids[start:start + MAX_IDS_PER_FILTER]))
+        elif where:
+            table.delete(to_sql_filter(self.name, where))
+
+    def compact(self):
+        # merge small fragments and drop deleted rows and old versions
+        table = self._open_table()
+        if table is not None:
+            table.optimize()
+
+
+class LanceClient(object):
+    def __init__(self, path):
+        os.makedirs(get_lance_dir(path), exist_ok=True)
+        self.path = path
+        self.connection = lancedb.connect(get_lance_dir(path))
+        # created by get_or_create_collection(), the table follows with the first add
+        self._pending_names = set()
+
+    def list_collections(self):
+        if not hasattr(self.connection, 'list_tables'):
+            # lancedb before list_tables()
+            return list(self.connection.table_names())
+
+        names = []
+        page_token = None
+        while True:
+            response = self.connection.list_tables(page_token=page_token)
+            names += list(response.tables)
+            page_token = response.page_token
+            if not page_token:
+                return names
+
+    def get_collection(self, name):
+        if name not in self.list_collections() and name not in self._pending_names:
+            raise ValueError(f'Collection {name} does not exist.')
+        return LanceCollection(self, name)
+
+    def get_or_create_collection(self, name, metadata=None):
+        self._pending_names.add(name)
+        return LanceCollection(self, name)
+
+    def create_collection(self, name, metadata=None):
+        if name in self.list_collections():
+            raise ValueError(f'Collection {name} already exists.')
+        return self.get_or_create_collection(name, metadata)
+
+    def delete_collection(self, name):
+        self._pending_names.discard(name)
+        if name in self.list_collections():
+            self.connection.drop_table(name)
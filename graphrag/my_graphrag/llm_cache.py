@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+# prompt -> response cache of cloud.py, shared by all DBs and processes (the graphrag subprocess too).
+# a re-run of an index after a crash or an unrelated change gets the finished LLM calls from here.
+# set RG_RAG_LLM_CACHE=0 to always call the LLM
+PRJ_DIR = os.path.join(Path(os.path.dirname(os.path.realpath(__file__))).parent.parent.absolute())
+LLM_CACHE_ENABLED = os.environ.get('RG_RAG_LLM_CACHE', '1') != '0'
+LLM_CACHE_FILE_PATH = os.environ.get('RG_RAG_LLM_CACHE_PATH', os.path.join(PRJ_DIR, './my_graphrag/rg_rag_llm_cache.sqlite3'))
+# least recently used responses are evicted above this size
+LLM_CACHE_MAX_BYTES = int(float(os.environ.get('RG_RAG_LLM_CACHE_MAX_MB', 1024)) * 1024 * 1024)
+# evict down to this share of the max size, so eviction does not run on every put
+EVICT_TARGET_RATIO = 0.9
+SQLITE_TIMEOUT = 60
+
+# sqlite connections cannot be shared between threads, keep one per thread
+_LOCAL = threading.local()
+
+
+def get_connection():
+    conn = getattr(_LOCAL, 'conn', None)
+    if conn is None:
+        os.makedirs(os.path.dirname(LLM_CACHE_FILE_PATH), exist_ok=True)
+        conn = sqlite3.connect(LLM_CACHE_FILE_PATH, timeout=SQLITE_TIMEOUT, isolation_level=None)
+        # readers do not wait for the writer of another process
+        conn.execute('PRAGMA journal_mode=WAL')
+        init_tables(conn)
+        _LOCAL.conn = conn
+    return conn
+
+
+def close_connection():
+    # only the connection of the calling thread is closed
+    conn = getattr(_LOCAL, 'conn', None)
+    if conn is not None:
+        conn.close()
+        _LOCAL.conn = None
+
+
+@contextmanager
+def transaction(conn):
+    # like meta_db.transaction(), a failed statement or COMMIT must not leave the
+    # connection of this thread in an open transaction
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+        conn.execute('COMMIT')
+    except:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+
+
+def init_tables(conn):
+    # response
+    # key: sha256 of the model, prompt and sampling params, see get_key()
+    # response: raw LLM output, before </think> is removed
+    # size: bytes of the response, for the size limit
+    # last_used: unix time of the last put or hit, for the LRU eviction
+    conn.execute('CREATE TABLE IF NOT EXISTS response (key TEXT PRIMARY KEY, model_name TEXT NOT NULL, response TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL) WITHOUT ROWID')
+    conn.execute('CREATE INDEX IF NOT EXISTS response_last_used ON response (last_used)')
+
+    # usage
+    # total size of all responses, kept up to date with every put and eviction
+    conn.execute('CREATE TABLE IF NOT EXISTS usage (id INTEGER PRIMARY KEY CHECK (id = 0), total_size INTEGER NOT NULL)')
+    conn.execute('INSERT OR IGNORE INTO usage (id, total_size) VALUES (0, 0)')
+
+    # stats
+    # cache hits and misses of all processes
+    conn.execute('CREATE TABLE IF NOT EXISTS stats (id INTEGER PRIMARY KEY CHECK (id = 0), hits INTEGER NOT NULL, misses INTEGER NOT NULL)')
+    conn.execute('INSERT OR IGNORE INTO stats (id, hits, misses) VALUES (0, 0, 0)')
+
+
+def get_key(model_name, prompt, params=None):
+    # params: sampling params of the request (temperature, max_tokens, ...), {} for the API defaults
+    key_text = json.dumps({'model': model_name, 'prompt': prompt, 'params': params or {}}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(key_text.encode()).hexdigest()
+
+
+def get(key):
+    # cached response or None, a hit refreshes its LRU time
+    if not LLM_CACHE_ENABLED:
+        return None
+    try:
+        conn = get_connection()
+        row = conn.execute('SELECT response FROM response WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            conn.execute('UPDATE stats SET misses = misses + 1 WHERE id = 0')
+            return None
+        with transaction(conn):
+            conn.execute('UPDATE response SET last_used = ? WHERE key = ?', (time.time(), key))
+            conn.execute('UPDATE stats SET hits = hits + 1 WHERE id = 0')
+        return row[0]
+    except Exception as e:
+        print(f'LLM cache is not available: {e}')
+        return None
+
+
+def put(key, model_name, response):
+    if not LLM_CACHE_ENABLED or not response:
+        return
+    try:
+        conn = get_connection()
+        size = len(response.encode())
+        with transaction(conn):
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO response (key, model_name, response, size, last_used) VALUES (?, ?, ?, ?, ?)',
+                (key, model_name, response, size, time.time())
+            )
+            if cursor.rowcount:
+                conn.execute('UPDATE usage SET total_size = total_size + ? WHERE id = 0', (size,))
+                evict(conn)
+    except Exception as e:
+        print(f'LLM cache is not available: {e}')
+
+
+def evict(conn):
+    # drop least recently used responses until the cache is below EVICT_TARGET_RATIO of the max size
+    total_size = conn.execute('SELECT total_size FROM usage WHERE id = 0').fetchone()[0]
+    if total_size <= LLM_CACHE_MAX_BYTES:
+        return
+
+    target_size = LLM_CACHE_MAX_BYTES * EVICT_TARGET_RATIO
+    evict_key_list = []
+    for key, size in conn.execute('SELECT key, size FROM response ORDER BY last_used'):
+        if total_size <= target_size:
+            break
+        evict_key_list.append((key,))
+        total_size -= size
+
+    conn.executemany('DELETE FROM response WHERE key = ?', evict_key_list)
+    conn.execute('UPDATE usage SET total_size = ? WHERE id = 0', (max(total_size, 0),))
+
+
+def get_stats():
+    # (hits, misses, number of responses, total size in bytes)
+    try:
+        conn = get_connection()
+        hits, misses = conn.execute('SELECT hits, misses FROM stats WHERE id = 0').fetchone()
+        count = conn.execute('SELECT COUNT(*) FROM response').fetchone()[0]
+        total_size = conn.execute('SELECT total_size FROM usage WHERE id = 0').fetchone()[0]
+        return hits, misses, count, total_size
+    except:
+        return 0, 0, 0, 0
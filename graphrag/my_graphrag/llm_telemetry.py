@@ -0,0 +1,162 @@
+import os
+import csv
+import json
+import time
+import threading
+import numpy as np
+
+# per-stage record of the LLM calls of cloud.py: latency, tokens, retries and errors.
+# an index run sets a calls file with begin_run(), the graphrag subprocesses inherit it through
+# RG_RAG_LLM_TELEMETRY_FILE and append their calls, write_summary() aggregates all of them
+STAGE_DENOISE = 'denoise'
+STAGE_EXTRACT = 'extract'
+STAGE_GLEAN = 'glean'
+STAGE_ENTITY_IDENTIFY = 'entity-identify'
+STAGE_SUMMARIZE = 'summarize'
+STAGE_COMMUNITY_REPORT = 'community-report'
+STAGE_RAPTOR_SUMMARY1 = 'raptor-summary1'
+STAGE_RAPTOR_SUMMARY2 = 'raptor-summary2'
+STAGE_RAPTOR_SUMMARY3 = 'raptor-summary3'
+STAGE_QUERY_STEP1 = 'query-step1'
+STAGE_QUERY_STEP2 = 'query-step2'
+STAGE_OTHER = 'other'
+
+TELEMETRY_FILE_ENV = 'RG_RAG_LLM_TELEMETRY_FILE'
+# USD per million tokens, for the cost columns
+PRICE_INPUT = float(os.environ.get('RG_RAG_LLM_PRICE_INPUT', 0))
+PRICE_OUTPUT = float(os.environ.get('RG_RAG_LLM_PRICE_OUTPUT', 0))
+# seconds between two lines of the live counter, 0 to turn it off
+LIVE_INTERVAL = float(os.environ.get('RG_RAG_LLM_TELEMETRY_INTERVAL', 30))
+PERCENTILES = [50, 90, 95, 99]
+
+_LOCK = threading.Lock()
+# {stage: [calls, cache hits, errors]} of this process, for the live counter
+_COUNTERS = {}
+_LAST_LIVE_TIME = time.monotonic()
+
+
+def begin_run(calls_file):
+    # calls of this process and its subprocesses are appended to calls_file
+    if os.path.isfile(calls_file):
+        os.remove(calls_file)
+    os.environ[TELEMETRY_FILE_ENV] = calls_file
+
+
+def end_run():
+    os.environ.pop(TELEMETRY_FILE_ENV, None)
+
+
+def get_cost(prompt_tokens, completion_tokens):
+    return ((prompt_tokens or 0) * PRICE_INPUT + (completion_tokens or 0) * PRICE_OUTPUT) / 1_000_000
+
+
+def record(stage, latency, prompt_tokens=None, completion_tokens=None, retries=0, error=None, cached=False):
+    # latency: seconds of the whole call, rate limiter waits and retries included
+    # prompt_tokens, completion_tokens: completion.usage of the response, None if the server does not send it
+    stage = stage or STAGE_OTHER
+    call = {
+        'stage': stage,
+        'time': time.time(),
+        'latency': latency,
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'retries': retries,
+        'error': f'{error.__class__.__name__}: {error}' if error is not None else None,
+        'cached': cached,
+    }
+    try:
+        with _LOCK:
+            counter = _COUNTERS.setdefault(stage, [0, 0, 0])
+            counter[0] += 1
+            counter[1] += int(cached)
+            counter[2] += int(error is not None)
+
+            calls_file = os.environ.get(TELEMETRY_FILE_ENV)
+            if calls_file:
+                # one short append per call, lines of other processes are not interleaved
+                with open(calls_file, 'a') as f:
+                    f.write(json.dumps(call) + '\n')
+
+            print_live()
+    except Exception as e:
+        print(f'Failed to record LLM call: {e}')
+
+
+def print_live():
+    global _LAST_LIVE_TIME
+    now = time.monotonic()
+    if LIVE_INTERVAL <= 0 or now - _LAST_LIVE_TIME < LIVE_INTERVAL:
+        return
+    _LAST_LIVE_TIME = now
+    print('LLM calls: ' + ', '.join(
+        f'{stage} {calls}' + (f' ({cached} cached)' if cached else '') + (f' ({errors} failed)' if errors else '')
+        for stage, (calls, cached, errors) in _COUNTERS.items()
+    ))
+
+
+def read_calls(calls_file):
+    calls = []
+    if not os.path.isfile(calls_file):
+        return calls
+    with open(calls_file, 'r') as f:
+        for line in f:
+            try:
+                calls.append(json.loads(line))
+            except:
+                # last line of a killed process
+                pass
+    return calls
+
+
+def summarize(calls):
+    # {stage: stats}, 'total' over all stages. latency percentiles are over the calls that reached the LLM
+    stage_calls = {}
+    for call in calls:
+        stage_calls.setdefault(call['stage'], []).append(call)
+    stage_calls['total'] = calls
+
+    summary = {}
+    for stage, call_list in stage_calls.items():
+        latencies = np.array([c['latency'] for c in call_list if not c['cached']])
+        prompt_tokens = sum(c['prompt_tokens'] or 0 for c in call_list)
+        completion_tokens = sum(c['completion_tokens'] or 0 for c in call_list)
+        stats = {
+            'calls': len(call_list),
+            'cache_hits': sum(1 for c in call_list if c['cached']),
+            'errors': sum(1 for c in call_list if c['error']),
+            'retries': sum(c['retries'] for c in call_list),
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'cost': get_cost(prompt_tokens, completion_tokens),
+            'latency_total': float(latencies.sum()) if len(latencies) else 0.0,
+        }
+        for p in PERCENTILES:
+            stats[f'latency_p{p}'] = float(np.percentile(latencies, p)) if len(latencies) else 0.0
+        stats['latency_max'] = float(latencies.max()) if len(latencies) else 0.0
+        summary[stage] = stats
+    return summary
+
+
+def write_summary(calls_file, json_path, csv_path):
+    summary = summarize(read_calls(calls_file))
+    with open(json_path, 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    columns = list(summary['total'].keys())
+    with open(csv_path, 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Stage'] + columns)
+        for stage, stats in summary.items():
+            writer.writerow([stage] + [stats[c] for c in columns])
+        f.flush()
+    return summary
+
+
+def print_summary(summary):
+    output_format = "{:<20}|{:>8}|{:>8}|{:>8}|{:>12}|{:>12}|{:>10}|{:>10}|{:>10}"
+    print(output_format.format('stage', 'calls', 'cached', 'errors', 'prompt tok', 'compl tok', 'p50 (s)', 'p95 (s)', 'cost'))
+    for stage, stats in summary.items():
+        print(output_format.format(
+            stage, stats['calls'], stats['cache_hits'], stats['errors'], stats['prompt_tokens'], stats['completion_tokens'],
+            '%.2f' % stats['latency_p50'], '%.2f' % stats['latency_p95'], '%.4f' % stats['cost'],
+        ))
@@ -0,0 +1,334 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+# side store kept next to chroma.sqlite3 in every DB directory
+META_DB_FILE_NAME = 'rg_rag_meta.sqlite3'
+SQLITE_TIMEOUT = 60
+# stay below SQLite's max number of host parameters in one statement
+SQLITE_MAX_PARAMS = 900
+# bump when the side index tables change, collections indexed with an older version are re-indexed
+SIDE_INDEX_VERSION = 3
+
+# papers of a group, params: (group_id,)
+GROUP_PAPERS_SQL = "SELECT item_id FROM member WHERE collection_name = 'paper' AND group_id = ?"
+# chunks of a group or of its papers, params: (group_id, group_id)
+GROUP_CHUNKS_SQL = f"SELECT item_id FROM member WHERE collection_name = 'chunk' AND (group_id = ? OR paper_id IN ({GROUP_PAPERS_SQL}))"
+# reports of a group, params: (group_id,)
+GROUP_REPORTS_SQL = "SELECT item_id FROM member WHERE collection_name = 'community_report' AND group_id = ?"
+
+# sqlite connections cannot be shared between threads, keep one per thread and DB path
+_LOCAL = threading.local()
+
+
+def get_meta_db_file(db_path):
+    return os.path.join(db_path, META_DB_FILE_NAME)
+
+
+def get_connection(db_path):
+    connections = getattr(_LOCAL, 'connections', None)
+    if connections is None:
+        connections = {}
+        _LOCAL.connections = connections
+
+    conn = connections.get(db_path)
+    if conn is None:
+        os.makedirs(db_path, exist_ok=True)
+        conn = sqlite3.connect(get_meta_db_file(db_path), timeout=SQLITE_TIMEOUT, isolation_level=None)
+        init_tables(conn)
+        connections[db_path] = conn
+
+    return conn
+
+
+def close_connections(db_path=None):
+    # only the connections of the calling thread are closed
+    connections = getattr(_LOCAL, 'connections', {})
+    for path in list(connections.keys()):
+        if db_path is None or path == db_path:
+            connections.pop(path).close()
+
+
+@contextmanager
+def transaction(db_path):
+    # BEGIN IMMEDIATE takes the write lock up front, so concurrent writers
+    # (e.g. index.py and the graphrag subprocess) are serialised by SQLite
+    conn = get_connection(db_path)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+
+def init_tables(conn):
+    # sequence
+    # collection_name: chroma collection name
+    # last_id: last id handed out for the collection
+    conn.execute('CREATE TABLE IF NOT EXISTS sequence (collection_name TEXT PRIMARY KEY, last_id INTEGER NOT NULL)')
+
+    # text_hash
+    # field: '' for the document, otherwise the metadata field the text comes from
+    # hash: sha256 of the text with all whitespace removed
+    # group_id: '' if the item has no group
+    conn.execute('CREATE TABLE IF NOT EXISTS text_hash (collection_name TEXT NOT NULL, field TEXT NOT NULL, hash TEXT NOT NULL, item_id TEXT NOT NULL, group_id TEXT NOT NULL, PRIMARY KEY (collection_name, field, hash, item_id))')
+
+    # member
+    # group / paper / chunk an item belongs to, '' if not applicable
+    # paper: group_id; chunk: group_id, paper_id; relationship: chunk_id; community_report, summary: group_id
+    conn.execute('CREATE TABLE IF NOT EXISTS member (collection_name TEXT NOT NULL, item_id TEXT NOT NULL, group_id TEXT NOT NULL, paper_id TEXT NOT NULL, chunk_id TEXT NOT NULL, PRIMARY KEY (collection_name, item_id))')
+    conn.execute('CREATE INDEX IF NOT EXISTS member_group_id ON member (collection_name, group_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS member_paper_id ON member (collection_name, paper_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS member_chunk_id ON member (collection_name, chunk_id)')
+
+    # report_chunk
+    # chunk_id_list of community reports
+    conn.execute('CREATE TABLE IF NOT EXISTS report_chunk (report_id TEXT NOT NULL, chunk_id TEXT NOT NULL, PRIMARY KEY (report_id, chunk_id))')
+    conn.execute('CREATE INDEX IF NOT EXISTS report_chunk_chunk_id ON report_chunk (chunk_id)')
+
+    # edge
+    # entity names of relationships, normalised like the graphrag graph nodes (see db.get_entity_key())
+    conn.execute('CREATE TABLE IF NOT EXISTS edge (relationship_id TEXT PRIMARY KEY, source TEXT NOT NULL, target TEXT NOT NULL, chunk_id TEXT NOT NULL)')
+    conn.execute('CREATE INDEX IF NOT EXISTS edge_source_target ON edge (source, target)')
+
+    # db_version
+    # bumped on every write to the side index, used to invalidate in-process caches
+    conn.execute('CREATE TABLE IF NOT EXISTS db_version (id INTEGER PRIMARY KEY CHECK (id = 0), version INTEGER NOT NULL)')
+    conn.execute('INSERT OR IGNORE INTO db_version (id, version) VALUES (0, 0)')
+
+    # indexed_collection
+    # collections whose rows were written to the side indexes, existing DBs are indexed on first use
+    # version: SIDE_INDEX_VERSION the collection was indexed with, older versions are re-indexed
+    conn.execute('CREATE TABLE IF NOT EXISTS indexed_collection (collection_name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 1)')
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(indexed_collection)').fetchall()]
+    if 'version' not in columns:
+        conn.execute('ALTER TABLE indexed_collection ADD COLUMN version INTEGER NOT NULL DEFAULT 1')
+
+
+def allocate_ids(db_path, collection_name, count, get_current_max_id):
+    # reserve a block of consecutive ids for the collection without reading it.
+    # the first call for a collection seeds the sequence from get_current_max_id(),
+    # so databases created before the sequence table existed continue from their max id.
+    if count <= 0:
+        return []
+
+    with transaction(db_path) as conn:
+        row = conn.execute('SELECT last_id FROM sequence WHERE collection_name = ?', (collection_name,)).fetchone()
+        last_id = row[0] if row is not None else int(get_current_max_id())
+        conn.execute(
+            'INSERT OR REPLACE INTO sequence (collection_name, last_id) VALUES (?, ?)',
+            (collection_name, last_id + count)
+        )
+
+    return [str(i) for i in range(last_id + 1, last_id + count + 1)]
+
+
+def is_collection_indexed(db_path, collection_name):
+    conn = get_connection(db_path)
+    row = conn.execute('SELECT version FROM indexed_collection WHERE collection_name = ?', (collection_name,)).fetchone()
+    return row is not None and row[0] >= SIDE_INDEX_VERSION
+
+
+def get_indexed_collections(db_path):
+    # names of the collections indexed with the current SIDE_INDEX_VERSION. read only: nothing is created
+    # or written, an empty set if the DB has no side index yet
+    meta_db_file = get_meta_db_file(db_path)
+    if not os.path.isfile(meta_db_file):
+        return set()
+
+    conn = sqlite3.connect(Path(meta_db_file).absolute().as_uri() + '?mode=ro', uri=True, timeout=SQLITE_TIMEOUT)
+    try:
+        rows = conn.execute('SELECT collection_name FROM indexed_collection WHERE version >= ?', (SIDE_INDEX_VERSION,)).fetchall()
+    except sqlite3.Error:
+        rows = []
+    finally:
+        conn.close()
+    return {row[0] for row in rows}
+
+
+def index_collection(db_path, collection_name, side_index_row_batches):
+    # full (re)build of the side indexes of one collection, one transaction per batch of side_index_rows.
+    # the collection counts as indexed after the last batch, a build that is interrupted starts over on next use
+    with transaction(db_path) as conn:
+        conn.execute('DELETE FROM indexed_collection WHERE collection_name = ?', (collection_name,))
+        _delete_collection_rows(conn, collection_name)
+        _bump_db_version(conn)
+
+    for side_index_rows in side_index_row_batches:
+        with transaction(db_path) as conn:
+            _insert_rows(conn, side_index_rows)
+
+    with transaction(db_path) as conn:
+        _bump_db_version(conn)
+        conn.execute(
+            'INSERT OR REPLACE INTO indexed_collection (collection_name, version) VALUES (?, ?)',
+            (collection_name, SIDE_INDEX_VERSION)
+        )
+
+
+def get_db_version(db_path):
+    conn = get_connection(db_path)
+    return conn.execute('SELECT version FROM db_version WHERE id = 0').fetchone()[0]
+
+
+def reset_index(db_path):
+    # forget all indexed collections, they are re-indexed on next use
+    with transaction(db_path) as conn:
+        conn.execute('DELETE FROM indexed_collection')
+
+
+def add_items(db_path, side_index_rows):
+    with transaction(db_path) as conn:
+        _insert_rows(conn, side_index_rows)
+        _bump_db_version(conn)
+
+
+def delete_items(db_path, collection_name, ids):
+    with transaction(db_path) as conn:
+        for batch in _batches(ids):
+            placeholders = ','.join('?' * len(batch))
+            conn.execute(f'DELETE FROM text_hash WHERE collection_name = ? AND item_id IN ({placeholders})', [collection_name] + batch)
+            conn.execute(f'DELETE FROM member WHERE collection_name = ? AND item_id IN ({placeholders})', [collection_name] + batch)
+            if collection_name == 'community_report':
+                conn.execute(f'DELETE FROM report_chunk WHERE report_id IN ({placeholders})', batch)
+            if collection_name == 'relationship':
+                conn.execute(f'DELETE FROM edge WHERE relationship_id IN ({placeholders})', batch)
+        _bump_db_version(conn)
+
+
+def find_id_by_text_hash(db_path, collection_name, field, hash_value, group_id=''):
+    # rows without a group match any group, like the scan in db.get_id()
+    conn = get_connection(db_path)
+    if group_id:
+        rows = conn.execute(
+            'SELECT item_id FROM text_hash WHERE collection_name = ? AND field = ? AND hash = ? AND group_id IN (?, \'\')',
+            (collection_name, field, hash_value, group_id)
+        ).fetchall()
+    else:
+        rows = conn.execute(
+            'SELECT item_id FROM text_hash WHERE collection_name = ? AND field = ? AND hash = ?',
+            (collection_name, field, hash_value)
+        ).fetchall()
+
+    if not rows:
+        return None
+
+    # the first item that was written wins
+    return min((row[0] for row in rows), key=int)
+
+
+def find_chunk_ids_by_edge(db_path, edge_list):
+    # edge_list: [(source, target)], graphrag graphs are undirected so both directions match
+    # returns {(source, target): [chunk_id]}, edges that are not found are left out
+    conn = get_connection(db_path)
+    chunk_id_dict = {}
+    for source, target in set(edge_list):
+        chunk_id_list = _select_ids(
+            conn,
+            'SELECT DISTINCT chunk_id FROM edge WHERE ((source = ? AND target = ?) OR (source = ? AND target = ?)) AND chunk_id != \'\'',
+            (source, target, target, source)
+        )
+        if chunk_id_list:
+            chunk_id_dict[(source, target)] = chunk_id_list
+
+    return chunk_id_dict
+
+
+def filter_group_chunk_ids(db_path, group_id, chunk_ids):
+    # chunk_ids that belong to the group, directly or through one of its papers
+    conn = get_connection(db_path)
+    chunk_ids = list(set(chunk_ids))
+    group_chunk_id_list = []
+    for batch in _batches(chunk_ids):
+        placeholders = ','.join('?' * len(batch))
+        group_chunk_id_list += _select_ids(
+            conn,
+            f'{GROUP_CHUNKS_SQL} AND item_id IN ({placeholders})',
+            [group_id, group_id] + batch
+        )
+
+    group_chunk_id_list.sort(key=int)
+    return group_chunk_id_list
+
+
+def get_ref_ids_for_group(db_path, group_id):
+    # keyed lookups on the membership tables, no chroma documents are read
+    conn = get_connection(db_path)
+    params = (group_id, group_id)
+
+    paper_id_list = _select_ids(conn, GROUP_PAPERS_SQL, (group_id,))
+    chunk_id_list = _select_ids(conn, GROUP_CHUNKS_SQL, params)
+    relationship_id_list = _select_ids(conn, f"SELECT item_id FROM member WHERE collection_name = 'relationship' AND chunk_id IN ({GROUP_CHUNKS_SQL})", params)
+    report_id_list = _select_ids(conn, GROUP_REPORTS_SQL, (group_id,))
+    summary_id_list = _select_ids(conn, "SELECT item_id FROM member WHERE collection_name = 'summary' AND group_id = ?", (group_id,))
+
+    return paper_id_list, chunk_id_list, relationship_id_list, report_id_list, summary_id_list
+
+
+def count_ref_ids_for_group(db_path, group_id):
+    # counts of the get_ref_ids_for_group() lists, nothing is loaded into memory
+    conn = get_connection(db_path)
+    params = (group_id, group_id)
+
+    def count(sql, sql_params):
+        return conn.execute(f'SELECT COUNT(*) FROM ({sql})', sql_params).fetchone()[0]
+
+    return (
+        count(GROUP_PAPERS_SQL, (group_id,)),
+        count(GROUP_CHUNKS_SQL, params),
+        count(f"SELECT item_id FROM member WHERE collection_name = 'relationship' AND chunk_id IN ({GROUP_CHUNKS_SQL})", params),
+        count(GROUP_REPORTS_SQL, (group_id,)),
+        count("SELECT item_id FROM member WHERE collection_name = 'summary' AND group_id = ?", (group_id,)),
+    )
+
+
+def _insert_rows(conn, side_index_rows):
+    # side_index_rows:
+    # text_hash: [(collection_name, field, hash, item_id, group_id)]
+    # member: [(collection_name, item_id, group_id, paper_id, chunk_id)]
+    # report_chunk: [(report_id, chunk_id)]
+    # edge: [(relationship_id, source, target, chunk_id)]
+    conn.executemany(
+        'INSERT OR IGNORE INTO text_hash (collection_name, field, hash, item_id, group_id) VALUES (?, ?, ?, ?, ?)',
+        side_index_rows.get('text_hash', [])
+    )
+    conn.executemany(
+        'INSERT OR REPLACE INTO member (collection_name, item_id, group_id, paper_id, chunk_id) VALUES (?, ?, ?, ?, ?)',
+        side_index_rows.get('member', [])
+    )
+    conn.executemany(
+        'INSERT OR IGNORE INTO report_chunk (report_id, chunk_id) VALUES (?, ?)',
+        side_index_rows.get('report_chunk', [])
+    )
+    conn.executemany(
+        'INSERT OR REPLACE INTO edge (relationship_id, source, target, chunk_id) VALUES (?, ?, ?, ?)',
+        side_index_rows.get('edge', [])
+    )
+
+
+def _delete_collection_rows(conn, collection_name):
+    conn.execute('DELETE FROM text_hash WHERE collection_name = ?', (collection_name,))
+    conn.execute('DELETE FROM member WHERE collection_name = ?', (collection_name,))
+    if collection_name == 'community_report':
+        conn.execute('DELETE FROM report_chunk')
+    if collection_name == 'relationship':
+        conn.execute('DELETE FROM edge')
+
+
+def _bump_db_version(conn):
+    conn.execute('UPDATE db_version SET version = version + 1 WHERE id = 0')
+
+
+def _select_ids(conn, sql, params):
+    ids = [row[0] for row in conn.execute(sql, params).fetchall()]
+    ids.sort(key=int)
+    return ids
+
+
+def _batches(ids):
+    for start in range(0, len(ids), SQLITE_MAX_PARAMS):
+        yield ids[start:start + SQLITE_MAX_PARAMS]
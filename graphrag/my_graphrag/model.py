@@ -1,4 +1,6 @@
 import os
+import time
+import asyncio
 import threading
 import requests
 from sglang.utils import (
@@ -8,6 +10,8 @@ from sglang.utils import (
 )
 from pathlib import Path
 
+import graphrag.my_graphrag.llm_telemetry as llm_telemetry
+
 
 PRJ_DIR = os.path.join(Path(os.path.dirname(os.path.realpath(__file__))).parent.parent.absolute())
 MODEL_DIR = os.path.join(PRJ_DIR, 'models')
@@ -108,8 +112,9 @@ def stop_sgl_server():
     remove_model_tmp_file()
 
 
-def get_response_from_sgl(prompt, remove_think=True):
+def get_response_from_sgl(prompt, remove_think=True, stage=''):
     output = ''
+    start = time.perf_counter()
     try:
         tmp_file_model_path = get_cur_model_path()
 
@@ -122,17 +127,33 @@ def get_response_from_sgl(prompt, remove_think=True):
                 "http://localhost:30000/v1/chat/completions",
                 json=data
             )
-            output = response.json()['choices'][0]['message']['content']
+            response_json = response.json()
+            output = response_json['choices'][0]['message']['content']
+            usage = response_json.get('usage') or {}
+            llm_telemetry.record(stage, time.perf_counter() - start, usage.get('prompt_tokens'), usage.get('completion_tokens'))
 
             if remove_think:
                 output = output.split('</think>')[-1].strip()
 
-    except:
+    except Exception as e:
+        llm_telemetry.record(stage, time.perf_counter() - start, error=e)
         print('Failed to get response from SGL server.')
 
     return output
 
 
+async def aget_response(prompt, remove_think=True, stage=''):
+    # same interface as cloud.aget_response(), the request runs in a worker thread
+    return await asyncio.to_thread(get_response_from_sgl, prompt, remove_think, stage)
+
+
+def stream_response(prompt, on_text, remove_think=True, stage=''):
+    # same interface as cloud.stream_response(), the local server answer is passed on in one piece
+    answer = get_response_from_sgl(prompt, remove_think, stage)
+    on_text(answer)
+    return answer, {}
+
+
 def update_model_tmp_file(cur_model_path):
     with open(MODEL_TMP_FILE_PATH, 'w') as f:
         f.write(cur_model_path)
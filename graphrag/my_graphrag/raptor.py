@@ -3,15 +3,12 @@ import csv
 import umap
 import numpy as np
 from datetime import datetime
-from sentence_transformers import SentenceTransformer
 from sklearn.mixture import GaussianMixture
 import graphrag.my_graphrag.db as db
 import graphrag.my_graphrag.cloud as model
+import graphrag.my_graphrag.llm_telemetry as llm_telemetry
 
 
-EMBEDDING_MODEL_NAME = 'sentence-transformers/multi-qa-mpnet-base-cos-v1'
-EMBEDDING_MODEL = SentenceTransformer(EMBEDDING_MODEL_NAME)
-
 RANDOM_SEED = 224
 random.seed(RANDOM_SEED)
 
@@ -40,13 +37,18 @@ PROMPT_SUMMARY3 = '''Please provide a concise and descriptive heading that captu
 
 
 class Chunk(object):
-    def __init__(self, text, index, children, group_id, from_base_chunk=False, root_summary=False):
+    def __init__(self, text, index, children, group_id, from_base_chunk=False, root_summary=False, base_chunk_ids=None, paper_ids=None, embedding=None):
         self.text = text
         self.index = index
         self.children = children
         self.group_id = group_id
         self.from_base_chunk = from_base_chunk
         self.root_summary = root_summary
+        # base chunks and papers below this chunk in the summary tree
+        self.base_chunk_ids = base_chunk_ids or []
+        self.paper_ids = paper_ids or []
+        # vector of text, shared with the summary collection
+        self.embedding = embedding
 
 
 def convert_chunk_list(chunk_list):
@@ -55,7 +57,7 @@ def convert_chunk_list(chunk_list):
     new_chunk_list = []
     for chunk in chunk_list:
         for sub_chunk in chunk['sub_chunks']:
-            new_chunk_list.append(Chunk(text=sub_chunk, index=chunk['chunk_id'], children=[], group_id=chunk['group_id']))
+            new_chunk_list.append(Chunk(text=sub_chunk, index=chunk['chunk_id'], children=[], group_id=chunk['group_id'], base_chunk_ids=[chunk['chunk_id']], paper_ids=[chunk['paper_id']]))
     return new_chunk_list
 
 
@@ -95,7 +97,11 @@ def GMM_cluster(embeddings: np.ndarray, threshold: float, random_state: int = 0)
 
 def split_chunks_into_clusters(chunks):
     try:
-        embeddings = np.array([EMBEDDING_MODEL.encode(chunk.text) for chunk in chunks])
+        # summaries already carry the vector they were saved with, only base chunks are encoded
+        missing_chunks = [chunk for chunk in chunks if chunk.embedding is None]
+        for chunk, vector in zip(missing_chunks, db.embed_texts([chunk.text for chunk in missing_chunks])):
+            chunk.embedding = vector
+        embeddings = np.array([chunk.embedding for chunk in chunks])
         reduced_embeddings = reduce_embeddings(embeddings)
 
         clusters, n_clusters = GMM_cluster(reduced_embeddings, threshold=0.1)
@@ -118,22 +124,26 @@ def gen_summary_chunks(chunks):
     for indices in clusters_list:
         context = ''
         children_idx = []
+        base_chunk_ids = set()
+        paper_ids = set()
         for idx in indices:
             child_chunk = chunks[idx]
             context += child_chunk.text + '\n\n'
             children_idx.append(child_chunk.index)
+            base_chunk_ids.update(child_chunk.base_chunk_ids)
+            paper_ids.update(child_chunk.paper_ids)
 
         # step 1: generate summary text
-        summary_text = model.get_response_from_sgl(PROMPT_SUMMARY1.format(text=context))
+        summary_text = model.get_response_from_sgl(PROMPT_SUMMARY1.format(text=context), stage=llm_telemetry.STAGE_RAPTOR_SUMMARY1)
 
         # step 2: review summary text
-        reviewed_summary_text = model.get_response_from_sgl(PROMPT_SUMMARY2.format(text=summary_text))
+        reviewed_summary_text = model.get_response_from_sgl(PROMPT_SUMMARY2.format(text=summary_text), stage=llm_telemetry.STAGE_RAPTOR_SUMMARY2)
 
         # step 3: add heading
-        heading = model.get_response_from_sgl(PROMPT_SUMMARY3.format(text=reviewed_summary_text))
+        heading = model.get_response_from_sgl(PROMPT_SUMMARY3.format(text=reviewed_summary_text), stage=llm_telemetry.STAGE_RAPTOR_SUMMARY3)
 
         summary = f'<heading>{heading}<\heading>\n{reviewed_summary_text}'
-        summary_chunks.append((summary, children_idx))
+        summary_chunks.append((summary, children_idx, sorted(base_chunk_ids, key=int), sorted(paper_ids, key=int)))
 
     return summary_chunks
 
@@ -141,7 +151,9 @@ def gen_summary_chunks(chunks):
 def raptor_index(new_paper_id_list, log_path):
     summary_max_times = 5
 
-    chunk_list = [chunk for chunk in db.get_all_chunks() if chunk['paper_id'] in new_paper_id_list]
+    chunk_list = []
+    if len(new_paper_id_list) > 0:
+        chunk_list = list(db.iter_all_chunks(where={'paper_id': {'$in': list(new_paper_id_list)}}))
     chunk_list = convert_chunk_list(chunk_list)
 
     chunk_dict = {}
@@ -151,8 +163,8 @@ def raptor_index(new_paper_id_list, log_path):
             chunk_dict[group_id] = []
         chunk_dict[group_id].append(chunk)
 
-    group_list = db.get_all_groups()
-    paper_list = db.get_all_papers()
+    group_list = list(db.iter_all_groups())
+    paper_list = list(db.iter_all_papers())
 
     for group_id, group_chunk_list in chunk_dict.items():
         start_time_one_group = datetime.now()
@@ -180,6 +192,8 @@ def raptor_index(new_paper_id_list, log_path):
             writer.writerow(['Index type', 'Raptor'])
             f.flush()
 
+        # all summaries of the group are written in one batch, a crashed run leaves no partial tree
+        staging_file = db.begin_group_staging(group_id, 'raptor')
         chunks = group_chunk_list
         for i in range(summary_max_times):
             summary_chunks = gen_summary_chunks(chunks)
@@ -187,15 +201,20 @@ def raptor_index(new_paper_id_list, log_path):
             from_base_chunk = i == 0
             root_summary = len(summary_chunks) == 1 or i == summary_max_times - 1
 
+            summary_chunks = [(summary, list(set(children_idx)), base_chunk_ids, paper_ids) for summary, children_idx, base_chunk_ids, paper_ids in summary_chunks]
+            # embedded once, for the summary collection and the clustering of the next level
+            summary_embeddings = db.embed_texts([summary for summary, _, _, _ in summary_chunks])
+            summary_id_list = db.save_new_summaries(summary_chunks, from_base_chunk, root_summary, group_id, summary_embeddings)
+
             chunks = []
-            for summary, children_idx in summary_chunks:
-                children_idx = list(set(children_idx))
-                summary_id = db.save_new_summary(summary, children_idx, from_base_chunk, root_summary, group_id)
-                chunks.append(Chunk(summary, summary_id, children_idx, group_id, from_base_chunk, root_summary))
+            for (summary, children_idx, base_chunk_ids, paper_ids), summary_id, summary_embedding in zip(summary_chunks, summary_id_list, summary_embeddings):
+                chunks.append(Chunk(summary, summary_id, children_idx, group_id, from_base_chunk, root_summary, base_chunk_ids, paper_ids, summary_embedding))
 
             if root_summary:
                 break
 
+        db.commit_group_staging(staging_file)
+
         end_time_one_group = datetime.now()
         with open(log_path, 'a') as f:
             writer = csv.writer(f)
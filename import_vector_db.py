@@ -0,0 +1,82 @@
+import argparse
+import os
+import graphrag.my_graphrag.db as db
+import graphrag.my_graphrag.archive as archive
+import graphrag.my_graphrag.embedding as embedding
+from datetime import datetime
+
+
+def import_archive(archive_path, batch_size):
+    # rows are added in batches with their archived embeddings, nothing is re-embedded
+    count_dict = {}
+    batch_dict = {}
+
+    def add_batch(collection_name):
+        ids, documents, metadatas, embeddings = batch_dict.pop(collection_name)
+        db.get_collection(collection_name, create=True).add(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+        count_dict[collection_name] = count_dict.get(collection_name, 0) + len(ids)
+
+    with archive.open_archive(archive_path, 'r') as f:
+        header, rows = archive.read_archive(f)
+        if header.get('embedding_model') != embedding.EMBEDDING_MODEL_NAME:
+            print(f'Warning: the archive was embedded with "{header.get("embedding_model")}", this DB is queried with "{embedding.EMBEDDING_MODEL_NAME}".')
+
+        for collection_name, item_id, document, metadata, vector in rows:
+            ids, documents, metadatas, embeddings = batch_dict.setdefault(collection_name, ([], [], [], []))
+            ids.append(item_id)
+            documents.append(document)
+            metadatas.append(metadata)
+            embeddings.append(vector)
+            if len(ids) >= batch_size:
+                add_batch(collection_name)
+
+    for collection_name in list(batch_dict.keys()):
+        add_batch(collection_name)
+
+    return count_dict
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Restore a DB from an archive of export_vector_db.py --format archive")
+    parser.add_argument("archive_path")
+    parser.add_argument("db_path")
+    parser.add_argument(
+        '--backend',
+        type=str,
+        default=db.BACKEND_CHROMA,
+        choices=[db.BACKEND_CHROMA, db.BACKEND_LANCEDB],
+        help=f'Storage backend of the new DB. Default is "{db.BACKEND_CHROMA}".'
+    )
+    parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=db.ADD_BATCH_SIZE,
+        help=f'Rows per write. Default is {db.ADD_BATCH_SIZE}.'
+    )
+    args = parser.parse_args()
+    archive_path = args.archive_path
+    db_path = args.db_path
+
+    if not os.path.isfile(archive_path):
+        print(f'Archive "{archive_path}" does not exist.')
+        return None
+
+    if os.path.isdir(db_path) and len(os.listdir(db_path)) > 0:
+        print(f'Database path "{db_path}" is not empty.')
+        return None
+
+    print(f'Importing "{archive_path}" to "{db_path}" ({args.backend}) ...')
+    start = datetime.now()
+
+    db.init_db(db_path, args.backend)
+    with db.open_db(db_path):
+        count_dict = import_archive(archive_path, args.batch_size)
+        # id sequences start from the max id, the side index is built with one scan per collection
+        db.ensure_side_indexes()
+
+    db.invalidate_handles()
+    print(f'Imported {count_dict} in {datetime.now() - start}')
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,8 @@ import csv
 from datetime import datetime
 import graphrag.my_graphrag.db as db
 import graphrag.my_graphrag.cloud as model
+import graphrag.my_graphrag.llm_telemetry as llm_telemetry
+import graphrag.my_graphrag.llm_cache as llm_cache
 from graphrag.my_graphrag.raptor import raptor_index
 
 
@@ -36,10 +38,12 @@ e.g.
 '''
 
 
-def get_denoising_chunk(original_chunk, group_chunk_idx, denoising_group_dir=''):
-    prompt = DENOISING_PROMPT.format(input_text=original_chunk)
+def get_denoising_chunk(original_chunk):
+    return model.get_response_from_sgl(DENOISING_PROMPT.format(input_text=original_chunk), stage=llm_telemetry.STAGE_DENOISE)
+
 
-    output = model.get_response_from_sgl(prompt)
+def export_denoising_prompt(original_chunk, output, group_chunk_idx, denoising_group_dir=''):
+    prompt = DENOISING_PROMPT.format(input_text=original_chunk)
 
     if denoising_group_dir and os.path.isdir(denoising_group_dir):
         # export input and output
@@ -53,15 +57,13 @@ def get_denoising_chunk(original_chunk, group_chunk_idx, denoising_group_dir='')
             f.write(output)
             f.flush()
 
-    return output
-
 
-def save_group_and_paper(export_prompts):
+def save_group_and_paper(export_prompts, dedup_across_groups=False):
     # use llama for denoise
     model.start_sgl_server_llama()
 
     cur_group_list = db.get_all_groups()
-    cur_paper_list = db.get_all_papers()
+    cur_paper_list = list(db.iter_all_papers())
 
     new_paper_list_list_graphrag = []
     new_paper_list_list_raptor = []
@@ -110,12 +112,25 @@ def save_group_and_paper(export_prompts):
                 shutil.rmtree(denoising_group_dir)
             os.mkdir(denoising_group_dir)
 
-        new_paper_list = []
+        paper_id_list = []
+        paper_txt_file_list = []
+        new_paper_idx_list = []
+        new_paper_content_list = []
+        new_paper_name_list = []
+        new_paper_denoising_chunk_list = []
+        # content hash of the files kept so far, copies of a file in the group are indexed once
+        paper_hash_dict = {}
         for txt_file_path in txt_file_list:
             with open(txt_file_path, 'r') as txtf:
                 paper_content = txtf.read()
             paper_name = os.path.basename(txt_file_path)
 
+            hash_value = db.get_text_hash(paper_content)
+            if hash_value and hash_value in paper_hash_dict:
+                print(f'Skip {paper_name}, same content as {paper_hash_dict[hash_value]}.')
+                continue
+            paper_hash_dict[hash_value] = paper_name
+
             paper_id = None
             if existing_group_id is not None:
                 for cur_paper in cur_paper_list:
@@ -123,12 +138,50 @@ def save_group_and_paper(export_prompts):
                         paper_id = cur_paper['paper_id']
                         break
 
+                if paper_id is None:
+                    # renamed file
+                    paper_id = db.find_paper_id_by_content(paper_content, existing_group_id)
+                    if paper_id is not None:
+                        print(f'Reuse document {paper_id} of group {existing_group_id} for {paper_name}, same content.')
+
             if paper_id is None:
-                paper_id = db.save_new_paper(paper_content, paper_name, group_id)
-                chunk = paper_content
-                denoising_chunk = get_denoising_chunk(chunk, f'{paper_id}', denoising_group_dir)
-                db.save_new_chunk(chunk, paper_id, group_id, denoising_chunk=denoising_chunk)
+                # the paper is new in this group, a copy in another group still saves the denoising
+                denoising_chunk = None
+                if dedup_across_groups:
+                    same_paper_id = db.find_paper_id_by_content(paper_content)
+                    if same_paper_id is not None:
+                        denoising_chunk = db.get_denoising_chunk_of_paper(same_paper_id)
+                        if denoising_chunk is not None:
+                            print(f'Reuse the denoised chunk of document {same_paper_id} for {paper_name}, same content.')
+
+                new_paper_idx_list.append(len(paper_id_list))
+                new_paper_content_list.append(paper_content)
+                new_paper_name_list.append(paper_name)
+                new_paper_denoising_chunk_list.append(denoising_chunk)
+
+            paper_id_list.append(paper_id)
+            paper_txt_file_list.append(txt_file_path)
+
+        # denoise first, papers are only saved together with their chunks.
+        # a paper without a chunk would be reused by the next run and never be indexed
+        denoising_chunk_list = [
+            get_denoising_chunk(chunk) if denoising_chunk is None else denoising_chunk
+            for chunk, denoising_chunk in zip(new_paper_content_list, new_paper_denoising_chunk_list)
+        ]
+
+        # save new papers and their chunks in one batch each
+        new_paper_id_list = db.save_new_papers(new_paper_content_list, new_paper_name_list, group_id)
+        db.save_new_chunks(new_paper_content_list, new_paper_id_list, group_id, denoising_chunk_list=denoising_chunk_list)
+
+        for paper_id, chunk, denoising_chunk, reused_chunk in zip(new_paper_id_list, new_paper_content_list, denoising_chunk_list, new_paper_denoising_chunk_list):
+            if reused_chunk is None:
+                export_denoising_prompt(chunk, denoising_chunk, f'{paper_id}', denoising_group_dir)
+
+        for idx, paper_id in zip(new_paper_idx_list, new_paper_id_list):
+            paper_id_list[idx] = paper_id
 
+        new_paper_list = []
+        for txt_file_path, paper_id in zip(paper_txt_file_list, paper_id_list):
             new_paper_list.append(
                 {
                     'txt_path': txt_file_path,
@@ -221,6 +274,27 @@ def process_arguments():
         help='Choose which part you want to delete in the group.'
     )
 
+    parser.add_argument(
+        '--dry_run',
+        type=lambda x: x.lower() == 'true',
+        default=False,
+        help='If True, only print what "--del_group" would delete. Default is False.'
+    )
+
+    parser.add_argument(
+        '--compact',
+        type=lambda x: x.lower() == 'true',
+        default=True,
+        help='If True, "--del_group" rebuilds the collections it deleted from afterwards, which copies all their remaining rows. False leaves it to compact_vector_db.py. Default is True.'
+    )
+
+    parser.add_argument(
+        '--dedup_across_groups',
+        type=lambda x: x.lower() == 'true',
+        default=False,
+        help='If True, a new document with the same content as a document of another group reuses its denoised chunk. Default is False.'
+    )
+
     parser.add_argument(
         '--export_prompts',
         type=lambda x: x.lower() == 'true',
@@ -256,7 +330,7 @@ def process_arguments():
             del_graphrag = True
             del_raptor = True
 
-        db.delete_group(str(args.del_group), del_graphrag, del_raptor)
+        db.delete_group(str(args.del_group), del_graphrag, del_raptor, dry_run=args.dry_run, compact=args.compact)
         return None
 
     return args
@@ -265,16 +339,19 @@ def process_arguments():
 def main():
     start_time = datetime.now()
 
-    db.rm_db_tmp_file()
+    db.reset_db_path()
 
     args = process_arguments()
     if args is None:
-        db.rm_db_tmp_file()
+        db.reset_db_path()
         return
 
     if not check_config_example_dir():
         return
 
+    # staging logs of a crashed run, the groups they belong to are indexed again below
+    db.recover_staging()
+
     model.remove_model_tmp_file()
     model.check_model_dir()
 
@@ -296,13 +373,20 @@ def main():
     os.makedirs(db_output_graphrag_output_dir, exist_ok=True)
 
     log_path = os.path.join(db_output_dir, 'index_log_%s.csv' % (start_time.strftime('%Y-%m-%d-%H-%M-%S')))
+    # every LLM call of this run, the graphrag subprocesses included, summarized per stage at the end
+    llm_calls_path = os.path.join(db_output_dir, 'index_llm_calls_%s.jsonl' % (start_time.strftime('%Y-%m-%d-%H-%M-%S')))
+    llm_telemetry.begin_run(llm_calls_path)
+    # counters of the embedding cache, shared with the graphrag subprocesses through the DB directory
+    start_embedding_cache_hits, start_embedding_cache_misses = db.get_embedding_cache_stats()
+    # LLM response cache, shared by all processes
+    start_llm_cache_hits, start_llm_cache_misses, _, _ = llm_cache.get_stats()
 
     if args.export_prompts:
         if os.path.isdir(DENOISING_PROMPT_DIR):
             shutil.rmtree(DENOISING_PROMPT_DIR)
         os.mkdir(DENOISING_PROMPT_DIR)
 
-    new_paper_list_list_graphrag, new_paper_list_list_raptor = save_group_and_paper(args.export_prompts)
+    new_paper_list_list_graphrag, new_paper_list_list_raptor = save_group_and_paper(args.export_prompts, args.dedup_across_groups)
 
     start_time_graphrag = datetime.now()
     if args.graphrag:
@@ -345,12 +429,21 @@ def main():
                 writer.writerow(['Index type', 'GraphRAG'])
                 f.flush()
 
-            db.update_group_id_tmp_file(group_id)
+            db.update_current_group_id(group_id)
+            # relationships and reports of the group are written in one batch after graphrag succeeded
+            staging_file = db.begin_group_staging(group_id, 'graphrag')
 
             # python -m graphrag.index --root ./ragtest
-            p = subprocess.Popen(['python', '-m', 'graphrag.index', '--root', TMP_CONFIG_DIR])
+            # the subprocess gets the DB path, group id and staging log through its environment
+            p = subprocess.Popen(['python', '-m', 'graphrag.index', '--root', TMP_CONFIG_DIR], env=db.get_context_env())
             p.wait()
 
+            if p.returncode == 0:
+                print(f'Committed group {group_id}:', db.commit_group_staging(staging_file))
+            else:
+                print(f'GraphRAG index of group {group_id} failed, discarding its relationships and reports.')
+                db.discard_group_staging(staging_file)
+
             end_time_one_group = datetime.now()
 
             if os.path.isdir(TMP_CONFIG_DIR):
@@ -376,7 +469,7 @@ def main():
                 writer.writerow(['End time', end_time_one_group.strftime('%Y-%m-%d-%H-%M-%S')])
                 f.flush()
 
-            db.rm_group_id_tmp_file()
+            db.reset_current_group_id()
 
         model.stop_sgl_server()
 
@@ -399,9 +492,40 @@ def main():
     print('raptor run time:', end_time_raptor - end_time_graphrag)
     print('run time:', end_time_raptor - start_time)
 
+    embedding_cache_hits, embedding_cache_misses = db.get_embedding_cache_stats()
+    embedding_cache_hits -= start_embedding_cache_hits
+    embedding_cache_misses -= start_embedding_cache_misses
+    embedding_cache_total = embedding_cache_hits + embedding_cache_misses
+    embedding_cache_hit_rate = embedding_cache_hits / embedding_cache_total if embedding_cache_total else 0
+    print(f'embedding cache: {embedding_cache_hits} hits, {embedding_cache_misses} misses, hit rate {embedding_cache_hit_rate:.1%}')
+    with open(log_path, 'a') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Embedding cache hits', embedding_cache_hits])
+        writer.writerow(['Embedding cache misses', embedding_cache_misses])
+        writer.writerow(['Embedding cache hit rate', f'{embedding_cache_hit_rate:.1%}'])
+        f.flush()
+
+    llm_cache_hits, llm_cache_misses, llm_cache_count, llm_cache_size = llm_cache.get_stats()
+    llm_cache_hits -= start_llm_cache_hits
+    llm_cache_misses -= start_llm_cache_misses
+    print(f'LLM cache: {llm_cache_hits} hits, {llm_cache_misses} misses, {llm_cache_count} responses, {llm_cache_size / 1024 ** 2:.1f} MB')
+    with open(log_path, 'a') as f:
+        writer = csv.writer(f)
+        writer.writerow(['LLM cache hits', llm_cache_hits])
+        writer.writerow(['LLM cache misses', llm_cache_misses])
+        f.flush()
+
+    llm_summary = llm_telemetry.write_summary(
+        llm_calls_path,
+        os.path.join(db_output_dir, 'index_llm_%s.json' % (start_time.strftime('%Y-%m-%d-%H-%M-%S'))),
+        os.path.join(db_output_dir, 'index_llm_%s.csv' % (start_time.strftime('%Y-%m-%d-%H-%M-%S'))),
+    )
+    llm_telemetry.end_run()
+    llm_telemetry.print_summary(llm_summary)
+
     db.count_all_collection()
 
-    db.rm_db_tmp_file()
+    db.reset_db_path()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,72 @@
+import argparse
+import os
+import sqlite3
+import graphrag.my_graphrag.db as db
+import graphrag.my_graphrag.meta_db as meta_db
+import graphrag.my_graphrag.embedding_cache as embedding_cache
+from datetime import datetime
+
+
+def copy_sqlite_file(src_file, dst_file):
+    # sqlite backup API, safe while another process is writing
+    if not os.path.isfile(src_file):
+        return
+    src_conn = sqlite3.connect(src_file)
+    dst_conn = sqlite3.connect(dst_file)
+    try:
+        src_conn.backup(dst_conn)
+    finally:
+        dst_conn.close()
+        src_conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy a vector DB into a new DB with another storage backend")
+    parser.add_argument("src_db_path")
+    parser.add_argument("dst_db_path")
+    parser.add_argument(
+        '--backend',
+        type=str,
+        default=db.BACKEND_LANCEDB,
+        choices=[db.BACKEND_CHROMA, db.BACKEND_LANCEDB],
+        help=f'Storage backend of the new DB. Default is "{db.BACKEND_LANCEDB}".'
+    )
+    parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=db.ADD_BATCH_SIZE,
+        help=f'Rows per write. Default is {db.ADD_BATCH_SIZE}.'
+    )
+    args = parser.parse_args()
+    src_db_path = args.src_db_path
+    dst_db_path = args.dst_db_path
+
+    if not os.path.isdir(src_db_path):
+        print(f'Database path "{src_db_path}" does not exist.')
+        return None
+
+    if os.path.isdir(dst_db_path) and len(os.listdir(dst_db_path)) > 0:
+        print(f'Database path "{dst_db_path}" is not empty.')
+        return None
+
+    src_backend = db.get_backend(src_db_path)
+    print(f'Migrating "{src_db_path}" ({src_backend}) to "{dst_db_path}" ({args.backend}) ...')
+    start = datetime.now()
+
+    db.init_db(dst_db_path, args.backend)
+
+    # id sequences, side index and embedding cache are backend independent
+    copy_sqlite_file(meta_db.get_meta_db_file(src_db_path), meta_db.get_meta_db_file(dst_db_path))
+    copy_sqlite_file(embedding_cache.get_cache_file(src_db_path), embedding_cache.get_cache_file(dst_db_path))
+
+    for collection_name in db.COLLECTION_NAME_LIST:
+        count = db.copy_collection(src_db_path, dst_db_path, collection_name, args.batch_size)
+        dst_count = db.get_collection(collection_name, create=True, db_path=dst_db_path).count()
+        print(f'{collection_name}: {count} copied, {dst_count} in the new DB')
+
+    db.invalidate_handles()
+    print(f'Migrated to "{dst_db_path}" in {datetime.now() - start}')
+
+
+if __name__ == "__main__":
+    main()
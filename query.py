@@ -5,6 +5,7 @@ from datetime import datetime
 from multiprocessing import Process
 import graphrag.my_graphrag.db as db
 import graphrag.my_graphrag.cloud as model
+import graphrag.my_graphrag.llm_telemetry as llm_telemetry
 
 
 FILE_DIR = os.path.dirname(os.path.realpath(__file__))
@@ -156,6 +157,13 @@ def process_arguments():
         help=f'If True, export the input and output text of all query prompts. If False, skip exporting. Default is False.'
     )
 
+    parser.add_argument(
+        '--stream',
+        type=lambda x: x.lower() == 'true',
+        default=True,
+        help='If True, print the answer while it is generated. If False, wait for the whole answer. Default is True.'
+    )
+
     args = parser.parse_args()
 
     QUESTION = args.question
@@ -184,8 +192,9 @@ def process_arguments():
 
 
 def list_group():
-    group_list = db.get_all_groups()
-    paper_list = db.get_all_papers()
+    # names and ids only, the paper texts are not read
+    group_list = list(db.iter_all_groups())
+    paper_list = list(db.iter_all_papers())
 
     output_format = "{:^15}|{:^15}|{:^15}| {:<20}"
     print(output_format.format('Group ID', 'Group Name', 'Document ID', 'Document Name'))
@@ -246,7 +255,7 @@ def export_reports(export_type, export_group_name, export_group_id):
     os.makedirs(output_report_folder, exist_ok=True)
 
     if export_type == 1:
-        report_list = db.get_all_community_reports()
+        report_list = db.iter_all_community_reports(include=('documents', 'metadatas'), where={'group_id': export_group_id})
         for report in report_list:
             report_id = report['report_id']
             report_text = report['report_content']
@@ -259,7 +268,7 @@ def export_reports(export_type, export_group_name, export_group_id):
                 print(f'Exported report {report_id} to {file_path}')
 
     else:
-        summary_list = db.get_all_summary_chunks()
+        summary_list = db.iter_all_summary_chunks(include=('documents', 'metadatas'), where={'group_id': export_group_id})
         for summary in summary_list:
             summary_id = summary['summary_id']
             summary_text = summary['summary_content']
@@ -284,21 +293,21 @@ def export_prompts(fn, text):
 def main():
     start = datetime.now()
 
-    db.rm_db_tmp_file()
+    db.reset_db_path()
 
     args = process_arguments()
     if args is None:
-        db.rm_db_tmp_file()
+        db.reset_db_path()
         return
 
     if args.list_group:
         list_group()
-        db.rm_db_tmp_file()
+        db.reset_db_path()
         return
 
     if args.export_reports:
         export_reports(args.export_type, args.export_group_name, args.export_group_id)
-        db.rm_db_tmp_file()
+        db.reset_db_path()
         return
 
     if args.query_option == 1:
@@ -336,7 +345,7 @@ def main():
     info_list = []
     for i, chunk in enumerate(query_chunk_list):
         prompt_step1 = QUERY_PROMPT1.format(question=QUESTION, context=chunk['text'])
-        answer_step1 = model.get_response_from_sgl(prompt_step1)
+        answer_step1 = model.get_response_from_sgl(prompt_step1, stage=llm_telemetry.STAGE_QUERY_STEP1)
 
         export_prompts('query1_chunk%03d_input.txt' % (i + 1), prompt_step1)
         export_prompts('query1_chunk%03d_output.txt' % (i + 1), answer_step1)
@@ -353,12 +362,22 @@ def main():
     # step 2
     context_step2 = '\n\n'.join(['<info>\n%s\n</info>' % info for info in info_list])
     prompt_step2 = QUERY_PROMPT2.format(question=QUESTION, context=context_step2)
-    answer_step2 = model.get_response_from_sgl(prompt_step2)
+    if args.stream:
+        print('--- answer ---')
+        answer_step2, stream_stats = model.stream_response(
+            prompt_step2,
+            lambda text: print(text, end='', flush=True),
+            stage=llm_telemetry.STAGE_QUERY_STEP2,
+        )
+        print()
+        print('--- answer ---')
+    else:
+        answer_step2 = model.get_response_from_sgl(prompt_step2, stage=llm_telemetry.STAGE_QUERY_STEP2)
 
     export_prompts('query2_input.txt', prompt_step2)
     export_prompts('query2_output.txt', answer_step2)
 
-    paper_list = db.get_all_papers()
+    paper_list = list(db.iter_all_papers())
     group_dict = {}
     for paper_id in list(set(ref_paper_id_list)):
         for paper in paper_list:
@@ -387,16 +406,29 @@ def main():
         reference='\n'.join(ref_text)
     )
 
-    print('--- final answer ---')
-    print(final_answer)
-    print('--- final answer ---')
+    if args.stream:
+        # the answer is printed already, only the reference and the stream stats follow it
+        print('--- reference ---')
+        print('\n'.join(ref_text))
+        print('--- reference ---')
+        if stream_stats:
+            print('time to first token: %.2fs, time to first answer token: %.2fs, %d tokens, %.1f tokens/s' % (
+                stream_stats['time_to_first_token'] or 0,
+                stream_stats['time_to_first_answer_token'] or 0,
+                stream_stats['completion_tokens'],
+                stream_stats['tokens_per_second'],
+            ))
+    else:
+        print('--- final answer ---')
+        print(final_answer)
+        print('--- final answer ---')
 
     export_prompts(f'answer_{query_type.replace(" ", "")}.txt', final_answer)
 
     end = datetime.now()
     print('run time:', end - start)
 
-    db.rm_db_tmp_file()
+    db.reset_db_path()
 
     model.stop_sgl_server()
 
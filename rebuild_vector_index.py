@@ -0,0 +1,147 @@
+import argparse
+import os
+import time
+import numpy as np
+import graphrag.my_graphrag.db as db
+from datetime import datetime
+
+COLLECTION_NAME_LIST = [
+    db.COLLECTION_CHUNK,
+    db.COLLECTION_RELATIONSHIP,
+    db.COLLECTION_COMMUNITY_REPORT,
+    db.COLLECTION_SUMMARY,
+]
+
+
+def get_exact_distances(embeddings, query, space):
+    # same distances as chroma's hnswlib spaces
+    if space == 'cosine':
+        norms = np.linalg.norm(embeddings, axis=1) * np.linalg.norm(query)
+        return 1 - embeddings @ query / np.maximum(norms, 1e-12)
+    if space == 'ip':
+        return 1 - embeddings @ query
+    return ((embeddings - query) ** 2).sum(axis=1)
+
+
+def load_embeddings(collection_name):
+    ids = []
+    embeddings = []
+    for item_id, _, _, embedding in db.iter_collection(collection_name, include=('embeddings',)):
+        ids.append(item_id)
+        embeddings.append(embedding)
+    return ids, np.array(embeddings, dtype=np.float32)
+
+
+def measure(collection_name, num_queries, top_k, seed):
+    # recall@k and latency of the vector index against an exact brute-force search.
+    # queries are stored vectors with some noise, so they look like real queries near the data
+    ids, embeddings = load_embeddings(collection_name)
+    if len(ids) == 0:
+        return None
+
+    collection = db.get_collection(collection_name)
+    space = 'l2'
+    if db.get_backend() == db.BACKEND_CHROMA:
+        space = db.get_hnsw_settings(collection).get('space') or space
+    k = min(top_k, len(ids))
+
+    rng = np.random.default_rng(seed)
+    queries = embeddings[rng.integers(0, len(ids), num_queries)]
+    # noise of about a tenth of the vector length
+    noise_scale = 0.1 * np.linalg.norm(queries, axis=1, keepdims=True) / np.sqrt(queries.shape[1])
+    queries = queries + (rng.standard_normal(queries.shape) * noise_scale).astype(np.float32)
+
+    ann_times = []
+    exact_times = []
+    hits = 0
+    for query in queries:
+        start = time.perf_counter()
+        results = collection.query(query_embeddings=[query], n_results=k, include=[])
+        ann_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        distances = get_exact_distances(embeddings, query, space)
+        exact_index = np.argpartition(distances, k - 1)[:k]
+        exact_times.append(time.perf_counter() - start)
+
+        hits += len(set(results['ids'][0]) & set(ids[i] for i in exact_index))
+
+    return {
+        'rows': len(ids),
+        f'recall@{k}': hits / (k * len(queries)),
+        'index p50 (ms)': np.percentile(np.array(ann_times) * 1000, 50),
+        'index p95 (ms)': np.percentile(np.array(ann_times) * 1000, 95),
+        'exact p50 (ms)': np.percentile(np.array(exact_times) * 1000, 50),
+        'exact p95 (ms)': np.percentile(np.array(exact_times) * 1000, 95),
+    }
+
+
+def print_report(collection_name, result):
+    if result is None:
+        print(f'{collection_name}: empty')
+        return
+    print(f'{collection_name}: ' + ', '.join(
+        f'{key} {value}' if isinstance(value, int) else f'{key} {value:.3f}' for key, value in result.items()
+    ))
+
+
+def print_settings(collection_name):
+    if db.get_backend() != db.BACKEND_CHROMA:
+        return
+    try:
+        current = db.get_hnsw_settings(db.get_collection(collection_name))
+    except:
+        return
+    configured = db.load_hnsw_config().get(collection_name, {})
+    print(f'{collection_name} HNSW settings: current {current}, configured {configured}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the vector indexes of a DB with the HNSW settings of hnsw_config.json and report their recall and latency")
+    parser.add_argument("db_path")
+    parser.add_argument(
+        '--collections',
+        nargs='+',
+        default=COLLECTION_NAME_LIST,
+        choices=COLLECTION_NAME_LIST,
+        help='Collections to rebuild. Default is all collections with vector queries.'
+    )
+    parser.add_argument(
+        '--report_only',
+        type=lambda x: x.lower() == 'true',
+        default=False,
+        help='If True, only report recall and latency, nothing is rebuilt. Default is False.'
+    )
+    parser.add_argument('--num_queries', type=int, default=100, help='Queries per collection in the report. Default is 100.')
+    parser.add_argument('--top_k', type=int, default=10, help='Results per query in the report. Default is 10.')
+    parser.add_argument('--seed', type=int, default=224)
+    args = parser.parse_args()
+
+    db_path = args.db_path
+    if not os.path.isabs(db_path):
+        db_path = os.path.join(os.getcwd(), db_path)
+    if not os.path.isdir(db_path):
+        print(f'Database path "{db_path}" does not exist.')
+        return None
+
+    print(f'HNSW config: {db.HNSW_CONFIG_FILE}')
+    with db.open_db(db_path):
+        for collection_name in args.collections:
+            print_settings(collection_name)
+            print_report(collection_name, measure(collection_name, args.num_queries, args.top_k, args.seed))
+            if args.report_only:
+                continue
+
+            start = datetime.now()
+            if not db.compact_collection(collection_name):
+                print(f'{collection_name}: nothing to rebuild')
+                continue
+            print(f'{collection_name}: rebuilt in {datetime.now() - start}')
+            print_settings(collection_name)
+            print_report(collection_name, measure(collection_name, args.num_queries, args.top_k, args.seed))
+
+    db.invalidate_handles()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import hashlib
+import numpy as np
+import pytest
+
+import graphrag.my_graphrag.db as db
+import graphrag.my_graphrag.embedding as embedding
+
+EMBEDDING_DIM = 384
+
+
+def fake_model(texts):
+    # bag of hashed words instead of the ONNX model, similar texts still get close vectors
+    vectors = []
+    for text in texts:
+        vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+        for word in text.split():
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % EMBEDDING_DIM] += 1.0
+        norm = np.linalg.norm(vector)
+        vectors.append(vector / norm if norm else vector)
+    return vectors
+
+
+@pytest.fixture(autouse=True)
+def fake_models(monkeypatch):
+    # no model download: a fake embedding, and whitespace tokens for the sub chunks (punkt may be missing)
+    monkeypatch.setattr(embedding, '_MODEL', fake_model)
+    monkeypatch.setattr(db, 'word_tokenize', lambda text: text.split())
+
+
+@pytest.fixture(params=[db.BACKEND_CHROMA, db.BACKEND_LANCEDB])
+def db_path(request, tmp_path):
+    # an empty DB of each backend, active for the test
+    path = str(tmp_path / 'db')
+    db.init_db(path, request.param)
+    with db.open_db(path):
+        yield path
+    db.invalidate_handles(path)
+
+
+@pytest.fixture
+def group_id(db_path):
+    group_id = db.save_new_group('group one')
+    with db.use_group(group_id):
+        yield group_id
@@ -0,0 +1,42 @@
+import threading
+
+import graphrag.my_graphrag.meta_db as meta_db
+
+
+def test_allocate_ids_continues_from_max_id(tmp_path):
+    db_path = str(tmp_path / 'db')
+
+    assert meta_db.allocate_ids(db_path, 'chunk', 3, lambda: 5) == ['6', '7', '8']
+
+    # the max id is only read to seed the sequence
+    def read_max_id():
+        raise AssertionError('collection was read')
+
+    assert meta_db.allocate_ids(db_path, 'chunk', 2, read_max_id) == ['9', '10']
+    assert meta_db.allocate_ids(db_path, 'chunk', 0, read_max_id) == []
+    assert meta_db.allocate_ids(db_path, 'paper', 1, lambda: 0) == ['1']
+
+    # the sequence is kept in the DB directory
+    meta_db.close_connections(db_path)
+    assert meta_db.allocate_ids(db_path, 'chunk', 1, read_max_id) == ['11']
+    meta_db.close_connections(db_path)
+
+
+def test_concurrent_allocate_ids_do_not_overlap(tmp_path):
+    db_path = str(tmp_path / 'db')
+    id_lists = []
+
+    def allocate():
+        for _ in range(20):
+            id_lists.append(meta_db.allocate_ids(db_path, 'chunk', 3, lambda: 0))
+        meta_db.close_connections(db_path)
+
+    thread_list = [threading.Thread(target=allocate) for _ in range(8)]
+    for thread in thread_list:
+        thread.start()
+    for thread in thread_list:
+        thread.join()
+
+    for id_list in id_lists:
+        assert [int(i) for i in id_list] == list(range(int(id_list[0]), int(id_list[0]) + 3))
+    assert sorted(int(i) for id_list in id_lists for i in id_list) == list(range(1, 8 * 20 * 3 + 1))
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+import export_vector_db
+import import_vector_db
+import graphrag.my_graphrag.db as db
+
+COMMUNITY_CONTEXT = '<id>0</id><source>BUDDHA</source><target>DHARMA</target><description>the buddha teaches the dharma</description>'
+
+
+def read_rows(db_path):
+    rows = {}
+    with db.open_db(db_path):
+        for collection_name in export_vector_db.COLLECTION_NAME_LIST:
+            rows[collection_name] = list(db.iter_collection(collection_name, include=('documents', 'metadatas', 'embeddings')))
+    return rows
+
+
+@pytest.mark.parametrize('import_backend', [db.BACKEND_CHROMA, db.BACKEND_LANCEDB])
+@pytest.mark.parametrize('suffix', ['.jsonl.gz', '.jsonl'])
+def test_export_import_round_trip(group_id, db_path, tmp_path, import_backend, suffix):
+    paper_id = db.save_new_paper('the whole paper', 'paper.txt', group_id)
+    chunk_id_list = db.save_new_chunks(['chunk one', 'chunk two'], [paper_id, paper_id], group_id, ['denoised one', 'denoised two'])
+    db.save_new_relationships('denoised one', [('Buddha', 'Dharma', 'the buddha teaches the dharma', '5')])
+    db.save_new_community_report(COMMUNITY_CONTEXT, 'report text')
+    db.save_new_summaries([('summary', chunk_id_list)], True, True, group_id)
+
+    archive_path = str(tmp_path / f'export{suffix}')
+    count_dict = export_vector_db.export_archive(archive_path)
+    assert count_dict == {
+        db.COLLECTION_GROUP: 1,
+        db.COLLECTION_PAPER: 1,
+        db.COLLECTION_CHUNK: 2,
+        db.COLLECTION_RELATIONSHIP: 1,
+        db.COLLECTION_COMMUNITY_REPORT: 1,
+        db.COLLECTION_SUMMARY: 1,
+    }
+
+    import_path = str(tmp_path / 'import')
+    db.init_db(import_path, import_backend)
+    with db.open_db(import_path):
+        assert import_vector_db.import_archive(archive_path, batch_size=1) == count_dict
+        db.ensure_side_indexes()
+
+    rows = read_rows(db_path)
+    imported_rows = read_rows(import_path)
+    for collection_name, row_list in rows.items():
+        imported_row_list = imported_rows[collection_name]
+        assert [row[:3] for row in imported_row_list] == [row[:3] for row in row_list]
+        for row, imported_row in zip(row_list, imported_row_list):
+            np.testing.assert_allclose(imported_row[3], row[3], rtol=0, atol=1e-6)
+
+    # the side index and the id sequences are rebuilt from the imported rows
+    with db.open_db(import_path, group_id):
+        assert db.get_id(db.COLLECTION_CHUNK, 'denoised two', metadatas='denoising_chunk') == chunk_id_list[1]
+        new_chunk_id = db.save_new_chunk('chunk three', paper_id, group_id)
+        assert int(new_chunk_id) > max(int(chunk_id) for chunk_id in chunk_id_list)
+    db.invalidate_handles(import_path)
@@ -0,0 +1,49 @@
+import os
+
+import graphrag.my_graphrag.db as db
+import graphrag.my_graphrag.meta_db as meta_db
+
+
+def save_items(group_id):
+    paper_id = db.save_new_paper('the whole paper', 'paper.txt', group_id)
+    chunk_id_list = db.save_new_chunks(['chunk one', 'chunk two'], [paper_id, paper_id], group_id, ['denoised one', 'denoised two'])
+    db.save_new_relationships('denoised one', [('BUDDHA', 'DHARMA', 'the buddha teaches the dharma', '5')])
+    db.save_new_summaries([('summary', chunk_id_list)], True, True, group_id)
+
+
+def test_catalog_counts_from_side_index(group_id, db_path):
+    save_items(group_id)
+
+    catalog = db.get_catalog()
+
+    assert catalog['collections'] == {
+        db.COLLECTION_GROUP: 1,
+        db.COLLECTION_PAPER: 1,
+        db.COLLECTION_CHUNK: 2,
+        db.COLLECTION_RELATIONSHIP: 1,
+        db.COLLECTION_COMMUNITY_REPORT: 0,
+        db.COLLECTION_SUMMARY: 1,
+    }
+    assert [dict(group) for group in catalog['groups']] == [{
+        'group_id': group_id,
+        'group_name': 'group one',
+        db.COLLECTION_PAPER: 1,
+        db.COLLECTION_CHUNK: 2,
+        db.COLLECTION_RELATIONSHIP: 1,
+        db.COLLECTION_COMMUNITY_REPORT: 0,
+        db.COLLECTION_SUMMARY: 1,
+    }]
+    assert catalog['disk']['total'] > 0
+
+
+def test_catalog_leaves_db_without_side_index_untouched(group_id, db_path):
+    save_items(group_id)
+    indexed_groups = db.get_catalog()['groups']
+
+    # a DB written before the side index existed
+    db.invalidate_handles(db_path)
+    os.remove(meta_db.get_meta_db_file(db_path))
+
+    assert not db.is_side_index_complete()
+    assert db.get_catalog()['groups'] == indexed_groups
+    assert not os.path.isfile(meta_db.get_meta_db_file(db_path))
@@ -0,0 +1,183 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('aiolimiter')
+pytest.importorskip('tiktoken')
+
+import httpx
+import openai
+from tenacity import AsyncRetrying
+
+import graphrag.my_graphrag.cloud as cloud
+import graphrag.my_graphrag.llm_telemetry as llm_telemetry
+from graphrag.llm.openai import OpenAIConfiguration
+
+
+def rate_limit_error(headers=None):
+    request = httpx.Request('POST', 'http://llm/v1/chat/completions')
+    return openai.RateLimitError('rate limited', response=httpx.Response(429, headers=headers or {}, request=request), body=None)
+
+
+def completion(content):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+        usage=SimpleNamespace(prompt_tokens=10, completion_tokens=2),
+    )
+
+
+@pytest.fixture
+def llm_config(monkeypatch):
+    # the llm section of settings.yaml
+    def set_config(**settings):
+        monkeypatch.setattr(cloud, '_LLM_CONFIG', OpenAIConfiguration(settings))
+    set_config(max_retry_wait=0)
+    return set_config
+
+
+@pytest.fixture
+def llm_loop(monkeypatch):
+    # a new LLM loop, with the limiters and slots of the llm_config of the test
+    for name in ['_LLM_LOOP', '_LLM_SLOTS', '_LIMITER', '_TOKEN_LIMITER']:
+        monkeypatch.setattr(cloud, name, None)
+    yield
+    if cloud._LLM_LOOP is not None:
+        cloud._LLM_LOOP.call_soon_threadsafe(cloud._LLM_LOOP.stop)
+
+
+@pytest.fixture
+def llm_calls(monkeypatch):
+    calls = []
+    monkeypatch.setattr(llm_telemetry, 'record', lambda stage, latency, *args, **kwargs: calls.append((stage, args, kwargs)))
+    return calls
+
+
+def fake_client(monkeypatch, create):
+    monkeypatch.setattr(cloud, 'client', SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+
+
+def test_get_retry_after_reads_the_headers():
+    assert cloud.get_retry_after(rate_limit_error({'retry-after': '7'})) == 7
+    assert cloud.get_retry_after(rate_limit_error({'retry-after-ms': '1500', 'retry-after': '7'})) == 1.5
+    retry_date = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 < cloud.get_retry_after(rate_limit_error({'retry-after': retry_date})) <= 30
+    assert cloud.get_retry_after(rate_limit_error()) == 0
+    assert cloud.get_retry_after(TimeoutError()) == 0
+
+
+async def run_retries(retry_kwargs, errors):
+    # attempts until the call succeeds, the errors are raised by the first attempts
+    attempts = 0
+    async for attempt in AsyncRetrying(**retry_kwargs):
+        with attempt:
+            attempts += 1
+            if errors:
+                raise errors.pop(0)
+    return attempts
+
+
+@pytest.mark.parametrize('max_retries', [0, 2])
+def test_max_retries_counts_the_retries(llm_config, max_retries):
+    llm_config(max_retries=max_retries, max_retry_wait=0)
+
+    assert asyncio.run(run_retries(cloud.get_retry_kwargs(), [rate_limit_error()] * max_retries)) == max_retries + 1
+    with pytest.raises(openai.RateLimitError):
+        asyncio.run(run_retries(cloud.get_retry_kwargs(), [rate_limit_error()] * (max_retries + 1)))
+
+
+def test_errors_that_are_not_retryable_are_raised_at_once(llm_config):
+    with pytest.raises(ValueError):
+        asyncio.run(run_retries(cloud.get_retry_kwargs(), [ValueError('bad request')]))
+
+
+@pytest.mark.parametrize('sleep_on_rate_limit_recommendation, expected_waits', [(True, [7.0, 0.5]), (False, [0.0, 0.0])])
+def test_retries_wait_as_long_as_retry_after(llm_config, sleep_on_rate_limit_recommendation, expected_waits):
+    llm_config(max_retries=2, max_retry_wait=0, sleep_on_rate_limit_recommendation=sleep_on_rate_limit_recommendation)
+    waits = []
+
+    async def sleep(seconds):
+        waits.append(seconds)
+
+    retry_kwargs = {**cloud.get_retry_kwargs(), 'sleep': sleep}
+    errors = [rate_limit_error({'retry-after': '7'}), rate_limit_error({'retry-after-ms': '500'})]
+    assert asyncio.run(run_retries(retry_kwargs, errors)) == 3
+    assert waits == expected_waits
+
+
+def test_requests_per_minute_limit(llm_config, llm_loop):
+    llm_config(tokens_per_minute=0, requests_per_minute=2)
+
+    for _ in range(2):
+        cloud.run_in_llm_loop(cloud.acquire_rate(0)).result(timeout=1)
+    # the response does not take a request
+    cloud.run_in_llm_loop(cloud.acquire_rate(100, output=True)).result(timeout=1)
+
+    future = cloud.run_in_llm_loop(cloud.acquire_rate(0))
+    with pytest.raises(concurrent.futures.TimeoutError):
+        future.result(timeout=0.3)
+    future.cancel()
+
+
+def test_tokens_per_minute_limit(llm_config, llm_loop):
+    llm_config(tokens_per_minute=100, requests_per_minute=0)
+
+    cloud.run_in_llm_loop(cloud.acquire_rate(60)).result(timeout=1)
+    # the output tokens of a response share the token bucket
+    cloud.run_in_llm_loop(cloud.acquire_rate(40, output=True)).result(timeout=1)
+
+    future = cloud.run_in_llm_loop(cloud.acquire_rate(10))
+    with pytest.raises(concurrent.futures.TimeoutError):
+        future.result(timeout=0.3)
+    future.cancel()
+
+
+def test_request_retries_rate_limited_calls(llm_config, llm_loop, llm_calls, monkeypatch):
+    llm_config(max_retries=2, max_retry_wait=0, tokens_per_minute=0, requests_per_minute=0)
+    errors = [rate_limit_error({'retry-after-ms': '50'})]
+
+    async def create(**kwargs):
+        if errors:
+            raise errors.pop(0)
+        return completion('<think>hmm</think> answer')
+
+    fake_client(monkeypatch, create)
+
+    start = time.perf_counter()
+    assert cloud.get_response_from_sgl('prompt', use_cache=False, stage=llm_telemetry.STAGE_EXTRACT) == 'answer'
+    assert time.perf_counter() - start >= 0.05
+    assert llm_calls == [(llm_telemetry.STAGE_EXTRACT, (10, 2), {'retries': 1})]
+
+
+def test_requests_in_flight_are_capped_across_threads_and_loops(llm_config, llm_loop, llm_calls, monkeypatch):
+    llm_config(tokens_per_minute=0, requests_per_minute=0)
+    monkeypatch.setattr(cloud, 'LLM_CONCURRENCY', 2)
+    in_flight = [0, 0]
+
+    async def create(**kwargs):
+        in_flight[0] += 1
+        in_flight[1] = max(in_flight)
+        await asyncio.sleep(0.05)
+        in_flight[0] -= 1
+        return completion('answer')
+
+    fake_client(monkeypatch, create)
+
+    async def extract():
+        return await asyncio.gather(*[cloud.aget_response('prompt', use_cache=False) for _ in range(3)])
+
+    answer_list = []
+    thread_list = [threading.Thread(target=lambda: answer_list.extend(asyncio.run(extract()))) for _ in range(2)]
+    thread_list += [threading.Thread(target=lambda: answer_list.append(cloud.get_response_from_sgl('prompt', use_cache=False))) for _ in range(2)]
+    for thread in thread_list:
+        thread.start()
+    for thread in thread_list:
+        thread.join()
+
+    assert answer_list == ['answer'] * 8
+    assert in_flight == [0, 2]
@@ -0,0 +1,54 @@
+import graphrag.my_graphrag.db as db
+
+COMMUNITY_CONTEXT = '<id>0</id><source>{source}</source><target>{target}</target><description>{description}</description>'
+
+
+def save_group(group_name, source, target):
+    group_id = db.save_new_group(group_name)
+    with db.use_group(group_id):
+        paper_id = db.save_new_paper(f'paper of {group_name}', 'paper.txt', group_id)
+        chunk_id_list = db.save_new_chunks([f'chunk of {group_name}'], [paper_id], group_id, [f'denoised {group_name}'])
+        relationship_id_list = db.save_new_relationships(f'denoised {group_name}', [(source, target, f'{source} and {target}', '5')])
+        report_id = db.save_new_community_report(COMMUNITY_CONTEXT.format(source=source, target=target, description=''), f'report of {group_name}')
+        summary_id_list = db.save_new_summaries([(f'summary of {group_name}', chunk_id_list)], True, True, group_id)
+    return group_id, ([paper_id], chunk_id_list, relationship_id_list, [report_id], summary_id_list)
+
+
+def get_ids(collection_name):
+    return [item_id for item_id, _, _ in db.iter_collection(collection_name)]
+
+
+def test_delete_group_removes_only_its_items(db_path, monkeypatch):
+    group_id, ref_ids = save_group('one', 'BUDDHA', 'DHARMA')
+    other_group_id, other_ref_ids = save_group('two', 'MIND', 'FORM')
+    assert db.get_ref_ids_for_group(group_id) == ref_ids
+
+    compacted = []
+    compact_collection = db.compact_collection
+    monkeypatch.setattr(db, 'compact_collection', lambda collection_name: compacted.append(collection_name) or compact_collection(collection_name))
+
+    db.delete_group(group_id)
+
+    assert db.get_ref_ids_for_group(group_id) == ([], [], [], [], [])
+    assert db.get_ref_ids_for_group(other_group_id) == other_ref_ids
+    assert get_ids(db.COLLECTION_GROUP) == [other_group_id]
+    for collection_name, id_list in zip(db.GROUP_COLLECTION_NAME_LIST, other_ref_ids):
+        assert get_ids(collection_name) == id_list
+    # compacted by default, the group row is not worth a copy
+    assert sorted(compacted) == sorted(db.GROUP_COLLECTION_NAME_LIST)
+
+
+def test_delete_group_dry_run_and_no_compact(db_path, monkeypatch):
+    group_id, ref_ids = save_group('one', 'BUDDHA', 'DHARMA')
+    compacted = []
+    monkeypatch.setattr(db, 'compact_collection', compacted.append)
+
+    db.delete_group(group_id, dry_run=True)
+    assert db.get_ref_ids_for_group(group_id) == ref_ids
+
+    db.delete_group(group_id, del_graphrag=True, del_raptor=False, compact=False)
+    assert compacted == []
+    assert get_ids(db.COLLECTION_RELATIONSHIP) == []
+    assert get_ids(db.COLLECTION_COMMUNITY_REPORT) == []
+    assert get_ids(db.COLLECTION_SUMMARY) == ref_ids[4]
+    assert get_ids(db.COLLECTION_CHUNK) == ref_ids[1]
@@ -0,0 +1,61 @@
+import graphrag.my_graphrag.db as db
+import graphrag.my_graphrag.meta_db as meta_db
+
+
+def save_paper_with_chunks(group_id, paper_content, chunk_list, denoising_chunk_list):
+    paper_id = db.save_new_paper(paper_content, 'paper.txt', group_id)
+    return paper_id, db.save_new_chunks(chunk_list, [paper_id] * len(chunk_list), group_id, denoising_chunk_list)
+
+
+def test_get_id_finds_exact_text_through_hash_index(group_id, monkeypatch):
+    paper_id, chunk_id_list = save_paper_with_chunks(
+        group_id,
+        'the whole paper',
+        ['first chunk of the paper', 'second chunk of the paper'],
+        ['first denoised chunk', 'second denoised chunk'],
+    )
+
+    hash_lookups = []
+    find_id_by_text_hash = meta_db.find_id_by_text_hash
+
+    def spy(*args, **kwargs):
+        item_id = find_id_by_text_hash(*args, **kwargs)
+        hash_lookups.append(item_id)
+        return item_id
+
+    monkeypatch.setattr(meta_db, 'find_id_by_text_hash', spy)
+
+    # whitespace does not matter, like the scan
+    assert db.get_id(db.COLLECTION_CHUNK, 'second  chunk\nof the paper') == chunk_id_list[1]
+    assert db.get_id(db.COLLECTION_CHUNK, 'first denoised chunk', metadatas='denoising_chunk') == chunk_id_list[0]
+    assert db.get_id(db.COLLECTION_PAPER, 'the whole paper') == paper_id
+    assert hash_lookups == [chunk_id_list[1], chunk_id_list[0], paper_id]
+
+
+def test_get_id_hash_lookup_is_scoped_to_current_group(group_id):
+    _, chunk_id_list = save_paper_with_chunks(group_id, 'paper of group one', ['shared chunk'], [''])
+    other_group_id = db.save_new_group('group two')
+    _, other_chunk_id_list = save_paper_with_chunks(other_group_id, 'paper of group two', ['shared chunk'], [''])
+
+    assert db.get_id(db.COLLECTION_CHUNK, 'shared chunk') == chunk_id_list[0]
+    with db.use_group(other_group_id):
+        assert db.get_id(db.COLLECTION_CHUNK, 'shared chunk') == other_chunk_id_list[0]
+
+
+def test_get_id_scans_on_hash_miss(group_id):
+    _, chunk_id_list = save_paper_with_chunks(group_id, 'the whole paper', ['a long chunk with some words'], [''])
+
+    # a part of a chunk has no hash of its own
+    assert db.find_id_by_text_hash(db.get_collection(db.COLLECTION_CHUNK), 'some words') is None
+    assert db.get_id(db.COLLECTION_CHUNK, 'some words') == chunk_id_list[0]
+
+
+def test_get_id_scans_when_hash_lookup_fails(group_id, monkeypatch):
+    _, chunk_id_list = save_paper_with_chunks(group_id, 'the whole paper', ['first chunk', 'second chunk'], ['', ''])
+
+    def broken_lookup(*args, **kwargs):
+        raise RuntimeError('side index is locked')
+
+    monkeypatch.setattr(meta_db, 'find_id_by_text_hash', broken_lookup)
+
+    assert db.get_id(db.COLLECTION_CHUNK, 'second chunk') == chunk_id_list[1]
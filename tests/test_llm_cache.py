@@ -0,0 +1,93 @@
+from types import SimpleNamespace
+
+import pytest
+
+import graphrag.my_graphrag.llm_cache as llm_cache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        self.now += 1
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def cache_file(tmp_path, monkeypatch):
+    # an empty cache of the test, with its own clock for the LRU order
+    llm_cache.close_connection()
+    monkeypatch.setattr(llm_cache, 'LLM_CACHE_FILE_PATH', str(tmp_path / 'llm_cache.sqlite3'))
+    monkeypatch.setattr(llm_cache, 'LLM_CACHE_ENABLED', True)
+    monkeypatch.setattr(llm_cache, 'time', Clock())
+    yield llm_cache.LLM_CACHE_FILE_PATH
+    llm_cache.close_connection()
+
+
+def test_get_returns_put_response():
+    key = llm_cache.get_key('model', 'prompt', {'temperature': 0})
+
+    assert llm_cache.get(key) is None
+    llm_cache.put(key, 'model', '<think>hmm</think>answer')
+    assert llm_cache.get(key) == '<think>hmm</think>answer'
+    assert llm_cache.get_stats() == (1, 1, 1, len('<think>hmm</think>answer'))
+
+
+def test_key_includes_model_and_sampling_params():
+    key = llm_cache.get_key('model', 'prompt', {'temperature': 0, 'max_tokens': 10})
+
+    assert key == llm_cache.get_key('model', 'prompt', {'max_tokens': 10, 'temperature': 0})
+    assert key != llm_cache.get_key('model', 'prompt', {'temperature': 0.7, 'max_tokens': 10})
+    assert key != llm_cache.get_key('other model', 'prompt', {'temperature': 0, 'max_tokens': 10})
+    assert llm_cache.get_key('model', 'prompt') == llm_cache.get_key('model', 'prompt', {})
+
+
+def test_least_recently_used_responses_are_evicted(monkeypatch):
+    monkeypatch.setattr(llm_cache, 'LLM_CACHE_MAX_BYTES', 100)
+    for name in ['a', 'b', 'c']:
+        llm_cache.put(name, 'model', name * 30)
+    # a hit makes a the most recently used
+    assert llm_cache.get('a') == 'a' * 30
+
+    # 120 bytes, evicted down to 90
+    llm_cache.put('d', 'model', 'd' * 30)
+
+    assert llm_cache.get('b') is None
+    assert [llm_cache.get(name) for name in ['a', 'c', 'd']] == ['a' * 30, 'c' * 30, 'd' * 30]
+    assert llm_cache.get_stats()[2:] == (3, 90)
+
+
+def test_failed_put_is_rolled_back(monkeypatch):
+    def broken_evict(conn):
+        raise RuntimeError('disk full')
+
+    with monkeypatch.context() as m:
+        m.setattr(llm_cache, 'evict', broken_evict)
+        llm_cache.put('a', 'model', 'answer')
+
+    # the connection is usable again and the failed put left nothing behind
+    assert not llm_cache.get_connection().in_transaction
+    assert llm_cache.get('a') is None
+    llm_cache.put('a', 'model', 'answer')
+    assert llm_cache.get('a') == 'answer'
+    assert llm_cache.get_stats()[2:] == (1, len('answer'))
+
+
+def test_failed_hit_is_rolled_back(monkeypatch):
+    llm_cache.put('a', 'model', 'answer')
+
+    # last_used cannot be bound, the UPDATE fails inside the transaction
+    with monkeypatch.context() as m:
+        m.setattr(llm_cache, 'time', SimpleNamespace(time=object))
+        assert llm_cache.get('a') is None
+
+    assert not llm_cache.get_connection().in_transaction
+    assert llm_cache.get('a') == 'answer'
+
+
+def test_disabled_cache_is_not_used(monkeypatch):
+    monkeypatch.setattr(llm_cache, 'LLM_CACHE_ENABLED', False)
+
+    llm_cache.put('a', 'model', 'answer')
+    assert llm_cache.get('a') is None
@@ -0,0 +1,63 @@
+import csv
+import json
+
+import pytest
+
+import graphrag.my_graphrag.llm_telemetry as llm_telemetry
+
+
+@pytest.fixture
+def calls_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_telemetry, 'LIVE_INTERVAL', 0)
+    monkeypatch.setattr(llm_telemetry, '_COUNTERS', {})
+    calls_file = str(tmp_path / 'llm_calls.jsonl')
+    llm_telemetry.begin_run(calls_file)
+    yield calls_file
+    llm_telemetry.end_run()
+
+
+def test_calls_are_summarized_per_stage(calls_file, tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_telemetry, 'PRICE_INPUT', 1.0)
+    monkeypatch.setattr(llm_telemetry, 'PRICE_OUTPUT', 2.0)
+    llm_telemetry.record(llm_telemetry.STAGE_EXTRACT, 1.0, 100, 10)
+    llm_telemetry.record(llm_telemetry.STAGE_EXTRACT, 3.0, 200, 20, retries=2)
+    llm_telemetry.record(llm_telemetry.STAGE_EXTRACT, 0, cached=True)
+    llm_telemetry.record(llm_telemetry.STAGE_SUMMARIZE, 2.0, error=TimeoutError('timed out'))
+    llm_telemetry.record('', 0.5)
+    # a line cut off by a killed subprocess
+    with open(calls_file, 'a') as f:
+        f.write('{"stage": "ext')
+
+    summary = llm_telemetry.write_summary(calls_file, str(tmp_path / 'summary.json'), str(tmp_path / 'summary.csv'))
+
+    extract = summary[llm_telemetry.STAGE_EXTRACT]
+    assert (extract['calls'], extract['cache_hits'], extract['errors'], extract['retries']) == (3, 1, 0, 2)
+    assert (extract['prompt_tokens'], extract['completion_tokens']) == (300, 30)
+    assert extract['cost'] == pytest.approx((300 * 1.0 + 30 * 2.0) / 1_000_000)
+    # cache hits do not count for the latency
+    assert extract['latency_total'] == 4.0
+    assert extract['latency_p50'] == 2.0
+    assert extract['latency_max'] == 3.0
+
+    assert summary[llm_telemetry.STAGE_SUMMARIZE]['errors'] == 1
+    assert summary[llm_telemetry.STAGE_OTHER]['calls'] == 1
+    assert summary['total']['calls'] == 5
+    assert llm_telemetry.read_calls(calls_file)[3]['error'] == 'TimeoutError: timed out'
+
+    with open(tmp_path / 'summary.json') as f:
+        assert json.load(f) == summary
+    with open(tmp_path / 'summary.csv') as f:
+        rows = list(csv.reader(f))
+    assert rows[0][:3] == ['Stage', 'calls', 'cache_hits']
+    assert [row[0] for row in rows[1:]] == list(summary.keys())
+
+
+def test_begin_run_starts_a_new_calls_file(calls_file):
+    llm_telemetry.record(llm_telemetry.STAGE_DENOISE, 1.0)
+    llm_telemetry.begin_run(calls_file)
+    assert llm_telemetry.read_calls(calls_file) == []
+
+    llm_telemetry.end_run()
+    llm_telemetry.record(llm_telemetry.STAGE_DENOISE, 1.0)
+    assert llm_telemetry.read_calls(calls_file) == []
+    assert llm_telemetry._COUNTERS[llm_telemetry.STAGE_DENOISE] == [2, 0, 0]
@@ -0,0 +1,49 @@
+import graphrag.my_graphrag.db as db
+import graphrag.my_graphrag.meta_db as meta_db
+
+
+def test_side_index_is_rebuilt_page_by_page(group_id, db_path, monkeypatch):
+    paper_id = db.save_new_paper('the whole paper', 'paper.txt', group_id)
+    chunk_list = [f'chunk number {i}' for i in range(5)]
+    chunk_id_list = db.save_new_chunks(chunk_list, [paper_id] * len(chunk_list), group_id)
+
+    member_batches = []
+    insert_rows = meta_db._insert_rows
+
+    def spy(conn, side_index_rows):
+        member_batches.append([row[:2] for row in side_index_rows['member']])
+        insert_rows(conn, side_index_rows)
+
+    monkeypatch.setattr(meta_db, '_insert_rows', spy)
+    monkeypatch.setattr(db, 'SCAN_BATCH_SIZE', 2)
+    db.rebuild_side_indexes()
+
+    assert [batch for batch in member_batches if batch and batch[0][0] == db.COLLECTION_CHUNK] == [
+        [(db.COLLECTION_CHUNK, chunk_id) for chunk_id in chunk_id_list[:2]],
+        [(db.COLLECTION_CHUNK, chunk_id) for chunk_id in chunk_id_list[2:4]],
+        [(db.COLLECTION_CHUNK, chunk_id) for chunk_id in chunk_id_list[4:]],
+    ]
+    assert meta_db.is_collection_indexed(db_path, db.COLLECTION_CHUNK)
+    assert db.find_id_by_text_hash(db.get_collection(db.COLLECTION_CHUNK), 'chunk number 3') == chunk_id_list[3]
+    assert db.find_paper_id_by_content('the whole paper') == paper_id
+
+
+def test_interrupted_side_index_build_starts_over(group_id, db_path, monkeypatch):
+    paper_id = db.save_new_paper('the whole paper', 'paper.txt', group_id)
+    chunk_id_list = db.save_new_chunks(['chunk one', 'chunk two'], [paper_id, paper_id], group_id)
+
+    def broken_rows(collection_name):
+        yield db.get_side_index_rows(collection_name, chunk_id_list[:1], ['chunk one'], [{'group_id': group_id}])
+        raise RuntimeError('killed')
+
+    meta_db.reset_index(db_path)
+    with monkeypatch.context() as m:
+        m.setattr(db, 'iter_side_index_rows', broken_rows)
+        try:
+            db.ensure_side_index(db.get_collection(db.COLLECTION_CHUNK))
+        except RuntimeError:
+            pass
+    assert not meta_db.is_collection_indexed(db_path, db.COLLECTION_CHUNK)
+
+    db.ensure_side_index(db.get_collection(db.COLLECTION_CHUNK))
+    assert db.find_id_by_text_hash(db.get_collection(db.COLLECTION_CHUNK), 'chunk two') == chunk_id_list[1]
@@ -0,0 +1,126 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+import graphrag.my_graphrag.db as db
+
+COMMUNITY_CONTEXT = '''<id>0</id><source>BUDDHA</source><target>DHARMA</target><description>the buddha teaches the dharma</description>
+
+<id>1</id><source>MIND</source><target>FORM</target><description />'''
+
+
+def get_ids(collection_name):
+    return [item_id for item_id, _, _ in db.iter_collection(collection_name)]
+
+
+def save_chunks(group_id):
+    paper_id = db.save_new_paper('the whole paper', 'paper.txt', group_id)
+    return db.save_new_chunks(['chunk one', 'chunk two'], [paper_id, paper_id], group_id, ['denoised one', 'denoised two'])
+
+
+def test_commit_writes_staged_rows(group_id):
+    chunk_id_list = save_chunks(group_id)
+
+    staging_file = db.begin_group_staging(group_id, 'graphrag')
+    relationship_id_list = db.save_new_relationships('denoised one', [('"Buddha"', 'Dharma', 'the buddha teaches the dharma', '5')])
+    relationship_id_list += db.save_new_relationships('denoised two', [('Mind', 'Form', 'mind is form', '3')])
+    report_id = db.save_new_community_report(COMMUNITY_CONTEXT, 'report text')
+
+    # nothing is written before the commit, the staged relationships are found by their entity names
+    assert os.path.isfile(staging_file)
+    assert get_ids(db.COLLECTION_RELATIONSHIP) == []
+    assert get_ids(db.COLLECTION_COMMUNITY_REPORT) == []
+    assert db.get_staged_items(db.COLLECTION_RELATIONSHIP)[0] == relationship_id_list
+    _, _, report_metadatas = db.get_staged_items(db.COLLECTION_COMMUNITY_REPORT)
+    assert sorted(json.loads(report_metadatas[0]['chunk_id_list'])) == sorted(chunk_id_list)
+
+    assert db.commit_group_staging(staging_file) == {db.COLLECTION_RELATIONSHIP: 2, db.COLLECTION_COMMUNITY_REPORT: 1}
+    assert not os.path.isfile(staging_file)
+    assert db.get_staging_file() is None
+    assert get_ids(db.COLLECTION_RELATIONSHIP) == relationship_id_list
+    assert get_ids(db.COLLECTION_COMMUNITY_REPORT) == [report_id]
+    # committed relationships are in the side index
+    assert db.get_chunk_ids_of_relationships([('DHARMA', 'BUDDHA', '')]) == [chunk_id_list[0]]
+
+
+def test_discard_drops_staged_rows(group_id):
+    chunk_id_list = save_chunks(group_id)
+
+    staging_file = db.begin_group_staging(group_id, 'raptor')
+    db.save_new_summaries([('summary', chunk_id_list)], True, True, group_id)
+    db.discard_group_staging(staging_file)
+
+    assert not os.path.isfile(staging_file)
+    assert get_ids(db.COLLECTION_SUMMARY) == []
+
+
+def test_commit_keeps_staged_vectors(group_id, monkeypatch):
+    chunk_id_list = save_chunks(group_id)
+    vectors = [np.full(8, 0.5, dtype=np.float32), np.arange(8, dtype=np.float32)]
+
+    staging_file = db.begin_group_staging(group_id, 'raptor')
+    summary_id_list = db.save_new_summaries([('summary one', chunk_id_list[:1])], True, False, group_id, vectors[:1])
+    summary_id_list += db.save_new_summaries([('summary two', chunk_id_list)], False, True, group_id, vectors[1:])
+    summary_id_list += db.save_new_summaries([('summary three', chunk_id_list)], False, True, group_id)
+
+    embedded_texts = []
+
+    def spy(texts):
+        embedded_texts.extend(texts)
+        return [np.zeros(8, dtype=np.float32) for _ in texts]
+
+    monkeypatch.setattr(db, 'embed_texts', spy)
+    db.commit_group_staging(staging_file)
+
+    # only the summary staged without its vector is embedded
+    assert embedded_texts == ['summary three']
+    rows = list(db.iter_collection(db.COLLECTION_SUMMARY, include=('embeddings',)))
+    assert [row[0] for row in rows] == summary_id_list
+    for row, vector in zip(rows, vectors + [np.zeros(8, dtype=np.float32)]):
+        np.testing.assert_allclose(row[3], vector)
+
+
+def test_staging_is_per_thread(group_id):
+    staging_file = db.begin_group_staging(group_id, 'raptor')
+    staging_file_list = []
+    thread = threading.Thread(target=lambda: staging_file_list.append(db.get_staging_file()))
+    thread.start()
+    thread.join()
+
+    assert db.get_staging_file() == staging_file
+    assert staging_file_list == [None]
+    db.discard_group_staging(staging_file)
+
+
+def crash_while_staging(group_id, chunk_id_list, summary_text, complete):
+    # staged rows of a run that stopped before (or, complete=True, during) its commit
+    staging_file = db.begin_group_staging(group_id, 'raptor')
+    summary_id_list = db.save_new_summaries([(summary_text, chunk_id_list)], True, True, group_id)
+    if complete:
+        with open(staging_file, 'a') as f:
+            f.write(json.dumps({'complete': True}) + '\n')
+    db.reset_staging_file(staging_file)
+    return staging_file, summary_id_list
+
+
+def test_recover_discards_unfinished_run(group_id):
+    chunk_id_list = save_chunks(group_id)
+    staging_file, _ = crash_while_staging(group_id, chunk_id_list, 'summary', complete=False)
+
+    db.recover_staging()
+
+    assert not os.path.isfile(staging_file)
+    assert get_ids(db.COLLECTION_SUMMARY) == []
+
+
+def test_recover_finishes_started_commit(group_id):
+    chunk_id_list = save_chunks(group_id)
+    staging_file, summary_id_list = crash_while_staging(group_id, chunk_id_list, 'summary', complete=True)
+
+    db.recover_staging()
+
+    assert not os.path.isfile(staging_file)
+    assert get_ids(db.COLLECTION_SUMMARY) == summary_id_list
+    assert os.listdir(db.get_staging_dir()) == []
@@ -0,0 +1,107 @@
+import asyncio
+import random
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('aiolimiter')
+pytest.importorskip('tiktoken')
+
+import graphrag.my_graphrag.cloud as cloud
+from graphrag.llm.openai import OpenAIConfiguration
+
+
+async def iter_pieces(pieces):
+    for piece in pieces:
+        yield piece
+
+
+def get_answer_pieces(pieces, in_think=False):
+    async def collect():
+        return [piece async for piece in cloud.iter_answer(iter_pieces(pieces), in_think)]
+    return asyncio.run(collect())
+
+
+def split_randomly(text, rng):
+    cuts = sorted(rng.sample(range(1, len(text)), min(len(text) - 1, rng.randint(0, 8))))
+    return [text[i:j] for i, j in zip([0] + cuts, cuts + [len(text)])]
+
+
+def stream_chunk(content=None, reasoning_content=None, usage=None):
+    choices = [] if content is None and reasoning_content is None else [
+        SimpleNamespace(delta=SimpleNamespace(content=content, reasoning_content=reasoning_content))
+    ]
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+def test_think_block_split_over_pieces_is_dropped():
+    pieces = ['<th', 'ink>let me', ' think</th', 'ink>\n', '\n', ' The', ' answer']
+
+    assert get_answer_pieces(pieces) == ['The', ' answer']
+
+
+def test_answer_without_think_block_is_passed_on():
+    assert get_answer_pieces(['  Hello', ' world']) == ['Hello', ' world']
+    assert get_answer_pieces(['<', 'b>bold</b>']) == ['<b>bold</b>']
+
+
+def test_reasoning_model_output_starts_inside_the_think_block():
+    assert get_answer_pieces(['reasoning', '</think>', 'answer'], in_think=True) == ['answer']
+
+
+def test_unclosed_think_block_is_kept_like_clean_response():
+    assert get_answer_pieces(['<think>never', ' closed ']) == ['<think>never closed']
+    assert get_answer_pieces([]) == []
+
+
+@pytest.mark.parametrize('text', [
+    '<think>a < b</think>\n\nThe answer',
+    '\n<think>\nthinking\n</think>answer with </thinking> text',
+    'plain answer',
+    '<think>only thinking</think>',
+    '<thinking>not a think block</thinking> answer',
+])
+def test_answer_pieces_join_to_clean_response(text):
+    rng = random.Random(text)
+    for _ in range(50):
+        assert ''.join(get_answer_pieces(split_randomly(text, rng))) == cloud.clean_response(text)
+
+
+def test_reasoning_model_setting(monkeypatch):
+    monkeypatch.setattr(cloud, '_LLM_CONFIG', OpenAIConfiguration({'reasoning_model': True}))
+    monkeypatch.setattr(cloud, 'LLM_REASONING', '')
+    assert cloud.is_reasoning_model()
+
+    # RG_RAG_LLM_REASONING overrides settings.yaml
+    monkeypatch.setattr(cloud, 'LLM_REASONING', '0')
+    assert not cloud.is_reasoning_model()
+    monkeypatch.setattr(cloud, '_LLM_CONFIG', OpenAIConfiguration({}))
+    monkeypatch.setattr(cloud, 'LLM_REASONING', '1')
+    assert cloud.is_reasoning_model()
+
+
+def test_stream_response_passes_the_answer_on(monkeypatch):
+    monkeypatch.setattr(cloud, '_LLM_CONFIG', OpenAIConfiguration({'tokens_per_minute': 0, 'requests_per_minute': 0}))
+    monkeypatch.setattr(cloud, 'LLM_REASONING', '0')
+    monkeypatch.setattr(cloud.llm_telemetry, 'record', lambda *args, **kwargs: None)
+    chunks = [
+        stream_chunk(reasoning_content='hidden'),
+        stream_chunk('<think>hmm'),
+        stream_chunk('</think>The'),
+        stream_chunk(' answer'),
+        stream_chunk(usage=SimpleNamespace(prompt_tokens=5, completion_tokens=4)),
+    ]
+
+    async def create(**kwargs):
+        assert kwargs['stream']
+        return iter_pieces(chunks)
+
+    monkeypatch.setattr(cloud, 'client', SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+    text_list = []
+
+    answer, stats = cloud.stream_response('prompt', text_list.append, use_cache=False)
+
+    assert text_list == ['The', ' answer']
+    assert answer == 'The answer'
+    assert stats['completion_tokens'] == 4
+    assert 0 < stats['time_to_first_token'] <= stats['time_to_first_answer_token']